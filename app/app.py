@@ -2,11 +2,15 @@ from flask import Flask, render_template, request
 import logging.config
 import yaml
 
-from extensions import api, users_db, cosmetics_db, cors, jwt
+from extensions import api, users_db, cosmetics_db, cors, jwt, image_cache, query_counter
 from namespaces import fetch, user, manage
 from errors_handling import handler
+from commands import db_cli, assets_cli
 from settings import Config
-from utils import validator
+from utils import validator, mojang
+from utils.verification import verifier
+from utils.cleanup import cleaner
+from utils.storage import asset_storage
 
 
 # load logging config
@@ -46,13 +50,21 @@ def create_app():
     # init extensions
     api.init_app(app, title='COSMOSTIC API', description='COSMOSTIC Internal API', version='1.0')
     jwt.init_app(app)
+    image_cache.init_app(app)
+    asset_storage.init_app(app)
+    mojang.init_app(app)
     cors.init_app(app, resources={
-        r"/fetch/*": {"origins": "*", "methods": ["GET"]},
+        r"/fetch/assets": {"origins": "*", "methods": ["POST"]},
+        r"/fetch/*": {"origins": "*", "methods": ["GET"], "expose_headers": ["X-Next-Cursor"]},
+        r"/user/cosmetics": {"origins": "*", "methods": ["POST"]},
         r"/user/*": {"origins": "*", "methods": ["GET"]}
     })
 
-    users_db.connect(db='users', alias='users_db', host=app.config['USERS_DB_URI'], serverSelectionTimeoutMS=app.config['MONGO_TIMEOUT'])
-    cosmetics_db.connect(db='cosmetics', alias='default', host=app.config['COSMETICS_DB_URI'], serverSelectionTimeoutMS=app.config['MONGO_TIMEOUT'])
+    users_db.connect(db='users', alias='users_db', host=app.config['USERS_DB_URI'], serverSelectionTimeoutMS=app.config['MONGO_TIMEOUT'], event_listeners=[query_counter])
+    cosmetics_db.connect(db='cosmetics', alias='default', host=app.config['COSMETICS_DB_URI'], serverSelectionTimeoutMS=app.config['MONGO_TIMEOUT'], event_listeners=[query_counter])
+
+    verifier.init_app(app)   # deferred mojang accounts verification
+    cleaner.init_app(app)   # deleted cosmetics references cleanup
 
     # namespaces registration
     api.add_namespace(fetch)
@@ -60,6 +72,8 @@ def create_app():
     api.add_namespace(manage)
     
     app.register_blueprint(handler)   # error handling blueprint
+    app.cli.add_command(db_cli)   # flask db indexes / check-queries
+    app.cli.add_command(assets_cli)   # flask assets migrate
 
     # documentation endpoint
     @api.documentation
@@ -0,0 +1,478 @@
+from datetime import datetime, timezone
+from flask import current_app, g
+from flask.cli import AppGroup
+from bson import ObjectId
+from concurrent.futures import ProcessPoolExecutor
+from gridfs import GridFS
+from mongoengine import Q
+from mongoengine.connection import get_db
+from pymongo import UpdateOne
+from PIL import Image
+from uuid import uuid4
+import click
+import gzip
+import json
+import os
+import random
+import time
+
+from extensions import image_cache, query_counter
+
+from models.cosmetics import Cape, Accessory, Catalog, Tombstone, CleanupJob
+from models.mojang import MojangLookup
+from models.users import User
+from utils.catalog import bump_catalog_version, commit_catalog_version, record_change
+from utils.commons import canonical_model, content_hash, encode_model, model_hash
+from utils.images import PREVIEW_FORMATS, decode_png, encode_png, optimize_image, optimize_png, preview_variants, variant_kind
+from utils.indexes import explain_query, reconcile_indexes
+from utils.model_codec import pack_model, unpack_model
+from utils.reprocess import render_accessory_preview, reprocess_cosmetic
+from utils.storage import ASSET_KINDS, asset_storage
+
+
+db_cli = AppGroup('db', help="Manage the databases.")
+assets_cli = AppGroup('assets', help="Manage the cosmetic assets.")
+
+DOCUMENTS = (Cape, Accessory, Catalog, Tombstone, CleanupJob, User, MojangLookup)
+
+
+def query_shapes():
+    """
+    Get the query shapes issued by the API, with placeholder values.
+    Whole collection reads (catalog snapshot, atlas) are not listed : they are expected to scan.
+
+    Returns:
+        list: The (name, queryset) of each query shape.
+    """
+    uuid, oid, now = uuid4(), ObjectId(), datetime.now(timezone.utc)
+    unclaimed_job = Q(state__ne='done') & (Q(claimed_until=None) | Q(claimed_until__lt=now))
+    inline_blob = {'$or': [{f'hashes.{kind}': '0' * 64, f'storage.{kind}': 'inline'} for kind in ASSET_KINDS]}
+    unclaimed_user = Q(pending_verification=True) & (Q(verification_claimed_until=None) | Q(verification_claimed_until__lt=now))
+
+    return [
+        # cosmetics
+        ('cape by uuid', Cape.objects(uuid=uuid)),
+        ('capes by uuids', Cape.objects(uuid__in=[uuid])),
+        ('capes by ids', Cape.objects(id__in=[oid])),
+        ('capes list', Cape.objects(id__gt=oid).order_by('id')),
+        ('capes list by author', Cape.objects(author='author', id__gt=oid).order_by('id')),
+        ('capes changes', Cape.objects(version__gt=0)),
+        ('retired cape', Cape.all_objects(id=oid)),
+        ('inline blob in capes', Cape.all_objects(__raw__=inline_blob)),
+        ('accessory by uuid', Accessory.objects(uuid=uuid)),
+        ('accessories by uuids', Accessory.objects(uuid__in=[uuid])),
+        ('accessories by ids', Accessory.objects(id__in=[oid])),
+        ('accessories list', Accessory.objects(id__gt=oid).order_by('id')),
+        ('accessories list by author', Accessory.objects(author='author', id__gt=oid).order_by('id')),
+        ('accessories list by category', Accessory.objects(category='hats', id__gt=oid).order_by('id')),
+        ('accessories list by author and category', Accessory.objects(author='author', category='hats', id__gt=oid).order_by('id')),
+        ('accessories changes', Accessory.objects(version__gt=0)),
+        ('retired accessory', Accessory.all_objects(id=oid)),
+        ('inline blob in accessories', Accessory.all_objects(__raw__=inline_blob)),
+        ('catalog version', Catalog.objects(name='cosmetics')),
+        ('catalog deletions', Tombstone.objects(version__gt=0)),
+        ('cleanup jobs claim', CleanupJob.objects(unclaimed_job).order_by('created_at')),
+        ('cleanup jobs list', CleanupJob.objects().order_by('-created_at')),
+        # users
+        ('user by uuid', User.objects(minecraft_uuid=uuid)),
+        ('users by uuids', User.objects(minecraft_uuid__in=[uuid])),
+        ('users by ids', User.objects(id__in=[oid])),
+        ('users by cape', User.objects(cape=oid)),
+        ('users by accessory', User.objects(accessories=oid)),
+        ('pending users claim', User.objects(unclaimed_user).order_by('created_at')),
+        ('claimed users', User.objects(verification_claim='claim', pending_verification=True)),
+        ('pending users count', User.objects(pending_verification=True)),
+        ('mojang lookup', MojangLookup.objects(key='uuid:username'))
+    ]
+
+
+@db_cli.command('indexes')
+@click.option('--drop', is_flag=True, help="Drop the indexes not declared by the models, and recreate the outdated ones.")
+@click.option('--dry-run', is_flag=True, help="Only show the changes.")
+def indexes(drop:bool, dry_run:bool):
+    """
+    Create or reconcile the indexes of both databases.
+    """
+    changes = 0
+    for document in DOCUMENTS:
+        for action, index in reconcile_indexes(document, drop, dry_run):
+            click.echo(f"{action:<8} {index}")
+            changes += 1
+
+    click.echo(f"{changes} change(s){' (dry run)' if dry_run else ''}")
+
+
+@db_cli.command('check-queries')
+def check_queries():
+    """
+    Explain the API queries and fail if one of them scans a whole collection.
+    Run it after the indexes command.
+    """
+    scans = []
+    for name, queryset in query_shapes():
+        stages = explain_query(queryset)
+        click.echo(f"{name:<40} {' > '.join(reversed(stages))}")   # from the leaf stage
+
+        if 'COLLSCAN' in stages:
+            scans.append(name)
+
+    if scans:
+        raise click.ClickException(f"Collection scans : {', '.join(scans)}")
+
+    click.echo("All queries use an index")
+
+
+@assets_cli.command('migrate')
+@click.argument('target', type=click.Choice(['gridfs', 'local', 'inline']))
+@click.option('--dry-run', is_flag=True, help="Only show the assets to move.")
+def migrate_assets(target:str, dry_run:bool):
+    """
+    Store the assets of all cosmetics (retired ones included) as blobs of a storage backend.
+    Only the assets under ASSETS_INLINE_MAX_BYTES are moved inline.
+    Assets stay available while they are moved : the api can run during the migration.
+    Run the gc command afterwards to delete the blobs left in the previous backend.
+    """
+    moved = 0
+    for document in (Cape, Accessory):
+        for cosmetic in document.all_objects().only('uuid', 'storage', 'hashes', 'inline', *ASSET_KINDS):
+            kinds = [kind for kind in dict.fromkeys((*ASSET_KINDS, *cosmetic.storage)) if asset_storage.exists(cosmetic, kind) and cosmetic.storage.get(kind) != target]
+            if not kinds:
+                continue
+
+            if not dry_run:
+                kinds = asset_storage.store(cosmetic, kinds, target)
+                record_change(cosmetic)   # assets urls changed
+
+            for kind in kinds:
+                click.echo(f"moved    {document._get_collection_name()} {cosmetic.uuid} {kind}")
+            moved += len(kinds)
+
+    click.echo(f"{moved} asset(s) moved to {target}{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('models')
+@click.option('--dry-run', is_flag=True, help="Only show the accessories to update.")
+def store_models(dry_run:bool):
+    """
+    Store the serialized models of the accessories uploaded before the model endpoint served stored bytes.
+    """
+    stored = 0
+    for accessory in Accessory.all_objects(Q(model_json=None) | Q(model_binary=None)).only('uuid', 'model'):
+        if not dry_run:
+            accessory.update(**{f'set__{field}': value for field, value in encode_model(accessory.model).items()})
+
+        click.echo(f"stored   accessories {accessory.uuid} model")
+        stored += 1
+
+    click.echo(f"{stored} model(s) stored{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('previews')
+@click.option('--dry-run', is_flag=True, help="Only show the cosmetics to update.")
+def generate_previews(dry_run:bool):
+    """
+    Generate the missing preview variants : cosmetics uploaded before the variants, or new configured widths.
+    """
+    generated = 0
+    for document, widths in ((Cape, current_app.config['CAPE_PREVIEW_WIDTHS']), (Accessory, current_app.config['ACCESSORY_PREVIEW_WIDTHS'])):
+        base_width = document.preview.size['width']
+        kinds = {variant_kind(width, image_format, base_width) for width in (base_width, *widths) for image_format in PREVIEW_FORMATS} - {'preview'}
+
+        for cosmetic in document.all_objects().only('uuid', 'storage', 'hashes', 'inline', 'preview'):
+            if kinds <= cosmetic.hashes.keys() or not asset_storage.exists(cosmetic, 'preview'):
+                continue
+
+            if not dry_run:
+                variants = preview_variants(decode_png(asset_storage.read(cosmetic, 'preview')), widths)
+                asset_storage.put(cosmetic, {kind: data for kind, data in variants.items() if kind not in cosmetic.hashes})
+                image_cache.invalidate(cosmetic.uuid)   # previews sent instead of the variants
+
+            click.echo(f"generated {document._get_collection_name()} {cosmetic.uuid} previews")
+            generated += 1
+
+    click.echo(f"{generated} cosmetic(s) previews generated{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('render')
+@click.option('--all', 'render_all', is_flag=True, help="Also replace the uploaded previews.")
+@click.option('--dry-run', is_flag=True, help="Only render, without storing the previews.")
+def render_previews(render_all:bool, dry_run:bool):
+    """
+    Render again the accessory previews rendered from the models (after a renderer change), and
+    the missing ones. Run the gc command afterwards to delete the replaced blobs.
+    """
+    rendered = failed = 0
+    start = time.perf_counter()
+    for accessory in Accessory.all_objects().only('uuid', 'model', 'storage', 'hashes', 'inline', 'texture', 'preview', 'preview_rendered'):
+        if not (render_all or accessory.preview_rendered or not asset_storage.exists(accessory, 'preview')):
+            continue
+
+        image = render_accessory_preview(accessory.model, asset_storage.read(accessory, 'texture'))
+        if not image:
+            click.echo(f"failed   accessories {accessory.uuid} (no box to render)")
+            failed += 1
+            continue
+
+        if not dry_run:
+            asset_storage.put(accessory, {'preview': optimize_image(image), **preview_variants(image, current_app.config['ACCESSORY_PREVIEW_WIDTHS'])})
+            accessory.update(set__preview_rendered=True)
+            record_change(accessory)   # preview url changed
+            image_cache.invalidate(accessory.uuid)
+
+        click.echo(f"rendered accessories {accessory.uuid}")
+        rendered += 1
+
+    click.echo(f"{rendered} preview(s) rendered, {failed} failed in {time.perf_counter() - start:.1f}s{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('reprocess')
+@click.option('--workers', type=int, default=os.cpu_count(), show_default='cpu count', help="Number of worker processes.")
+@click.option('--batch-size', type=int, default=100, show_default=True, help="Cosmetics read, processed and written at once.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default='reprocess-checkpoint.json', show_default=True, help="File recording the last written cosmetic of each collection.")
+@click.option('--restart', is_flag=True, help="Ignore the checkpoint of an interrupted run.")
+@click.option('--dry-run', is_flag=True, help="Only report the assets that would change.")
+def reprocess_assets(workers:int, batch_size:int, checkpoint:str, restart:bool, dry_run:bool):
+    """
+    Create again the derived assets of all cosmetics (retired ones included) from their sources, after
+    the image rules changed : optimized textures, previews and their variants, rendered accessory
+    previews and serialized models. The image work is spread over worker processes, and each batch is
+    written with one bulk write and one catalog version. An interrupted run resumes from its checkpoint.
+    Assets still in the image fields, and cosmetics updated while they were processed, are skipped
+    (run the migrate command first). Run the gc command afterwards to delete the replaced blobs.
+    """
+    progress = {}
+    if not restart and os.path.isfile(checkpoint):
+        with open(checkpoint) as file:
+            progress = json.load(file)
+        click.echo(f"resuming from {checkpoint}")
+
+    processed = changed = skipped = failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for document, cosmetic_type, widths in ((Cape, 'cape', current_app.config['CAPE_PREVIEW_WIDTHS']), (Accessory, 'accessory', current_app.config['ACCESSORY_PREVIEW_WIDTHS'])):
+            collection = document._get_collection_name()
+            fields = ['uuid', 'storage', 'hashes', 'inline']
+            if document is Accessory:
+                fields += ['model', 'model_json', 'model_gzip', 'model_binary', 'preview_rendered']
+
+            # batches read by id ranges : no cursor is kept open while the workers run
+            query = {'id__gt': ObjectId(progress[collection])} if progress.get(collection) else {}
+            total, done = document.all_objects(**query).count(), 0
+            while True:
+                batch = list(document.all_objects(**query).order_by('id').only(*fields).limit(batch_size))
+                if not batch:
+                    break
+
+                jobs = []
+                for cosmetic in batch:
+                    if any(kind in cosmetic.hashes and kind not in cosmetic.storage for kind in ASSET_KINDS):
+                        click.echo(f"skipped  {collection} {cosmetic.uuid} (assets in the image fields)")
+                        skipped += 1
+                        continue
+
+                    rendered = cosmetic_type == 'accessory' and cosmetic.preview_rendered
+                    jobs.append({
+                        'type': cosmetic_type,
+                        'id': cosmetic.id,
+                        'hashes': dict(cosmetic.hashes),
+                        'texture': asset_storage.read(cosmetic, 'texture'),
+                        'preview': None if rendered else asset_storage.read(cosmetic, 'preview'),
+                        'model': getattr(cosmetic, 'model', None),
+                        'model_stored': cosmetic_type == 'accessory' and bool(cosmetic.model_json) and cosmetic.model_binary is not None,
+                        'widths': widths
+                    })
+
+                updates, written = [], []
+                now = datetime.now(timezone.utc)
+                cosmetics = {cosmetic.id: cosmetic for cosmetic in batch}
+                for job, result in zip(jobs, executor.map(reprocess_cosmetic, jobs)):
+                    cosmetic = cosmetics[job['id']]
+                    if result['error']:
+                        click.echo(f"failed   {collection} {cosmetic.uuid} ({result['error']})")
+                        failed += 1
+                        continue
+                    if not result['assets'] and not result['model']:
+                        continue
+
+                    if dry_run:
+                        kinds = [*result['assets'], *(['model'] if result['model'] else [])]
+                        click.echo(f"changed  {collection} {cosmetic.uuid} {', '.join(kinds)}")
+                        changed += 1
+                        continue
+
+                    update = {}
+                    for kind, data in result['assets'].items():
+                        asset_storage.stage(cosmetic, kind, data, asset_storage.target(data), update)
+                    if result['model']:
+                        update.setdefault('$set', {}).update({**result['model'], 'hashes.model': model_hash(job['model'])})
+                    if cosmetic_type == 'accessory' and job['preview'] is None and 'preview' in result['assets']:
+                        update['$set']['preview_rendered'] = True
+
+                    # not applied if the sources were uploaded again since they were read (none stands for missing)
+                    sources = {f'hashes.{kind}': job['hashes'].get(kind) for kind in (*ASSET_KINDS, 'model')}
+                    updates.append(({'_id': cosmetic.id, **sources}, update))
+                    written.append(cosmetic)
+
+                if updates:
+                    version = bump_catalog_version()   # one catalog version per batch, published once written
+                    for _, update in updates:
+                        update['$set'].update({'version': version, 'updated_at': now})
+                    matched = document._get_collection().bulk_write([UpdateOne(query, update) for query, update in updates], ordered=False).matched_count
+                    changed += matched
+                    skipped += len(updates) - matched
+
+                    ids = [query['_id'] for query, _ in updates]
+                    commit_catalog_version(version, lambda version: document.all_objects(id__in=ids).update(set__version=version))
+                for cosmetic in written:
+                    image_cache.invalidate(cosmetic.uuid)
+
+                processed += len(batch)
+                done += len(batch)
+                query = {'id__gt': batch[-1].id}
+                progress[collection] = str(batch[-1].id)
+                if not dry_run:
+                    with open(checkpoint, 'w') as file:
+                        json.dump(progress, file)
+
+                click.echo(f"{collection:<12} {done}/{total} processed, {changed} changed, {skipped} skipped, {failed} failed ({processed / (time.perf_counter() - start):.1f}/s)")
+
+    if not dry_run and os.path.isfile(checkpoint):
+        os.remove(checkpoint)   # finished : the next run starts over
+
+    click.echo(f"{processed} cosmetic(s) processed, {changed} changed, {skipped} skipped, {failed} failed in {time.perf_counter() - start:.1f}s{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('optimize')
+@click.option('--dry-run', is_flag=True, help="Only report the bytes that would be saved.")
+def optimize_assets(dry_run:bool):
+    """
+    Losslessly re-optimize the PNG blobs of all cosmetics and report the bytes saved.
+    Assets still in the image fields are skipped : run the migrate command first.
+    Run the gc command afterwards to delete the replaced blobs.
+    """
+    before = after = 0
+    for document in (Cape, Accessory):
+        for cosmetic in document.all_objects().only('uuid', 'storage', 'hashes', 'inline'):
+            optimized = {}
+            for kind in cosmetic.storage:
+                if kind.endswith('_webp'):
+                    continue
+
+                data = asset_storage.read(cosmetic, kind)
+                if data is None:
+                    continue
+
+                output = optimize_png(data)
+                before += len(data)
+                after += min(len(output), len(data))
+                if len(output) < len(data):
+                    optimized[kind] = output
+                    click.echo(f"optimized {document._get_collection_name()} {cosmetic.uuid} {kind} {len(data)} > {len(output)} bytes")
+
+            if optimized and not dry_run:
+                asset_storage.put(cosmetic, optimized)
+                record_change(cosmetic)   # assets urls changed
+                image_cache.invalidate(cosmetic.uuid)
+
+    saved = before - after
+    click.echo(f"{saved} bytes saved on {before} ({saved * 100 / before if before else 0:.1f}%){' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('gc')
+@click.option('--grace', type=int, default=3600, show_default=True, help="Seconds during which new blobs are kept.")
+@click.option('--dry-run', is_flag=True, help="Only show the unused blobs.")
+def collect_blobs(grace:int, dry_run:bool):
+    """
+    Delete the blobs no longer used by any cosmetic (updated, deleted or moved assets).
+    """
+    referenced = set()
+    for document in (Cape, Accessory):
+        for cosmetic in document.all_objects().only('storage', 'hashes').as_pymongo():
+            hashes = cosmetic.get('hashes', {})
+            referenced.update((backend, hashes[kind]) for kind, backend in cosmetic.get('storage', {}).items() if kind in hashes)
+
+    deleted = asset_storage.collect(referenced, grace, dry_run)
+    for backend, blob_hash in deleted:
+        click.echo(f"deleted  {backend} {blob_hash}")
+
+    click.echo(f"{len(deleted)} unused blob(s) deleted{' (dry run)' if dry_run else ''}")
+
+
+@assets_cli.command('benchmark')
+@click.option('--samples', type=int, default=200, show_default=True, help="Number of fetches per storage mode.")
+def benchmark_assets(samples:int):
+    """
+    Compare fetching a cosmetic with its texture from GridFS and inline.
+    Runs on scratch collections (dropped afterwards) filled with the existing cape textures.
+    """
+    assets = [data for cape in Cape.objects().only('storage', 'hashes', 'inline', 'texture').limit(samples) if (data := asset_storage.read(cape, 'texture'))]
+    if not assets:   # empty catalog : random textures
+        assets = [encode_png(Image.frombytes('RGBA', (46, 22), os.urandom(46 * 22 * 4))) for _ in range(samples)]
+
+    db = get_db('default')
+    documents, fs = db['benchmark_cosmetics'], GridFS(db, collection='benchmark_blobs')
+    try:
+        for i, data in enumerate(assets):
+            blob_hash = content_hash(data)
+            if not fs.exists(blob_hash):
+                fs.put(data, _id=blob_hash)
+            documents.insert_many([
+                {'_id': f'gridfs-{i}', 'hashes': {'texture': blob_hash}, 'storage': {'texture': 'gridfs'}},
+                {'_id': f'inline-{i}', 'hashes': {'texture': blob_hash}, 'storage': {'texture': 'inline'}, 'inline': {'texture': data}}
+            ])
+
+        def gridfs_fetch(i):
+            cosmetic = documents.find_one({'_id': f'gridfs-{i}'})
+            return fs.get(cosmetic['hashes']['texture']).read()
+
+        def inline_fetch(i):
+            return documents.find_one({'_id': f'inline-{i}'})['inline']['texture']
+
+        click.echo(f"{len(assets)} fetches, {sum(map(len, assets)) // len(assets)} bytes per texture on average")
+        click.echo(f"{'mode':<8} {'queries':>8} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for mode, fetch in (('gridfs', gridfs_fetch), ('inline', inline_fetch)):
+            g.query_count = 0
+            durations = []
+            for i in range(len(assets)):
+                start = time.perf_counter()
+                fetch(i)
+                durations.append((time.perf_counter() - start) * 1000)
+
+            durations.sort()
+            click.echo(f"{mode:<8} {query_counter.count() / len(assets):>8.1f} {sum(durations) / len(durations):>8.3f} {durations[len(durations) // 2]:>8.3f} {durations[int(len(durations) * 0.95)]:>8.3f}")
+    finally:
+        documents.drop()
+        db.drop_collection('benchmark_blobs.files')
+        db.drop_collection('benchmark_blobs.chunks')
+
+
+@assets_cli.command('benchmark-models')
+@click.option('--samples', type=int, default=200, show_default=True, help="Number of decodes per encoding.")
+def benchmark_models(samples:int):
+    """
+    Compare the size and decode time of the accessory models in JSON and in compact binary form.
+    Uses the existing accessory models, or random cube models if there is none.
+    """
+    models = list(Accessory.objects().limit(samples).scalar('model'))
+    if not models:   # empty catalog : random models of 200 cubes
+        def cube():
+            return {'origin': [random.randint(-16, 16) for _ in range(3)], 'size': [random.randint(1, 8) for _ in range(3)], 'uv': [random.randint(0, 64) for _ in range(2)], 'inflate': random.choice([0, 0.25, 0.5])}
+
+        models = [{'type': 'bedrock', 'textureSize': [64, 64], 'models': [{'name': 'body', 'pivot': [0, 24.5, 0], 'cubes': [cube() for _ in range(200)]}]} for _ in range(samples)]
+
+    encoded = {'json': [canonical_model(model) for model in models], 'binary': [pack_model(model) for model in models]}
+    decoders = {'json': json.loads, 'binary': unpack_model}
+
+    click.echo(f"{len(models)} models")
+    click.echo(f"{'encoding':<8} {'bytes':>8} {'gzip':>8} {'mean ms':>8} {'p95 ms':>8}")
+    for encoding, decode in decoders.items():
+        durations = []
+        for data in encoded[encoding]:
+            start = time.perf_counter()
+            decode(data)
+            durations.append((time.perf_counter() - start) * 1000)
+
+        durations.sort()
+        size = sum(map(len, encoded[encoding])) // len(models)
+        compressed = sum(len(gzip.compress(data, compresslevel=9)) for data in encoded[encoding]) // len(models)
+        click.echo(f"{encoding:<8} {size:>8} {compressed:>8} {sum(durations) / len(durations):>8.3f} {durations[int(len(durations) * 0.95)]:>8.3f}")
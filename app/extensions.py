@@ -3,10 +3,15 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 import mongoengine
 
+from utils.cache import ImageCache
+from utils.profiling import QueryCounter
+
 
 api = Api()
 cors = CORS()
 jwt = JWTManager()
+image_cache = ImageCache()
+query_counter = QueryCounter()
 # Dbs
 users_db = mongoengine
 cosmetics_db = mongoengine
\ No newline at end of file
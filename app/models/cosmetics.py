@@ -1,3 +1,4 @@
+from datetime import datetime, timezone
 from uuid import uuid4
 
 from extensions import cosmetics_db
@@ -9,18 +10,93 @@ class Cape(cosmetics_db.Document):
     uuid = cosmetics_db.UUIDField(binary=False, default=lambda:uuid4(), unique=True)
     name = cosmetics_db.StringField(min_length=2, max_length=16, required=True, unique=True)
     author = cosmetics_db.StringField(min_length=2, max_length=16, required=True)
-    texture = cosmetics_db.ImageField(required=True, size=(46, 22, True))
-    preview = cosmetics_db.ImageField(required=True, size=(10, 16, True))
+    texture = cosmetics_db.ImageField(required=False, size=(46, 22, True))
+    preview = cosmetics_db.ImageField(required=False, size=(10, 16, True))
+    storage = cosmetics_db.DictField()   # backend of the assets not stored in the image fields (see utils.storage)
+    inline = cosmetics_db.MapField(cosmetics_db.BinaryField())   # small assets stored in the document
+    hashes = cosmetics_db.DictField()   # assets content hashes (sha256), used as etags
+    version = cosmetics_db.IntField(default=0)   # catalog version of the last change
+    updated_at = cosmetics_db.DateTimeField()
+    retired = cosmetics_db.BooleanField(default=False)   # deleted, references being cleaned up
+
+    @cosmetics_db.queryset_manager
+    def objects(doc_cls, queryset):
+        return queryset.filter(retired__ne=True)
+
+    @cosmetics_db.queryset_manager
+    def all_objects(doc_cls, queryset):
+        return queryset
 
-    meta = {'db_alias': 'default', 'collection': 'capes'}
+    meta = {
+        'db_alias': 'default',
+        'collection': 'capes',
+        'indexes': [
+            ('author', 'id'),   # listing filters, paginated on id
+            'version',   # catalog changes
+            'hashes.texture', 'hashes.preview'   # inline blobs
+        ]
+    }
 
 class Accessory(cosmetics_db.Document):
     uuid = cosmetics_db.UUIDField(binary=False, default=lambda:uuid4(), unique=True)
     name = cosmetics_db.StringField(min_length=2, max_length=16, required=True, unique=True)
     author = cosmetics_db.StringField(min_length=2, max_length=16, required=True)
     model = cosmetics_db.DictField(required=True)
+    model_json = cosmetics_db.BinaryField()   # canonical model serialization, served as is
+    model_gzip = cosmetics_db.BinaryField()   # gzip compressed model_json
+    model_binary = cosmetics_db.BinaryField()   # compact binary model (see utils.model_codec)
     texture = cosmetics_db.ImageField(required=False, size=(46, 22, True))
     category = cosmetics_db.StringField(required=True, default=None, choices=CATEGORIES)
-    preview = cosmetics_db.ImageField(required=True, size=(150, 150, True))
+    preview = cosmetics_db.ImageField(required=False, size=(150, 150, True))
+    preview_rendered = cosmetics_db.BooleanField(default=False)   # preview rendered from the model, re-rendered on changes
+    storage = cosmetics_db.DictField()   # backend of the assets not stored in the image fields (see utils.storage)
+    inline = cosmetics_db.MapField(cosmetics_db.BinaryField())   # small assets stored in the document
+    hashes = cosmetics_db.DictField()   # assets content hashes (sha256), used as etags
+    version = cosmetics_db.IntField(default=0)   # catalog version of the last change
+    updated_at = cosmetics_db.DateTimeField()
+    retired = cosmetics_db.BooleanField(default=False)   # deleted, references being cleaned up
+
+    @cosmetics_db.queryset_manager
+    def objects(doc_cls, queryset):
+        return queryset.filter(retired__ne=True)
+
+    @cosmetics_db.queryset_manager
+    def all_objects(doc_cls, queryset):
+        return queryset
+
+    meta = {
+        'db_alias': 'default',
+        'collection': 'accessories',
+        'indexes': [
+            ('author', 'id'), ('category', 'id'),   # listing filters, paginated on id
+            'version',   # catalog changes
+            'hashes.texture', 'hashes.preview'   # inline blobs
+        ]
+    }
+
+class Catalog(cosmetics_db.Document):
+    name = cosmetics_db.StringField(primary_key=True)
+    version = cosmetics_db.IntField(default=0)   # bumped on every cosmetic mutation
+    committed = cosmetics_db.IntField()   # published version : the changes of all versions up to it are written
+
+    meta = {'db_alias': 'default', 'collection': 'catalog'}
+
+class Tombstone(cosmetics_db.Document):
+    type = cosmetics_db.StringField(required=True, choices=('cape', 'accessory'))
+    uuid = cosmetics_db.UUIDField(binary=False, required=True)
+    version = cosmetics_db.IntField(required=True)   # catalog version of the deletion
+    deleted_at = cosmetics_db.DateTimeField(default=lambda:datetime.now(timezone.utc))
+
+    meta = {'db_alias': 'default', 'collection': 'tombstones', 'indexes': ['version']}
+
+class CleanupJob(cosmetics_db.Document):
+    type = cosmetics_db.StringField(required=True, choices=('cape', 'accessory'))
+    cosmetic = cosmetics_db.ObjectIdField(required=True)   # retired cosmetic id
+    uuid = cosmetics_db.UUIDField(binary=False, required=True)
+    state = cosmetics_db.StringField(default='pending', choices=('pending', 'running', 'done'))
+    processed = cosmetics_db.IntField(default=0)   # users cleaned up
+    created_at = cosmetics_db.DateTimeField(default=lambda:datetime.now(timezone.utc))
+    updated_at = cosmetics_db.DateTimeField()
+    claimed_until = cosmetics_db.DateTimeField()   # worker running the job
 
-    meta = {'db_alias': 'default', 'collection': 'accessories'}
\ No newline at end of file
+    meta = {'db_alias': 'default', 'collection': 'cleanup_jobs', 'indexes': [('state', 'created_at'), 'created_at']}
\ No newline at end of file
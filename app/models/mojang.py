@@ -0,0 +1,13 @@
+from extensions import users_db
+
+
+class MojangLookup(users_db.Document):
+    key = users_db.StringField(primary_key=True)   # lookup type and argument
+    value = users_db.DynamicField()   # None for not found lookups
+    expires_at = users_db.DateTimeField(required=True)
+
+    meta = {
+        'db_alias': 'users_db',
+        'collection': 'mojang_lookups',
+        'indexes': [{'fields': ['expires_at'], 'expireAfterSeconds': 0}]   # expired lookups are removed by mongodb
+    }
@@ -1,3 +1,5 @@
+from datetime import datetime, timezone
+
 from extensions import users_db
 from .cosmetics import Cape, Accessory
 
@@ -7,4 +9,17 @@ class User(users_db.Document):
     cape = users_db.ReferenceField(Cape, reverse_delete_rule=users_db.CASCADE, required=False)
     accessories = users_db.ListField(users_db.ReferenceField(Accessory, reverse_delete_rule=users_db.CASCADE, required=False))
 
-    meta = {'db_alias': 'users_db', 'collection': 'users'}
\ No newline at end of file
+    created_at = users_db.DateTimeField(default=lambda:datetime.now(timezone.utc))
+    # deferred mojang account verification
+    pending_verification = users_db.BooleanField(default=False)
+    verification_claim = users_db.StringField()   # verifier currently checking the account
+    verification_claimed_until = users_db.DateTimeField()
+
+    meta = {
+        'db_alias': 'users_db',
+        'collection': 'users',
+        'indexes': [
+            'cape', 'accessories',   # retired cosmetics references cleanup
+            {'fields': ['pending_verification', 'created_at'], 'partialFilterExpression': {'pending_verification': True}}   # verification queue
+        ]
+    }
\ No newline at end of file
@@ -1,31 +1,296 @@
-from flask import send_file, url_for, make_response
+from flask import Response, current_app, request, make_response, stream_with_context
 from flask_restx import Resource, Namespace
-from io import BytesIO
 
+from extensions import image_cache
 from models.cosmetics import Cape, Accessory
-from utils.commons import create_response
+from parsers import assets_parser, atlas_parser, catalog_changes_parser, list_capes_parser, list_accessories_parser, preview_parser
+from utils.assets import BUNDLE_MIMETYPE, iter_assets, pack_asset
+from utils.atlas import atlas_cache
+from utils.catalog import catalog_snapshot, get_catalog_changes
+from utils.commons import canonical_model, content_hash, create_cursor, create_response, create_file_response, is_not_modified, set_cache_headers
+from utils import validator
 from utils.decorators import check_uuid
+from utils.images import PREVIEW_FORMATS, variant_kind
+from utils.model_codec import MODEL_MIMETYPE
+from utils.storage import asset_storage
 
 
 fetch = Namespace("fetch", description="Fetch cosmetics resources", path="/fetch")
 
 
-@fetch.route('/capes', doc={
+def list_response(queryset, limit:int=None, after=None):
+    """
+    Creates a paginated response listing the uuids of a cosmetics queryset.
+
+    Only the uuids are fetched from db, in id order. When more documents remain, the cursor
+    of the next page is sent in the X-Next-Cursor header.
+
+    Parameters:
+        queryset (QuerySet): The filtered cosmetics queryset.
+        limit (int, optional): The max number of uuids. Defaults to LIST_PAGE_SIZE.
+        after (ObjectId, optional): The id of the last document of the previous page.
+
+    Returns:
+        Response: The list response.
+    """
+    limit = max(1, min(limit or current_app.config['LIST_PAGE_SIZE'], current_app.config['LIST_MAX_PAGE_SIZE']))
+
+    if after:
+        queryset = queryset.filter(id__gt=after)
+
+    documents = list(queryset.order_by('id').only('uuid').limit(limit + 1).as_pymongo())   # one more to know if there is a next page
+
+    response = create_response(200, data=[document['uuid'] for document in documents[:limit]])
+    if len(documents) > limit:
+        response.headers['X-Next-Cursor'] = create_cursor(documents[limit - 1]['_id'])
+
+    return response
+
+def cached_image_response(uuid, kind:str, mimetype:str='image/png'):
+    """
+    Creates an image response from the image cache, or from the cached blob of the image.
+
+    Parameters:
+        uuid (UUID): The cosmetic uuid.
+        kind (str): The image kind (texture, preview or preview variant).
+        mimetype (str, optional): The image mimetype. Defaults to 'image/png'.
+
+    Returns:
+        Response: The image response.
+        None: If the image is not cached.
+    """
+    download_name = f"{uuid}.{mimetype.split('/')[1]}"
+
+    blob = image_cache.get_blob(uuid, kind)
+    if blob:
+        backend, blob_hash = blob
+        return asset_storage.backends[backend].response(blob_hash, download_name, mimetype=mimetype)
+
+    cached = image_cache.get(uuid, kind)
+    if not cached:
+        return None
+
+    data, etag = cached
+    return create_file_response(lambda: data, etag, download_name, mimetype)
+
+def image_response(cosmetic, kind:str, mimetype:str='image/png'):
+    """
+    Creates an image response from a cosmetic document. Blobs are sent by their storage backend
+    and cached by hash, inline images and images not yet stored as blobs are cached once read.
+
+    Parameters:
+        cosmetic (Cape | Accessory): The cosmetic document.
+        kind (str): The image kind (texture, preview or preview variant).
+        mimetype (str, optional): The image mimetype. Defaults to 'image/png'.
+
+    Returns:
+        Response: The image response.
+    """
+    etag = cosmetic.hashes.get(kind)
+    download_name = f"{cosmetic.uuid}.{mimetype.split('/')[1]}"
+
+    backend = asset_storage.backend(cosmetic, kind)
+    if backend and backend.name != 'inline':   # inline assets were read with the cosmetic
+        image_cache.set_blob(cosmetic.uuid, kind, backend.name, etag)
+        return backend.response(etag, download_name, mimetype=mimetype)
+
+    def read():
+        data = asset_storage.read(cosmetic, kind)
+        if data is not None:
+            image_cache.set(cosmetic.uuid, kind, data, etag or content_hash(data))
+        return data
+
+    return create_file_response(read, etag, download_name, mimetype)
+
+def preview_variant(document, size:int=None):
+    """
+    Selects the preview variant to send : the smallest one at least as wide as the rendered size
+    (else the widest), in WebP if the client explicitly accepts it.
+
+    Parameters:
+        document (type): The cosmetic document class (Cape, Accessory).
+        size (int, optional): The rendered width. Defaults to the uploaded preview width.
+
+    Returns:
+        tuple: The asset kind and mimetype of the variant.
+    """
+    base_width = document.preview.size['width']
+    widths = sorted({base_width, *current_app.config['CAPE_PREVIEW_WIDTHS' if document is Cape else 'ACCESSORY_PREVIEW_WIDTHS']})
+    width = next((width for width in widths if width >= size), widths[-1]) if size else base_width
+
+    webp = 'webp' in PREVIEW_FORMATS and any(mimetype == 'image/webp' and quality for mimetype, quality in request.accept_mimetypes)
+    image_format = 'webp' if webp else 'png'
+
+    return variant_kind(width, image_format, base_width), PREVIEW_FORMATS[image_format]
+
+def preview_response(document, uuid):
+    """
+    Creates the response of the preview variant negotiated from the size parameter and the Accept header.
+    Cosmetics uploaded before the variants were generated get their preview.
+
+    Parameters:
+        document (type): The cosmetic document class (Cape, Accessory).
+        uuid (str): The cosmetic uuid.
+
+    Returns:
+        Response: The image response.
+    """
+    args = preview_parser.parse_args()
+    kind, mimetype = preview_variant(document, args.size)
+
+    response = cached_image_response(uuid, kind, mimetype) or cached_image_response(uuid, f'{kind}_fallback')
+    if not response:
+        cosmetic = document.objects(uuid=uuid).only('uuid', 'hashes', 'storage', 'inline', 'preview').first()
+        if not cosmetic:
+            return create_response(404, f"{document.__name__} not found")
+
+        if kind in cosmetic.hashes:
+            response = image_response(cosmetic, kind, mimetype)
+        else:   # variant not generated : the preview is sent, and cached for this variant
+            data = asset_storage.read(cosmetic, 'preview')
+            if data is None:
+                return create_response(404, "File not found")
+            etag = cosmetic.hashes.get('preview') or content_hash(data)
+            image_cache.set(cosmetic.uuid, f'{kind}_fallback', data, etag)
+            response = create_file_response(lambda: data, etag, f"{cosmetic.uuid}.png")
+
+    response.vary.add('Accept')
+    return response
+
+
+@fetch.route('/catalog', doc={
+    'responses': {200: 'Success', 304: 'Not modified'}
+})
+class CatalogInformations(Resource):
+    def get(self):
+        """
+        Fetch all capes and accessories informations
+        """
+        data, etag = catalog_snapshot.get()
+
+        return create_file_response(lambda: data, etag, "catalog.json", mimetype='application/json')
+
+
+@fetch.route('/catalog/changes', doc={
+    'responses': {200: 'Success', 400: 'Invalid catalog version'}
+})
+class CatalogChanges(Resource):
+    @fetch.expect(catalog_changes_parser)
+    def get(self):
+        """
+        Fetch capes and accessories changed since a catalog version
+        """
+        # get args
+        args = catalog_changes_parser.parse_args()
+
+        response = get_catalog_changes(args.since)
+
+        return create_response(200, data=response)
+
+
+@fetch.route('/assets', doc={
+    'responses': {200: 'Success', 413: 'Too many assets'}
+})
+class AssetsBundle(Resource):
+    @fetch.expect(assets_parser)
+    def post(self):
+        """
+        Fetch many textures and previews in one response
+
+        Assets are streamed as length-prefixed parts : cosmetic uuid (16 bytes), asset kind (1 byte,
+        0 texture / 1 preview), sha256 content hash (32 bytes), content length (4 bytes big endian uint)
+        then the content. Unknown cosmetics and missing assets are skipped.
+        """
+        # get args
+        args = assets_parser.parse_args()
+
+        assets = list(dict.fromkeys(args.assets))   # remove duplicates, keep order
+        if len(assets) > current_app.config['ASSETS_BATCH_LIMIT']:
+            return create_response(413, f"Too many assets (max {current_app.config['ASSETS_BATCH_LIMIT']})")
+
+        parts = (pack_asset(*asset) for asset in iter_assets(assets))
+
+        return Response(stream_with_context(parts), mimetype=BUNDLE_MIMETYPE)
+
+
+@fetch.route('/atlas', doc={
+    'responses': {200: 'Success', 304: 'Not modified'}
+})
+class Atlas(Resource):
+    @fetch.expect(atlas_parser)
+    def get(self):
+        """
+        Fetch capes and accessories previews sprite sheet
+        """
+        # get args
+        args = atlas_parser.parse_args()
+
+        data, etag, _ = atlas_cache.get(args.textures)
+
+        return create_file_response(lambda: data, etag, "atlas.png")
+
+
+@fetch.route('/atlas/map', doc={
     'responses': {200: 'Success'}
 })
+class AtlasMap(Resource):
+    @fetch.expect(atlas_parser)
+    def get(self):
+        """
+        Fetch position (x, y, w, h) of each preview in the sprite sheet
+        """
+        # get args
+        args = atlas_parser.parse_args()
+
+        _, _, atlas_map = atlas_cache.get(args.textures)
+
+        return create_response(200, data=atlas_map)
+
+
+@fetch.route('/blob/<string:blob_hash>', doc={
+    'responses': {
+        200: 'Success',
+        304: 'Not modified',
+        400: 'Invalid hash',
+        404: 'Blob not found'
+    }
+})
+class Blob(Resource):
+    def get(self, blob_hash:str):
+        """
+        Fetch an asset by its content hash (sha256), cacheable forever
+        """
+        try:
+            blob_hash = validator.sha256(blob_hash)
+        except ValueError:
+            return create_response(400, "Invalid hash")
+
+        if is_not_modified(blob_hash):   # a blob never changes
+            return set_cache_headers(make_response('', 304), blob_hash, immutable=True)
+
+        backend = asset_storage.find(blob_hash)
+        if not backend:
+            return create_response(404, "Blob not found")
+
+        return backend.response(blob_hash, immutable=True)   # sent with the blob image type
+
+
+@fetch.route('/capes', doc={
+    'responses': {200: 'Success', 400: 'Invalid parameters'}
+})
 class ListCapes(Resource):
+    @fetch.expect(list_capes_parser)
     def get(self):
         """
-        List all capes
+        List capes
         """
+        # get args
+        args = list_capes_parser.parse_args()
+
         # get cape list
-        capes = Cape.objects()
-        
-        response = []
-        for cape in capes:
-            response.append(cape.uuid)
-        
-        return create_response(200, data=response)
+        capes = Cape.objects(author=args.author) if args.author else Cape.objects()
+
+        return list_response(capes, args.limit, args.after)
 
 
 @fetch.route('/cape/<string:cape_uuid>', doc={
@@ -50,8 +315,8 @@ class CapeInformations(Resource):
             'uuid': cape.uuid,
             'name': cape.name,
             'author': cape.author,
-            'texture': url_for('fetch_cape_texture', cape_uuid=cape.uuid),
-            'preview': url_for('fetch_cape_preview', cape_uuid=cape.uuid)
+            'texture': asset_storage.url(cape.storage, cape.hashes, 'texture', 'fetch_cape_texture', cape_uuid=cape.uuid),
+            'preview': asset_storage.url(cape.storage, cape.hashes, 'preview', 'fetch_cape_preview', cape_uuid=cape.uuid)
         }
 
         return create_response(200, data=response)
@@ -70,14 +335,16 @@ class CapeTexture(Resource):
         """
         Fetch cape image
         """    
+        response = cached_image_response(cape_uuid, 'texture')
+        if response:
+            return response
+
         # get cape informations from db
-        cape = Cape.objects(uuid=cape_uuid).first()
+        cape = Cape.objects(uuid=cape_uuid).only('uuid', 'hashes', 'storage', 'inline', 'texture').first()
         if not cape:
             return create_response(404, "Cape not found")
 
-        image = BytesIO(cape.texture.read())
-
-        return make_response(send_file(image, mimetype='image/png', download_name=f"{cape.uuid}.png"), 200)
+        return image_response(cape, 'texture')
     
 
 @fetch.route('/cape/<string:cape_uuid>/preview', doc={
@@ -88,37 +355,34 @@ class CapeTexture(Resource):
     }
 })
 class CapePreview(Resource):
+    @fetch.expect(preview_parser)
     @check_uuid
     def get(self, cape_uuid:str):
         """
         Fetch cape preview image
-        """
-        # get cape informations from db
-        cape = Cape.objects(uuid=cape_uuid).first()
-        if not cape:
-            return create_response(404, "Cape not found")
-
-        image = BytesIO(cape.preview.read())
 
-        return make_response(send_file(image, mimetype='image/png', download_name=f"{cape.uuid}.png"), 200)
+        Nearest neighbour scaled variants are sent for the `size` parameter, in WebP if accepted.
+        """
+        return preview_response(Cape, cape_uuid)
 
 
 @fetch.route('/accessories', doc={
-    'responses': {200: 'Success'}
+    'responses': {200: 'Success', 400: 'Invalid parameters'}
 })
 class ListAccessories(Resource):
+    @fetch.expect(list_accessories_parser)
     def get(self):
         """
-        List all accessories
+        List accessories
         """
+        # get args
+        args = list_accessories_parser.parse_args()
+
         # get accessory list
-        accessories = Accessory.objects()
-        
-        response = []
-        for accessory in accessories:
-            response.append(accessory.uuid)
-        
-        return create_response(200, data=response)
+        filters = {key: args[key] for key in ('author', 'category') if args[key]}
+        accessories = Accessory.objects(**filters)
+
+        return list_response(accessories, args.limit, args.after)
 
 
 @fetch.route('/accessory/<string:accessory_uuid>', doc={
@@ -144,8 +408,8 @@ class AccessoryInformations(Resource):
             'name': accessory.name,
             'author': accessory.author,
             'category': accessory.category,
-            'preview': url_for('fetch_accessory_preview', accessory_uuid=accessory.uuid),
-            'texture': url_for('fetch_accessory_texture', accessory_uuid=accessory.uuid) if accessory.texture else None
+            'preview': asset_storage.url(accessory.storage, accessory.hashes, 'preview', 'fetch_accessory_preview', accessory_uuid=accessory.uuid),
+            'texture': asset_storage.url(accessory.storage, accessory.hashes, 'texture', 'fetch_accessory_texture', accessory_uuid=accessory.uuid) if asset_storage.exists(accessory, 'texture') else None
         }
 
         return create_response(200, data=response)
@@ -164,19 +428,19 @@ class AccessoryTexture(Resource):
         """
         Fetch accessory texture
         """    
+        response = cached_image_response(accessory_uuid, 'texture')
+        if response:
+            return response
+
         # get accessory informations from db
-        accessory = Accessory.objects(uuid=accessory_uuid).first()
+        accessory = Accessory.objects(uuid=accessory_uuid).only('uuid', 'hashes', 'storage', 'inline', 'texture').first()
         if not accessory:
             return create_response(404, "Accessory not found")
 
-        image = accessory.texture.read()
-
-        if not image:
+        if not asset_storage.exists(accessory, 'texture'):
             return create_response(404, "Accessory doesn't have texture")
 
-        image = BytesIO(image)
-
-        return make_response(send_file(image, mimetype='image/png', download_name=f"{accessory.uuid}.png"), 200)
+        return image_response(accessory, 'texture')
 
 
 @fetch.route('/accessory/<string:accessory_uuid>/preview', doc={
@@ -187,19 +451,15 @@ class AccessoryTexture(Resource):
     }
 })
 class AccessoryPreview(Resource):
+    @fetch.expect(preview_parser)
     @check_uuid
     def get(self, accessory_uuid:str):
         """
         Fetch accessory preview image
-        """
-        # get accessory informations from db
-        accessory = Accessory.objects(uuid=accessory_uuid).first()
-        if not accessory:
-            return create_response(404, "Accessory not found")
-
-        image = BytesIO(accessory.preview.read())
 
-        return make_response(send_file(image, mimetype='image/png', download_name=f"{accessory.uuid}.png"), 200)
+        Nearest neighbour scaled variants are sent for the `size` parameter, in WebP if accepted.
+        """
+        return preview_response(Accessory, accessory_uuid)
 
 
 @fetch.route('/accessory/<string:accessory_uuid>/model', doc={
@@ -214,10 +474,38 @@ class AccessoryModel(Resource):
     def get(self, accessory_uuid:str):
         """
         Fetch accessory model
+
+        Sent as JSON, or in a compact binary form with `Accept: application/vnd.cosmostic.model` : a
+        magic (CSM, version 1) then tagged values, arrays of numbers being packed as typed little
+        endian buffers (see utils.model_codec). Both forms decode to the same model.
         """
         # get accessory informations from db
-        accessory = Accessory.objects(uuid=accessory_uuid).first()
+        accessory = Accessory.objects(uuid=accessory_uuid).only('hashes', 'model_json', 'model_gzip', 'model_binary').first()
         if not accessory:
             return create_response(404, "Accessory not found")
 
-        return create_response(200, data=accessory.model)
\ No newline at end of file
+        # send the stored serialization : compact binary if asked, else JSON compressed if the client accepts it
+        binary = bool(accessory.model_binary) and request.accept_mimetypes.best_match(['application/json', MODEL_MIMETYPE]) == MODEL_MIMETYPE
+        gzipped = not binary and bool(accessory.model_gzip) and bool(request.accept_encodings['gzip'])
+        etag = accessory.hashes.get('model')
+        if etag and (binary or gzipped):
+            etag = f"{etag}-{'binary' if binary else 'gzip'}"   # strong etags differ between representations
+
+        if is_not_modified(etag):
+            response = set_cache_headers(make_response('', 304), etag)
+            response.vary.update(('Accept', 'Accept-Encoding'))
+            return response
+
+        if binary:
+            response = make_response(accessory.model_binary)
+        elif gzipped:
+            response = make_response(accessory.model_gzip)
+            response.content_encoding = 'gzip'
+        elif accessory.model_json:
+            response = make_response(accessory.model_json)
+        else:   # uploaded before the models were stored serialized
+            response = make_response(canonical_model(Accessory.objects(id=accessory.id).scalar('model').first()))
+
+        response.mimetype = MODEL_MIMETYPE if binary else 'application/json'
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        return set_cache_headers(response, etag) if etag else response
\ No newline at end of file
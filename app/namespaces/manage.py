@@ -2,25 +2,64 @@ from flask import current_app, request
 from flask_restx import Resource, Namespace
 from flask_jwt_extended import get_jwt_identity
 from mongoengine import NotUniqueError, ValidationError
+from requests import RequestException
 
-from extensions import api
+from extensions import api, image_cache
 from parsers import (
     create_cape_parser,
     update_cape_parser,
     delete_cape_parser,
     create_accessory_parser,
     update_accessory_parser,
-    delete_accessory_parser
+    delete_accessory_parser,
+    resolve_usernames_parser
 )
 from models.cosmetics import Cape, Accessory
-from utils.commons import create_cape_preview, create_response
+from utils import mojang
+from utils.catalog import record_change, record_deletion
+from utils.cleanup import cleaner
+from utils.commons import compute_hashes, create_response, encode_model
 from utils.decorators import ensure_admin
+from utils.images import prepare_image
+from utils.reprocess import accessory_assets, cape_assets
+from utils.storage import asset_storage
+from utils.verification import verifier
 from authorizations import bearer_token
 
 
 manage = Namespace("manage", description="Manage cosmetics", path="/manage", authorizations=bearer_token)
 
 
+def prepare_accessory_assets(args, accessory=None):
+    """
+    Creates the assets of a created or updated accessory from its uploads (validated headers). Without
+    uploaded preview, the preview of a new accessory is rendered from its model and texture, and a
+    rendered preview is rendered again when they change, else the stored preview is kept.
+
+    Parameters:
+        args (ParseResult): The accessory parser args.
+        accessory (Accessory, optional): The updated accessory. Defaults to a new accessory.
+
+    Returns:
+        dict: The content of each uploaded or rendered asset and preview variant.
+
+    Raises:
+        ValueError: If an asset can't be decoded, or the preview can't be rendered.
+    """
+    texture = args.accessory_texture.read() if args.accessory_texture else None
+    preview = args.accessory_preview.read() if args.accessory_preview else None
+
+    if accessory and not preview and not (accessory.preview_rendered and (args.accessory_model or texture)):   # stored preview kept
+        return {'texture': prepare_image(texture, Accessory.texture)} if texture else {}
+
+    source = texture or (asset_storage.read(accessory, 'texture') if accessory else None)
+    assets = accessory_assets(args.accessory_model or accessory.model, source, preview, current_app.config['ACCESSORY_PREVIEW_WIDTHS'])
+    if not texture:
+        assets.pop('texture', None)   # stored texture, only used to render the preview
+
+    return assets
+
+
 @manage.route('/cape')
 class CapeManagement(Resource):
     @manage.expect(create_cape_parser)
@@ -34,13 +73,22 @@ class CapeManagement(Resource):
         # get args
         args = create_cape_parser.parse_args()
 
-        cape_preview = create_cape_preview(args.cape_texture)   # create cape preview
+        try:
+            assets = cape_assets(args.cape_texture.read(), current_app.config['CAPE_PREVIEW_WIDTHS'])   # create cape preview
+        except ValueError as e:
+            return create_response(400, str(e))
+
+        # create new cape, visible once its assets are stored
+        cape = Cape(name=args.cape_name, author=args.author)
+        asset_storage.prepare(cape, assets)
+        cape.hashes = compute_hashes(cape)
 
         try:
-            # create new cape
-            Cape(name=args.cape_name, author=args.author, texture=args.cape_texture, preview=cape_preview).save()
+            cape.save()
         except NotUniqueError as e:
             return create_response(409, "Cape name already used")
+        
+        record_change(cape)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Created new cape : {args.cape_name}")
         return create_response(200, "Created")
@@ -64,14 +112,23 @@ class CapeManagement(Resource):
         cape.name = args.cape_name or cape.name
         cape.author = args.author or cape.author
 
+        assets = {}
         if args.cape_texture:
-            cape.texture = args.cape_texture
-            cape.preview = create_cape_preview(args.cape_texture)   # update cape preview
+            try:
+                assets = cape_assets(args.cape_texture.read(), current_app.config['CAPE_PREVIEW_WIDTHS'])   # update cape preview
+            except ValueError as e:
+                return create_response(400, str(e))
+
+        asset_storage.prepare(cape, assets)   # previous assets served until the cape is saved
+        cape.hashes = compute_hashes(cape)
 
         try:
             cape.save()
         except NotUniqueError:
             return create_response(409, "Cape name already used")
+        
+        record_change(cape)
+        image_cache.invalidate(cape.uuid)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Updated {args.cape_uuid} cape informations : {[k for k, v in args.items() if v is not None and k != 'cape_uuid']}")
         return create_response(200, "Updated")
@@ -91,7 +148,12 @@ class CapeManagement(Resource):
         if not cape:
             return create_response(404, "Cape not found")
 
-        cape.delete()
+        if current_app.config['COSMETIC_DELETION_MODE'] == 'retire':
+            cleaner.schedule(cape)   # users references removed in background
+        else:
+            cape.delete()
+        record_deletion(cape)
+        image_cache.invalidate(cape.uuid)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Deleted {args.cape_uuid} cape")
         return create_response(200, "Deleted")
@@ -109,14 +171,25 @@ class AccessoryManagement(Resource):
         """
         # get args
         args = create_accessory_parser.parse_args()
+
+        try:
+            assets = prepare_accessory_assets(args)
+        except ValueError as e:
+            return create_response(400, str(e))
         
+        # create new accessory, visible once its assets are stored
+        accessory = Accessory(name=args.accessory_name, author=args.author, category=args.accessory_category, model=args.accessory_model, preview_rendered=not args.accessory_preview, **encode_model(args.accessory_model))
+        asset_storage.prepare(accessory, assets)
+        accessory.hashes = compute_hashes(accessory)
+
         try:
-            # create new cape
-            Accessory(name=args.accessory_name, author=args.author, texture=args.accessory_texture, category=args.accessory_category, model=args.accessory_model, preview=args.accessory_preview).save()
+            accessory.save()
         except NotUniqueError:
             return create_response(409, "Accessory name already used")
         except ValidationError:
             return create_response(400, "Accessory category doesn't exist")
+        
+        record_change(accessory)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Created new accessory : {args.accessory_name}")
         return create_response(200, "Created")
@@ -139,10 +212,23 @@ class AccessoryManagement(Resource):
         # update accessory informations if specified
         accessory.name = args.accessory_name or accessory.name
         accessory.author = args.author or accessory.author
-        accessory.texture = args.accessory_texture or accessory.texture
-        accessory.model = args.accessory_model or accessory.model
         accessory.category = args.accessory_category or accessory.category
-        accessory.preview = args.accessory_preview or accessory.preview
+
+        try:
+            assets = prepare_accessory_assets(args, accessory)
+        except ValueError as e:
+            return create_response(400, str(e))
+
+        if args.accessory_preview:
+            accessory.preview_rendered = False   # uploaded preview, kept on model changes
+
+        if args.accessory_model:
+            accessory.model = args.accessory_model
+            for field, value in encode_model(args.accessory_model).items():
+                setattr(accessory, field, value)
+
+        asset_storage.prepare(accessory, assets)   # previous assets served until the accessory is saved
+        accessory.hashes = compute_hashes(accessory)
 
         try:
             accessory.save()
@@ -150,6 +236,9 @@ class AccessoryManagement(Resource):
             return create_response(409, "Accessory name already used")
         except ValidationError as e:
             return create_response(400, "Accessory category doesn't exist")
+        
+        record_change(accessory)
+        image_cache.invalidate(accessory.uuid)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Updated {args.accessory_uuid} accessory informations : {[k for k, v in args.items() if v is not None and k != 'accessory_uuid']}")
         return create_response(200, "Updated")
@@ -169,7 +258,66 @@ class AccessoryManagement(Resource):
         if not accessory:
             return create_response(404, "Accessory not found")
 
-        accessory.delete()
+        if current_app.config['COSMETIC_DELETION_MODE'] == 'retire':
+            cleaner.schedule(accessory)   # users references removed in background
+        else:
+            accessory.delete()
+        record_deletion(accessory)
+        image_cache.invalidate(accessory.uuid)
 
         current_app.logger.info(f"{request.remote_addr} - ({get_jwt_identity()}) Deleted {args.accessory_uuid} accessory")
-        return create_response(200, "Deleted")
\ No newline at end of file
+        return create_response(200, "Deleted")
+
+
+@manage.route('/mojang/uuids')
+class ResolveUsernames(Resource):
+    @manage.expect(resolve_usernames_parser)
+    @api.doc(responses={200: 'Success', 413: 'Too many usernames', 502: 'Mojang API error'})
+    @api.doc(security="BearerToken")
+    @ensure_admin
+    def post(self):
+        """
+        Resolve minecraft usernames to uuids
+        """
+        # get args
+        args = resolve_usernames_parser.parse_args()
+
+        if len(args.usernames) > current_app.config['USERNAMES_BATCH_LIMIT']:
+            return create_response(413, f"Too many usernames (max {current_app.config['USERNAMES_BATCH_LIMIT']})")
+
+        try:
+            response = mojang.get_uuids(args.usernames)
+        except RequestException as e:
+            current_app.logger.error(f"Mojang bulk lookup error : {e}")
+            return create_response(502, "Mojang API error")
+
+        return create_response(200, data=response)
+
+
+@manage.route('/cleanup')
+class CleanupJobs(Resource):
+    @api.doc(responses={200: 'Success'})
+    @api.doc(security="BearerToken")
+    @ensure_admin
+    def get(self):
+        """
+        Get the progress of the latest deleted cosmetics cleanups
+        """
+        return create_response(200, data=cleaner.jobs())
+
+
+@manage.route('/stats')
+class Stats(Resource):
+    @api.doc(responses={200: 'Success'})
+    @api.doc(security="BearerToken")
+    @ensure_admin
+    def get(self):
+        """
+        Get statistics of the worker handling the request
+        """
+        response = {
+            'image_cache': image_cache.stats(),
+            'verification': verifier.stats()
+        }
+
+        return create_response(200, data=response)
\ No newline at end of file
@@ -2,12 +2,20 @@ from flask import current_app, request
 from flask_restx import Resource, Namespace
 
 from extensions import api
-from parsers import user_cape_parser, user_accessory_parser
-from models.users import User
+from parsers import user_cape_parser, user_accessory_parser, users_cosmetics_parser
 from models.cosmetics import Cape, Accessory
-from utils import mojang
 from utils.commons import create_response
-from utils.decorators import ensure_uuid_match, check_uuid
+from utils.users import (
+    MAX_ACCESSORIES,
+    add_user_accessory,
+    get_active_cosmetics,
+    get_user_cosmetics,
+    new_user_fields,
+    remove_user_accessory,
+    set_user_cape,
+    unset_user_cape
+)
+from utils.decorators import ensure_uuid_match, check_uuid, query_budget
 from authorizations import bearer_token
 
 
@@ -29,22 +37,23 @@ user = Namespace("user", description="Manage user cosmetics", path="/user", auth
 })
 class CapeSettings(Resource):  
     @api.doc(responses={200: 'Success', 422: 'No active cape'})
+    @query_budget(2)
     @check_uuid
     def get(self, user_uuid:str):
         """
         Get active cape
         """
         # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
-        if not user:
+        cosmetics = get_user_cosmetics(user_uuid, 'cape')
+        if not cosmetics:
             return create_response(404, "User not found or not registered")
 
         # check if user has active cape
-        cape = user.cape
+        cape = cosmetics['cape']
         if not cape:
             return create_response(422, "No active cape")
 
-        return create_response(200, data=str(cape.uuid))
+        return create_response(200, data=str(cape))
     
     @user.expect(user_cape_parser)
     @api.doc(responses={200: 'Updated', 201: 'Created', 404: 'Cape not found'})
@@ -59,23 +68,19 @@ class CapeSettings(Resource):
         args = user_cape_parser.parse_args()
 
         # check if cape exists
-        cape = Cape.objects(uuid=args.cape_uuid).first()
-        if not cape:
+        cape_id = Cape.objects(uuid=args.cape_uuid).scalar('id').first()
+        if not cape_id:
             return create_response(404, "Cape not found")
 
-        # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
-        if not user:
-            # check if user uuid exist (mojang account)
-            if not mojang.get_profile(user_uuid):
+        # update user active cape
+        if not set_user_cape(user_uuid, cape_id):
+            # user not registered
+            new_user = new_user_fields(user_uuid)
+            if not new_user:
                 return create_response(404, "User doesn't exist")
             
-            user = User(minecraft_uuid=user_uuid, cape=cape).save()   # create new user
-            return create_response(201, "Created")
-        
-        # update user active cape
-        user.cape = cape
-        user.save()
+            if not set_user_cape(user_uuid, cape_id, new_user):   # create new user
+                return create_response(201, "Created")
 
         current_app.logger.info(f"{request.remote_addr} - ({user_uuid}) Updated his active cape to {args.cape_uuid}")
         return create_response(200, "Updated")
@@ -88,20 +93,15 @@ class CapeSettings(Resource):
         """
         Remove active cape
         """
-        # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
+        # remove active cape
+        user = unset_user_cape(user_uuid)
         if not user:
             return create_response(404, "User not found or not registered")
         
-        # check if user has active cape
-        cape = user.cape
-        if not cape:
+        # check if user had active cape
+        if not user.get('cape'):
             return create_response(422, "No active cape")
 
-        # remove active cape
-        user.cape = None
-        user.save()
-
         current_app.logger.info(f"{request.remote_addr} - ({user_uuid}) Removed his active cape")
         return create_response(200, "Removed")
 
@@ -115,22 +115,21 @@ class CapeSettings(Resource):
 })
 class AccessoriesSettings(Resource):
     @api.doc(responses={200: 'Success'})
+    @query_budget(2)
     @check_uuid
     def get(self, user_uuid:str):
         """
         Get list of active accessories
         """
         # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
-        if not user:
+        cosmetics = get_user_cosmetics(user_uuid, 'accessories')
+        if not cosmetics:
             return create_response(404, "User not found or not registered")
         
         # check if user has active accessories
-        accessories = user.accessories
-        if not accessories:
+        response = cosmetics['accessories']
+        if not response:
             return create_response(422, "No active accessories")
-            
-        response = [accessory.uuid for accessory in accessories]
 
         return create_response(200, data=response)
     
@@ -147,31 +146,30 @@ class AccessoriesSettings(Resource):
         args = user_accessory_parser.parse_args()
 
         # check if accessory exists
-        accessory = Accessory.objects(uuid=args.accessory_uuid).first()
-        if not accessory:
+        accessory_id = Accessory.objects(uuid=args.accessory_uuid).scalar('id').first()
+        if not accessory_id:
             return create_response(404, "Accessory not found")
 
-        # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
+        # add accessory if not active and not too many accessories
+        user = add_user_accessory(user_uuid, accessory_id)
         if not user:
-            # check if user uuid exist (mojang account)
-            if not mojang.get_profile(user_uuid):
+            # user not registered
+            new_user = new_user_fields(user_uuid)
+            if not new_user:
                 return create_response(404, "User doesn't exist")
-            
-            user = User(minecraft_uuid=user_uuid, accessories=[accessory]).save()   # create new user
-            return create_response(201, "Created")
-        
-        if accessory in user.accessories:   # check if accessory already active
+
+            user = add_user_accessory(user_uuid, accessory_id, new_user)   # create new user
+            if not user:
+                return create_response(201, "Created")
+
+        accessories = user.get('accessories', [])
+        if accessory_id in accessories:   # check if accessory already active
             return create_response(409, "Accessory already active")
         
         # check if too many accessories
-        if len(user.accessories) >= 5:
+        if len(accessories) >= MAX_ACCESSORIES:
             return create_response(403, "Too many accessories")
 
-        # update user active cape
-        user.accessories.append(accessory)
-        user.save()
-
         current_app.logger.info(f"{request.remote_addr} - ({user_uuid}) Added accessory {args.accessory_uuid} to active")
         return create_response(200, "Added")
     
@@ -187,19 +185,45 @@ class AccessoriesSettings(Resource):
         # get args
         args = user_accessory_parser.parse_args()
         
-        # check if user exist
-        user = User.objects(minecraft_uuid=user_uuid).first()
+        # check if accessory exists
+        accessory_id = Accessory.objects(uuid=args.accessory_uuid).scalar('id').first()
+        if not accessory_id:
+            return create_response(404, "Accessory not active")
+
+        # remove accessory
+        user = remove_user_accessory(user_uuid, accessory_id)
         if not user:
             return create_response(404, "User not found or not registered")
         
-        # check if user have accessory
-        accessory = next((accessory for accessory in user.accessories if accessory.uuid == args.accessory_uuid), None)
-        if not accessory:
+        # check if user had accessory
+        if accessory_id not in user.get('accessories', []):
             return create_response(404, "Accessory not active")
         
-        # remove accessory
-        user.accessories.remove(accessory)
-        user.save()
-        
         current_app.logger.info(f"{request.remote_addr} - ({user_uuid}) Removed accessory {args.accessory_uuid} from active")
-        return create_response(200, "Removed")
\ No newline at end of file
+        return create_response(200, "Removed")
+
+
+@user.route('/cosmetics', doc={
+    'responses': {
+        200: 'Success',
+        400: 'Invalid users uuids',
+        413: 'Too many users'
+    }
+})
+class UsersCosmetics(Resource):
+    @user.expect(users_cosmetics_parser)
+    @query_budget(3)
+    def post(self):
+        """
+        Get active cosmetics of many users
+        """
+        # get args
+        args = users_cosmetics_parser.parse_args()
+
+        users = list(dict.fromkeys(args.users))   # remove duplicates, keep order
+        if len(users) > current_app.config['USERS_BATCH_LIMIT']:
+            return create_response(413, f"Too many users (max {current_app.config['USERS_BATCH_LIMIT']})")
+
+        response = get_active_cosmetics(users)
+
+        return create_response(200, data=response)
\ No newline at end of file
@@ -1,5 +1,6 @@
 from flask_restx import reqparse
 
+from models.cosmetics import CATEGORIES
 from utils import validator
 
 
@@ -11,6 +12,35 @@ user_cape_parser.add_argument('cape_uuid', type=validator.uuid, required=True, h
 user_accessory_parser = reqparse.RequestParser()
 user_accessory_parser.add_argument('accessory_uuid', type=validator.uuid, required=True, help="Accessory uuid")
 
+# users cosmetics parser
+users_cosmetics_parser = reqparse.RequestParser()
+users_cosmetics_parser.add_argument('users', type=validator.uuid_list, required=True, location='json', help="Users uuids")
+
+### fetch parsers
+# catalog changes parser
+catalog_changes_parser = reqparse.RequestParser()
+catalog_changes_parser.add_argument('since', type=validator.integer, required=True, location='args', help="Catalog version")
+# assets parser
+assets_parser = reqparse.RequestParser()
+assets_parser.add_argument('assets', type=validator.asset_list, required=True, location='json', help="Assets (uuid, kind)")
+# preview parser
+preview_parser = reqparse.RequestParser()
+preview_parser.add_argument('size', type=validator.integer, required=False, location='args', help="Rendered width in pixels : the smallest preview variant at least this wide is sent")
+# atlas parser
+atlas_parser = reqparse.RequestParser()
+atlas_parser.add_argument('textures', type=validator.boolean, required=False, default=False, location='args', help="Include cape textures")
+# list capes parser
+list_capes_parser = reqparse.RequestParser()
+list_capes_parser.add_argument('limit', type=validator.integer, required=False, location='args', help="Max number of capes")
+list_capes_parser.add_argument('after', type=validator.cursor, required=False, location='args', help="Cursor of the previous page")
+list_capes_parser.add_argument('author', type=validator.string, required=False, location='args', help="Cape author")
+# list accessories parser
+list_accessories_parser = reqparse.RequestParser()
+list_accessories_parser.add_argument('limit', type=validator.integer, required=False, location='args', help="Max number of accessories")
+list_accessories_parser.add_argument('after', type=validator.cursor, required=False, location='args', help="Cursor of the previous page")
+list_accessories_parser.add_argument('author', type=validator.string, required=False, location='args', help="Accessory author")
+list_accessories_parser.add_argument('category', type=validator.string, choices=CATEGORIES, required=False, location='args', help="Accessory category")
+
 ### manage cape parsers
 # create cape parser
 create_cape_parser = reqparse.RequestParser()
@@ -27,6 +57,11 @@ update_cape_parser.add_argument('author', type=validator.string, required=False,
 delete_cape_parser = reqparse.RequestParser()
 delete_cape_parser.add_argument('cape_uuid', type=validator.uuid, required=True, help="Cape uuid")
 
+## manage mojang parsers
+# resolve usernames parser
+resolve_usernames_parser = reqparse.RequestParser()
+resolve_usernames_parser.add_argument('usernames', type=validator.username_list, required=True, location='json', help="Minecraft usernames")
+
 ## manage accessory parsers
 # create accessory parser
 create_accessory_parser = reqparse.RequestParser()
@@ -34,7 +69,7 @@ create_accessory_parser.add_argument('accessory_name', type=validator.string, re
 create_accessory_parser.add_argument('accessory_model', type=validator.accessory_model, required=True, help="Accessory model")
 create_accessory_parser.add_argument('accessory_category', type=validator.string, required=True, help="Accessory category")
 create_accessory_parser.add_argument('accessory_texture', type=validator.accessory_texture, required=False, location='files', help="Accessory texture")
-create_accessory_parser.add_argument('accessory_preview', type=validator.accessory_preview, required=True, location='files', help="Accessory preview")
+create_accessory_parser.add_argument('accessory_preview', type=validator.accessory_preview, required=False, location='files', help="Accessory preview (rendered from the model and texture if not specified)")
 create_accessory_parser.add_argument('author', type=validator.string, required=True, help="Accessory author")
 # update accessory parser
 update_accessory_parser = reqparse.RequestParser()
@@ -25,7 +25,57 @@ class Config:
     # DBs URI
     USERS_DB_URI = os.environ.get('USERS_DB_URI', 'mongodb://localhost:27017')
     COSMETICS_DB_URI = os.environ.get('COSMETICS_DB_URI', 'mongodb://localhost:27018')
+    QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() == 'true'   # fail requests exceeding their queries budget (tests)
 
     # JWT
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', SECRET_KEY)
-    JWT_ALGORITHM = "HS256"
\ No newline at end of file
+    JWT_ALGORITHM = "HS256"
+
+    # Assets
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 300))   # seconds clients may reuse an asset before revalidating it
+
+    ASSETS_MAX_UPLOAD_BYTES = int(os.environ.get('ASSETS_MAX_UPLOAD_BYTES', 256 * 1024))   # max size of an uploaded image
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 1024 * 1024))   # requests with a bigger body are rejected before being read (413)
+    ASSETS_BATCH_LIMIT = int(os.environ.get('ASSETS_BATCH_LIMIT', 100))   # max assets per bundle request
+    IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))   # per worker images cache memory budget (0 to disable)
+    IMAGE_CACHE_TTL = int(os.environ.get('IMAGE_CACHE_TTL', 60))   # seconds before a cached image is reloaded from db
+    ASSETS_STORAGE = os.environ.get('ASSETS_STORAGE', 'gridfs')   # backend of the uploaded assets : 'gridfs' or 'local'
+    ASSETS_INLINE_MAX_BYTES = int(os.environ.get('ASSETS_INLINE_MAX_BYTES', 0))   # assets up to this size are stored in the cosmetic documents (0 to disable)
+    ASSETS_LOCAL_PATH = os.environ.get('ASSETS_LOCAL_PATH', 'assets')   # local backend directory
+    ASSETS_ACCEL_REDIRECT = os.environ.get('ASSETS_ACCEL_REDIRECT')   # web server internal location of the local directory (X-Accel-Redirect), else sent with sendfile
+    CAPE_PREVIEW_WIDTHS = tuple(int(width) for width in os.environ.get('CAPE_PREVIEW_WIDTHS', '20,40,80,160').split(','))   # preview variants generated on upload, besides the uploaded size
+    ACCESSORY_PREVIEW_WIDTHS = tuple(int(width) for width in os.environ.get('ACCESSORY_PREVIEW_WIDTHS', '50,75,300').split(','))
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'   # let the web server send the local files (X-Sendfile)
+
+    # Accessory models
+    ACCESSORY_MODEL_MAX_BYTES = int(os.environ.get('ACCESSORY_MODEL_MAX_BYTES', 128 * 1024))   # max size of an uploaded model
+    ACCESSORY_MODEL_MAX_DEPTH = int(os.environ.get('ACCESSORY_MODEL_MAX_DEPTH', 32))   # max nesting of objects and arrays
+    ACCESSORY_MODEL_MAX_ELEMENTS = int(os.environ.get('ACCESSORY_MODEL_MAX_ELEMENTS', 50000))   # max number of JSON values
+
+    # Listings
+    LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 100))   # default number of uuids per page
+    LIST_MAX_PAGE_SIZE = int(os.environ.get('LIST_MAX_PAGE_SIZE', 1000))
+
+    # Mojang
+    MOJANG_API_URL = os.environ.get('MOJANG_API_URL', 'https://api.mojang.com')   # bulk uuids lookups
+    MOJANG_TIMEOUT = float(os.environ.get('MOJANG_TIMEOUT', 5))   # seconds
+    MOJANG_BULK_WINDOW = float(os.environ.get('MOJANG_BULK_WINDOW', 5))   # milliseconds lookups wait to be merged into a bulk request
+    MOJANG_CACHE_SIZE = int(os.environ.get('MOJANG_CACHE_SIZE', 1024))   # per worker max cached lookups
+    MOJANG_CACHE_TTL = int(os.environ.get('MOJANG_CACHE_TTL', 3600))   # seconds a found lookup is cached
+    MOJANG_NEGATIVE_CACHE_TTL = int(os.environ.get('MOJANG_NEGATIVE_CACHE_TTL', 300))   # seconds a not found lookup is cached
+    MOJANG_SHARED_CACHE = os.environ.get('MOJANG_SHARED_CACHE', 'false').lower() == 'true'   # share lookups between workers in users db
+
+    MOJANG_DEFERRED_VERIFICATION = os.environ.get('MOJANG_DEFERRED_VERIFICATION', 'false').lower() == 'true'   # create new users before checking their mojang account
+    VERIFICATION_INTERVAL = float(os.environ.get('VERIFICATION_INTERVAL', 5))   # seconds between pending accounts verification batches
+    VERIFICATION_BATCH_SIZE = int(os.environ.get('VERIFICATION_BATCH_SIZE', 50))
+    VERIFICATION_CLAIM_TIMEOUT = int(os.environ.get('VERIFICATION_CLAIM_TIMEOUT', 60))   # seconds before an unfinished batch can be claimed again
+    USERNAMES_BATCH_LIMIT = int(os.environ.get('USERNAMES_BATCH_LIMIT', 100))   # max usernames per admin resolution request
+
+    # Users
+    USERS_BATCH_LIMIT = int(os.environ.get('USERS_BATCH_LIMIT', 200))   # max users per cosmetics batch request
+    # Cosmetics deletion
+    COSMETIC_DELETION_MODE = os.environ.get('COSMETIC_DELETION_MODE', 'cascade')   # 'cascade' (inline users cleanup) or 'retire' (background users cleanup)
+    CLEANUP_INTERVAL = float(os.environ.get('CLEANUP_INTERVAL', 10))   # seconds between cleanup jobs polls
+    CLEANUP_CHUNK_SIZE = int(os.environ.get('CLEANUP_CHUNK_SIZE', 500))   # users cleaned up per write
+    CLEANUP_CHUNK_DELAY = float(os.environ.get('CLEANUP_CHUNK_DELAY', 0.1))   # seconds between chunks (rate limit)
+    CLEANUP_CLAIM_TIMEOUT = int(os.environ.get('CLEANUP_CLAIM_TIMEOUT', 60))   # seconds before an interrupted job can be resumed by another worker
@@ -0,0 +1,103 @@
+from threading import local
+from types import SimpleNamespace
+import mongoengine
+import mongomock
+import mongomock.gridfs
+import os
+import pytest
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)   # logging.yml and the logs directory are relative to the app
+
+from app import create_app   # app.py, imported before the rootdir added for the test modules resolves 'app' to this directory
+from extensions import query_counter
+
+
+# mongomock collection methods and the command each of them sends to a real server
+COMMANDS = {
+    'find': 'find',
+    'aggregate': 'aggregate',
+    'count_documents': 'count',
+    'distinct': 'distinct',
+    'insert_one': 'insert',
+    'insert_many': 'insert',
+    'update_one': 'update',
+    'update_many': 'update',
+    'replace_one': 'update',
+    'delete_one': 'delete',
+    'delete_many': 'delete',
+    'find_one_and_update': 'findAndModify',
+    'find_one_and_replace': 'findAndModify',
+    'find_one_and_delete': 'findAndModify'
+}
+
+
+def count_commands(monkeypatch):
+    """
+    Makes the mongomock collections notify the query counter as the driver command listener would
+    (mongomock doesn't emit command events). Methods implemented with others count once.
+
+    Parameters:
+        monkeypatch (MonkeyPatch): The pytest monkeypatch fixture.
+    """
+    state = local()
+
+    def counted(method, command_name):
+        def wrapper(self, *args, **kwargs):
+            depth = getattr(state, 'depth', 0)
+            if not depth:
+                query_counter.started(SimpleNamespace(command_name=command_name))
+            state.depth = depth + 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                state.depth = depth
+        return wrapper
+
+    for name, command_name in COMMANDS.items():
+        monkeypatch.setattr(mongomock.Collection, name, counted(getattr(mongomock.Collection, name), command_name))
+
+
+@pytest.fixture(scope='session')
+def app():
+    """
+    The API application, on in-memory databases.
+    """
+    connect = mongoengine.connect
+
+    def mock_connect(*args, **kwargs):
+        kwargs.pop('serverSelectionTimeoutMS', None)
+        kwargs.pop('event_listeners', None)
+        return connect(*args, **{**kwargs, 'host': 'mongodb://localhost', 'mongo_client_class': mongomock.MongoClient})
+
+    mongomock.gridfs.enable_gridfs_integration()   # asset blobs
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(mongoengine, 'connect', mock_connect)
+
+        app = create_app()
+
+    app.config.update(TESTING=True, QUERY_BUDGET_STRICT=True)
+    return app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture()
+def queries(app, monkeypatch):
+    """
+    Counts the database queries sent by the requests made within the test.
+
+    Returns:
+        function: Returns the number of queries sent since the test started.
+    """
+    count_commands(monkeypatch)
+
+    with app.app_context():   # shared with the requests contexts, where the queries are counted
+        start = query_counter.count()
+        yield lambda: query_counter.count() - start
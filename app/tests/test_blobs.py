@@ -0,0 +1,38 @@
+from io import BytesIO
+
+from PIL import Image, features
+import pytest
+
+from utils.commons import content_hash
+from utils.storage import LocalStorage, asset_storage
+
+
+def encode(image_format:str):
+    output = BytesIO()
+    Image.new('RGBA', (10, 16), (0, 0, 255, 255)).save(output, format=image_format)
+    return output.getvalue()
+
+
+@pytest.fixture(params=['gridfs', 'local'])
+def backend(request, app, tmp_path, monkeypatch):
+    monkeypatch.setitem(asset_storage.backends, 'local', LocalStorage(str(tmp_path)))
+    return asset_storage.backends[request.param]
+
+
+@pytest.mark.parametrize('image_format, mimetype', [
+    ('PNG', 'image/png'),
+    pytest.param('WEBP', 'image/webp', marks=pytest.mark.skipif(not features.check('webp'), reason='Pillow built without WebP'))
+])
+def test_blob_mimetype(client, backend, image_format, mimetype):
+    data = encode(image_format)
+    blob_hash = content_hash(data)
+    backend.write(blob_hash, data)
+
+    response = client.get(f'/fetch/blob/{blob_hash}')
+
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert f"{blob_hash}.{mimetype.split('/')[1]}" in response.headers['Content-Disposition']
+    assert response.data == data
+    if backend.name == 'gridfs':
+        assert backend.files.find_one({'_id': blob_hash})['contentType'] == mimetype
@@ -0,0 +1,60 @@
+from uuid import uuid4
+
+import pytest
+
+from models.cosmetics import Cape, Accessory
+from models.users import User
+from utils.cleanup import ReferencesCleaner
+
+
+@pytest.fixture()
+def cleaner(app):
+    cleaner = ReferencesCleaner()
+    cleaner.chunk_size = 2
+    cleaner.chunk_delay = 0
+    return cleaner
+
+
+def late_reference(monkeypatch, cleaner, reference):
+    """
+    Registers a user referencing the cosmetic right after the last cleanup chunk, like a user update
+    which read the cosmetic before it was retired.
+    """
+    clean_chunk = cleaner.clean_chunk
+    users = []
+
+    def wrapper(job):
+        cleaned = clean_chunk(job)
+        if not cleaned and not users:
+            users.append(User._get_collection().insert_one({'minecraft_uuid': str(uuid4()), **reference}).inserted_id)
+        return cleaned
+
+    monkeypatch.setattr(cleaner, 'clean_chunk', wrapper)
+    return users
+
+
+def test_retired_cape_keeps_late_users(monkeypatch, cleaner):
+    cape = Cape(name=f'c-{uuid4().hex[:8]}', author='tests').save()
+    users = User._get_collection().insert_many([{'minecraft_uuid': str(uuid4()), 'cape': cape.id} for _ in range(3)]).inserted_ids
+    late = late_reference(monkeypatch, cleaner, {'cape': cape.id})
+
+    cleaner.schedule(cape)
+    assert cleaner.run() == 1
+
+    assert Cape.all_objects(id=cape.id).count() == 0
+    for user in User._get_collection().find({'_id': {'$in': users + late}}):
+        assert 'cape' not in user
+    assert User._get_collection().count_documents({'_id': {'$in': users + late}}) == 4
+
+
+def test_retired_accessory_keeps_late_users(monkeypatch, cleaner):
+    accessory, other = Accessory._get_collection().insert_many([
+        {'uuid': str(uuid4()), 'name': f'accessory-{uuid4()}', 'author': 'tests', 'category': 'hats', 'model': {}} for _ in range(2)
+    ]).inserted_ids
+    late = late_reference(monkeypatch, cleaner, {'accessories': [accessory, other]})
+
+    cleaner.schedule(Accessory.all_objects(id=accessory).first())
+    assert cleaner.run() == 1
+
+    assert Accessory.all_objects(id=accessory).count() == 0
+    assert User._get_collection().find_one({'_id': late[0]})['accessories'] == [other]
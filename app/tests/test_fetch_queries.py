@@ -0,0 +1,55 @@
+from io import BytesIO
+from uuid import uuid4
+
+from PIL import Image
+import pytest
+
+from extensions import image_cache
+from models.cosmetics import Cape
+from utils.commons import content_hash
+from utils.storage import asset_storage
+
+
+@pytest.fixture()
+def cape(app):
+    """
+    A cape whose texture is a GridFS blob.
+    """
+    image = BytesIO()
+    Image.new('RGBA', (46, 22), (255, 0, 0, 255)).save(image, 'PNG')
+    data = image.getvalue()
+
+    blob_hash = content_hash(data)
+    with app.app_context():
+        asset_storage.backends['gridfs'].write(blob_hash, data)
+
+    uuid = str(uuid4())
+    Cape._get_collection().insert_one({'uuid': uuid, 'name': f'cape-{uuid}', 'author': 'tests', 'storage': {'texture': 'gridfs'}, 'hashes': {'texture': blob_hash}})
+    image_cache.clear()
+    return uuid, data
+
+
+def test_blob_texture_warm_hit_queries(client, cape, queries):
+    uuid, data = cape
+
+    response = client.get(f'/fetch/cape/{uuid}/texture')
+    assert response.status_code == 200
+    assert response.data == data
+    cold = queries()
+    assert cold >= 2   # cape, blob
+
+    response = client.get(f'/fetch/cape/{uuid}/texture')
+    assert response.status_code == 200
+    assert response.data == data
+    assert queries() == cold   # blob found from the cache, without querying the cape
+
+
+def test_blob_texture_invalidated(client, cape, queries):
+    uuid, _ = cape
+
+    client.get(f'/fetch/cape/{uuid}/texture')
+    image_cache.invalidate(uuid)
+    cold = queries()
+
+    assert client.get(f'/fetch/cape/{uuid}/texture').status_code == 200
+    assert queries() == cold + 1   # cape queried again, blob still cached by hash
@@ -0,0 +1,99 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+import json
+import pytest
+import requests
+import time
+
+from utils.minecraft import BulkUUIDResolver
+
+
+def profile_id(username:str):
+    return f"{abs(hash(username.lower())):032x}"[:32]
+
+
+@pytest.fixture()
+def mojang_stub():
+    """
+    Local HTTP stub of the Mojang bulk endpoint : known usernames are the ones starting with 'player'.
+
+    Returns:
+        ThreadingHTTPServer: The running stub, with its url, the received batches and a response delay.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            usernames = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            server.batches.append(usernames)
+            time.sleep(server.delay)
+
+            if len(usernames) > BulkUUIDResolver.BATCH_SIZE:
+                self.send_response(400)
+                self.end_headers()
+                return
+
+            body = json.dumps([{'id': profile_id(name), 'name': name} for name in usernames if name.startswith('player')]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.batches = []
+    server.delay = 0
+
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_resolve_chunks(mojang_stub):
+    resolver = BulkUUIDResolver(mojang_stub.url)
+    usernames = [f'Player{i}' for i in range(23)] + ['unknown']
+
+    result = resolver.resolve(usernames)
+
+    assert [len(batch) for batch in mojang_stub.batches] == [10, 10, 4]
+    assert result['player0'] == profile_id('player0')
+    assert result['unknown'] is None
+
+def test_concurrent_lookups_merged(mojang_stub):
+    resolver = BulkUUIDResolver(mojang_stub.url, window=0.05)
+    usernames = [f'player{i}' for i in range(25)] + ['player0', 'unknown']
+
+    with ThreadPoolExecutor(max_workers=len(usernames)) as executor:
+        result = list(executor.map(resolver.get_uuid, usernames))
+
+    assert result == [profile_id(name) if name.startswith('player') else None for name in usernames]
+    assert sum(len(batch) for batch in mojang_stub.batches) == 26   # duplicates resolved once
+    assert all(len(batch) <= BulkUUIDResolver.BATCH_SIZE for batch in mojang_stub.batches)
+    assert len(mojang_stub.batches) < len(usernames)
+
+def test_lookup_errors(mojang_stub):
+    resolver = BulkUUIDResolver(mojang_stub.url, timeout=0.1)
+    mojang_stub.delay = 0.5
+
+    with pytest.raises(requests.RequestException):
+        resolver.get_uuid('player0')
+
+def test_follower_timeout(mojang_stub):
+    resolver = BulkUUIDResolver(mojang_stub.url, window=0.05, timeout=0.1)
+    def resolve(usernames):   # leader stuck past the requests timeout
+        time.sleep(1)
+        return dict.fromkeys(usernames)
+    resolver.resolve = resolve
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(resolver.get_uuid, 'player0')
+        time.sleep(0.01)
+        follower = executor.submit(resolver.get_uuid, 'player1')
+
+        with pytest.raises(requests.Timeout):
+            follower.result()
+        assert leader.result() is None
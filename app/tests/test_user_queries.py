@@ -0,0 +1,43 @@
+from uuid import uuid4
+
+import pytest
+
+from models.cosmetics import Cape, Accessory
+from models.users import User
+
+
+@pytest.fixture()
+def user(app):
+    """
+    A registered user with an active cape and two active accessories.
+    """
+    cape_id = Cape._get_collection().insert_one({'uuid': str(uuid4()), 'name': f'cape-{uuid4()}', 'author': 'tests'}).inserted_id
+    accessory_ids = Accessory._get_collection().insert_many([
+        {'uuid': str(uuid4()), 'name': f'accessory-{uuid4()}', 'author': 'tests', 'category': 'hats', 'model': {}} for _ in range(2)
+    ]).inserted_ids
+
+    minecraft_uuid = str(uuid4())
+    User._get_collection().insert_one({'minecraft_uuid': minecraft_uuid, 'cape': cape_id, 'accessories': accessory_ids})
+    return minecraft_uuid
+
+
+def test_active_cape_queries(client, user, queries):
+    response = client.get(f'/user/{user}/cape')
+
+    assert response.status_code == 200
+    assert queries() == 2   # user, cape
+
+
+def test_active_accessories_queries(client, user, queries):
+    response = client.get(f'/user/{user}/accessories')
+
+    assert response.status_code == 200
+    assert len(response.json) == 2
+    assert queries() == 2   # user, accessories (batched)
+
+
+def test_unregistered_user_queries(client, queries):
+    response = client.get(f'/user/{uuid4()}/accessories')
+
+    assert response.status_code == 404
+    assert queries() == 1
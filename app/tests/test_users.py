@@ -0,0 +1,133 @@
+from bson import ObjectId
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from uuid import uuid4
+import os
+import pytest
+
+from models.users import User
+from utils.users import MAX_ACCESSORIES, accessory_append_pipeline, add_user_accessory, set_user_cape
+
+
+NEW_USER = {'created_at': datetime(2024, 1, 1, tzinfo=timezone.utc), 'pending_verification': False}
+
+
+@pytest.fixture()
+def users(app):
+    return User._get_collection()
+
+@pytest.fixture()
+def mongod_users(monkeypatch):
+    """
+    Users collection of a real mongod (MONGO_TEST_URI) : mongomock ignores update pipelines.
+    """
+    uri = os.environ.get('MONGO_TEST_URI')
+    if not uri:
+        pytest.skip("MONGO_TEST_URI not set")
+
+    client = MongoClient(uri, serverSelectionTimeoutMS=2000)
+    collection = client[f'tests_{uuid4().hex}'].users
+    collection.create_index('minecraft_uuid', unique=True)
+    monkeypatch.setattr(User, '_get_collection', classmethod(lambda cls: collection))
+
+    yield collection
+    client.drop_database(collection.database.name)
+
+def fail_once(method, error):
+    """
+    Wraps a collection method to raise an error on its first call, as a concurrent request would.
+    """
+    calls = []
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise error
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def test_accessory_append_pipeline():
+    accessory_id = ObjectId()
+    accessories = {'$ifNull': ['$accessories', []]}
+
+    assert accessory_append_pipeline(accessory_id) == [{'$set': {'accessories': {'$cond': [
+        {'$and': [
+            {'$not': [{'$in': [accessory_id, accessories]}]},   # not already active
+            {'$lt': [{'$size': accessories}, MAX_ACCESSORIES]}   # room left
+        ]},
+        {'$concatArrays': [accessories, [accessory_id]]},
+        accessories
+    ]}}}]
+
+def test_new_user_inserted(users):
+    user_uuid, accessory_id = uuid4(), ObjectId()
+
+    assert add_user_accessory(user_uuid, accessory_id, NEW_USER) is None
+
+    user = users.find_one({'minecraft_uuid': str(user_uuid)})
+    assert user['accessories'] == [accessory_id]
+    assert user['pending_verification'] is False
+
+def test_existing_user_fields_kept(users):
+    user_uuid = uuid4()
+    users.insert_one({'minecraft_uuid': str(user_uuid)})   # registered before created_at was stored
+
+    assert add_user_accessory(user_uuid, ObjectId(), NEW_USER) is not None
+    assert 'created_at' not in users.find_one({'minecraft_uuid': str(user_uuid)})
+
+def test_concurrent_registration(users, monkeypatch):
+    user_uuid, cape_id = uuid4(), ObjectId()
+    users.insert_one({'minecraft_uuid': str(user_uuid)})
+    monkeypatch.setattr(users, 'update_one', fail_once(users.update_one, DuplicateKeyError("E11000")))
+
+    assert set_user_cape(user_uuid, cape_id, NEW_USER) is True
+    assert users.find_one({'minecraft_uuid': str(user_uuid)})['cape'] == cape_id
+
+def test_concurrent_registration_accessory(users, monkeypatch):
+    calls = []
+    def find_one_and_update(query, update, **kwargs):
+        calls.append(kwargs.get('upsert', False))
+        if kwargs.get('upsert'):
+            raise DuplicateKeyError("E11000")
+        return {'accessories': []}
+    monkeypatch.setattr(users, 'find_one_and_update', find_one_and_update)
+
+    assert add_user_accessory(uuid4(), ObjectId(), NEW_USER) == {'accessories': []}
+    assert calls == [True, False]   # retried without upsert
+
+
+def test_conditional_append(mongod_users):
+    user_uuid = uuid4()
+    accessory_ids = [ObjectId() for _ in range(MAX_ACCESSORIES + 1)]
+
+    assert add_user_accessory(user_uuid, accessory_ids[0]) is None   # not registered
+    assert add_user_accessory(user_uuid, accessory_ids[0], NEW_USER) is None
+    assert add_user_accessory(user_uuid, accessory_ids[0])['accessories'] == [accessory_ids[0]]   # already active
+    for accessory_id in accessory_ids[1:]:
+        add_user_accessory(user_uuid, accessory_id)
+
+    user = mongod_users.find_one({'minecraft_uuid': str(user_uuid)})
+    assert user['accessories'] == accessory_ids[:MAX_ACCESSORIES]   # no duplicate, limit kept
+    assert user['created_at'] and user['pending_verification'] is False
+
+def test_conditional_append_existing_user(mongod_users):
+    user_uuid, accessory_id = uuid4(), ObjectId()
+    mongod_users.insert_one({'minecraft_uuid': str(user_uuid)})
+
+    before = add_user_accessory(user_uuid, accessory_id, NEW_USER)
+
+    assert before.get('accessories', []) == []
+    user = mongod_users.find_one({'minecraft_uuid': str(user_uuid)})
+    assert user['accessories'] == [accessory_id]
+    assert 'created_at' not in user   # insert fields only set on insert
+
+def test_concurrent_first_upserts(mongod_users):
+    user_uuid = uuid4()
+    accessory_ids = [ObjectId() for _ in range(MAX_ACCESSORIES)]
+
+    with ThreadPoolExecutor(max_workers=len(accessory_ids)) as executor:
+        list(executor.map(lambda accessory_id: add_user_accessory(user_uuid, accessory_id, NEW_USER), accessory_ids))
+
+    assert sorted(mongod_users.find_one({'minecraft_uuid': str(user_uuid)})['accessories']) == sorted(accessory_ids)
@@ -0,0 +1,66 @@
+from struct import Struct
+
+from extensions import image_cache
+from models.cosmetics import Cape, Accessory
+from utils.commons import content_hash
+from utils.storage import ASSET_KINDS, asset_storage
+
+
+# bundle part header : cosmetic uuid (16 bytes), asset kind index (1 byte), sha256 digest (32 bytes), content length (4 bytes, big endian)
+BUNDLE_HEADER = Struct('>16sB32sI')
+BUNDLE_MIMETYPE = 'application/vnd.cosmostic.assets'
+
+
+def pack_asset(uuid, kind:str, data:bytes, etag:str):
+    """
+    Frames an asset as a bundle part : fixed size header followed by the asset content.
+
+    Parameters:
+        uuid (UUID): The cosmetic uuid.
+        kind (str): The asset kind.
+        data (bytes): The asset content.
+        etag (str): The asset content hash (hex).
+
+    Returns:
+        bytes: The bundle part.
+    """
+    return BUNDLE_HEADER.pack(uuid.bytes, ASSET_KINDS.index(kind), bytes.fromhex(etag), len(data)) + data
+
+def iter_assets(assets):
+    """
+    Reads many cosmetic assets, from the image cache when possible, else with one query per
+    cosmetic collection. Unknown cosmetics and missing assets are skipped.
+
+    Parameters:
+        assets (list): The requested (cosmetic uuid, asset kind) pairs.
+
+    Yields:
+        tuple: The cosmetic uuid, asset kind, content and etag of each found asset.
+    """
+    missing = []
+    for uuid, kind in assets:
+        cached = image_cache.get(uuid, kind)
+        if cached:
+            yield uuid, kind, *cached
+        else:
+            missing.append((uuid, kind))
+
+    if not missing:
+        return
+
+    uuids = list({str(uuid) for uuid, _ in missing})
+    cosmetics = {}
+    for document in (Cape, Accessory):
+        for cosmetic in document.objects(uuid__in=uuids).only('uuid', 'hashes', 'storage', 'inline', *ASSET_KINDS):
+            cosmetics[cosmetic.uuid] = cosmetic
+
+    for uuid, kind in missing:
+        cosmetic = cosmetics.get(uuid)
+        data = asset_storage.read(cosmetic, kind) if cosmetic else None
+        if data is None:
+            continue
+
+        etag = cosmetic.hashes.get(kind) or content_hash(data)
+        image_cache.set(uuid, kind, data, etag)
+
+        yield uuid, kind, data, etag
@@ -0,0 +1,133 @@
+from io import BytesIO
+from math import ceil, sqrt
+from threading import Lock
+from PIL import Image
+
+from models.cosmetics import Cape, Accessory
+from utils.catalog import get_catalog_version
+from utils.commons import content_hash
+from utils.storage import asset_storage
+
+
+def cell_size(field):
+    """
+    Get the atlas cell size of an image field, from its declared max size.
+
+    Parameters:
+        field (ImageField): The document image field.
+
+    Returns:
+        tuple: The cell width and height.
+    """
+    return field.size['width'], field.size['height']
+
+def pack_atlas(sections):
+    """
+    Packs images into one sprite sheet. Each section is laid out as a grid of fixed size cells,
+    sections being stacked vertically.
+
+    Parameters:
+        sections (list): (name, cell size, images) tuples, images being (key, bytes) tuples.
+
+    Returns:
+        Image: The sprite sheet.
+        dict: The (x, y, w, h) rectangle of each image, by section name and key.
+    """
+    sections = [(name, cell, [(key, data) for key, data in images if data is not None]) for name, cell, images in sections]   # assets missing from their storage are left out
+    area = sum(cell[0] * cell[1] * len(images) for _, cell, images in sections)
+    width = max([ceil(sqrt(area))] + [cell[0] for _, cell, _ in sections])
+
+    # layout sections
+    layout = []
+    height = 0
+    for name, (cell_width, cell_height), images in sections:
+        columns = width // cell_width
+        layout.append((name, cell_width, cell_height, columns, height, images))
+        height += ceil(len(images) / columns) * cell_height
+
+    atlas = Image.new('RGBA', (width, max(height, 1)))
+    rectangles = {}
+    for name, cell_width, cell_height, columns, top, images in layout:
+        rectangles[name] = {}
+        for index, (key, data) in enumerate(images):
+            image = Image.open(BytesIO(data)).convert('RGBA')
+            image = image.crop((0, 0, min(image.width, cell_width), min(image.height, cell_height)))   # stay within the cell
+
+            x = (index % columns) * cell_width
+            y = top + (index // columns) * cell_height
+            atlas.paste(image, (x, y))
+            rectangles[name][key] = (x, y, image.width, image.height)
+
+    return atlas, rectangles
+
+
+class AtlasCache:
+    """
+    Per worker cache of the cosmetics previews atlas, rebuilt lazily once per catalog version.
+    """
+    def __init__(self):
+        self.version = None
+        self._atlases = {}   # with textures -> (png, etag, map)
+        self._lock = Lock()
+
+    def get(self, textures:bool=False):
+        """
+        Get the atlas of the current catalog version.
+
+        Parameters:
+            textures (bool, optional): Whether cape textures are included. Defaults to False.
+
+        Returns:
+            tuple: The atlas png (bytes), its etag, and its map.
+        """
+        version = get_catalog_version()
+
+        with self._lock:
+            if self.version != version:
+                self._atlases.clear()
+                self.version = version
+
+            if textures not in self._atlases:
+                self._atlases[textures] = self.build(version, textures)
+
+            return self._atlases[textures]
+
+    def build(self, version:int, textures:bool):
+        """
+        Builds the atlas of all cape and accessory previews, cells being sized after the image fields.
+
+        Parameters:
+            version (int): The catalog version read before the cosmetics.
+            textures (bool): Whether cape textures are included.
+
+        Returns:
+            tuple: The atlas png (bytes), its etag, and its map.
+        """
+        capes = list(Cape.objects().only('uuid', 'storage', 'hashes', 'inline', 'preview', 'texture'))
+        accessories = Accessory.objects().only('uuid', 'storage', 'hashes', 'inline', 'preview')
+
+        sections = [
+            ('capes', cell_size(Cape.preview), [(str(cape.uuid), asset_storage.read(cape, 'preview')) for cape in capes]),
+            ('accessories', cell_size(Accessory.preview), [(str(accessory.uuid), asset_storage.read(accessory, 'preview')) for accessory in accessories])
+        ]
+        if textures:
+            sections.append(('textures', cell_size(Cape.texture), [(str(cape.uuid), asset_storage.read(cape, 'texture')) for cape in capes]))
+
+        atlas, rectangles = pack_atlas(sections)
+
+        output = BytesIO()
+        atlas.save(output, format='PNG', optimize=True)
+        data = output.getvalue()
+        etag = content_hash(data)
+
+        atlas_map = {
+            'version': version,
+            'etag': etag,
+            'width': atlas.width,
+            'height': atlas.height,
+            **rectangles
+        }
+        return data, etag, atlas_map
+
+
+atlas_cache = AtlasCache()
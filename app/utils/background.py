@@ -0,0 +1,43 @@
+from flask import current_app
+from threading import Event, Thread
+
+
+class PeriodicTask:
+    """
+    Runs a task periodically in a daemon thread of the current worker process, within the app context.
+    """
+    def __init__(self, name:str, task, interval:float):
+        self.name = name
+        self.task = task
+        self.interval = interval
+
+        self._stop = Event()
+        self._thread = None
+
+    def start(self, app):
+        """
+        Starts the task thread.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the task thread after its current run.
+        """
+        self._stop.set()
+
+    def _run(self, app):
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    self.task()
+                except Exception as e:
+                    current_app.logger.exception(f"{self.name} task error : {e}")
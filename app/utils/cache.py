@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class ImageCache:
+    """
+    In-process LRU cache of cosmetic images, bounded by the total size in bytes of the cached images.
+
+    Each worker has its own cache : entries are invalidated by the worker handling a cosmetic
+    update, and expire after a TTL so other workers catch up with the change.
+
+    Images stored as blobs are not copied in the cache : only the backend and hash of the blob
+    are cached, so the cosmetic document isn't queried again to find it.
+    """
+    def __init__(self, max_bytes:int=0, ttl:int=0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()   # (uuid, kind) -> (data, etag, expiration), (uuid, kind, 'blob') -> (backend, hash, expiration)
+        self._size = 0
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        """
+        Configures the cache from the app config.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        self.max_bytes = app.config['IMAGE_CACHE_MAX_BYTES']
+        self.ttl = app.config['IMAGE_CACHE_TTL']
+        self.clear()
+
+    def get(self, uuid, kind:str):
+        """
+        Get a cached image.
+
+        Parameters:
+            uuid (UUID): The cosmetic uuid.
+            kind (str): The image kind (texture, preview...).
+
+        Returns:
+            tuple: The image content and its etag.
+            None: If the image is not cached or expired.
+        """
+        return self._get((str(uuid), kind))
+
+    def set(self, uuid, kind:str, data:bytes, etag:str):
+        """
+        Cache an image, evicting the least recently used ones to stay within the memory budget.
+
+        Parameters:
+            uuid (UUID): The cosmetic uuid.
+            kind (str): The image kind (texture, preview...).
+            data (bytes): The image content.
+            etag (str): The image content hash.
+        """
+        self._set((str(uuid), kind), data, etag)
+
+    def get_blob(self, uuid, kind:str):
+        """
+        Get the cached blob of an image stored in a storage backend.
+
+        Parameters:
+            uuid (UUID): The cosmetic uuid.
+            kind (str): The image kind (texture, preview...).
+
+        Returns:
+            tuple: The backend name and the blob hash.
+            None: If the blob is not cached or expired.
+        """
+        return self._get((str(uuid), kind, 'blob'))
+
+    def set_blob(self, uuid, kind:str, backend:str, blob_hash:str):
+        """
+        Cache the blob of an image stored in a storage backend.
+
+        Parameters:
+            uuid (UUID): The cosmetic uuid.
+            kind (str): The image kind (texture, preview...).
+            backend (str): The backend name.
+            blob_hash (str): The blob hash.
+        """
+        self._set((str(uuid), kind, 'blob'), backend, blob_hash)
+
+    def invalidate(self, uuid):
+        """
+        Remove all cached images of a cosmetic.
+
+        Parameters:
+            uuid (UUID): The cosmetic uuid.
+        """
+        uuid = str(uuid)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == uuid]:
+                self._remove(key)
+
+    def clear(self):
+        """
+        Remove all cached images.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Get the cache statistics.
+
+        Returns:
+            dict: The cache size, budget, entries count and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {
+                'size': self._size,
+                'max_size': self.max_bytes,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and self.ttl and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if not entry:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def _set(self, key, data, etag:str):
+        if len(data) > self.max_bytes:   # disabled cache or image too large
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            while self._size + len(data) > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            self._entries[key] = (data, etag, time.monotonic() + self.ttl)
+            self._size += len(data)
+
+    def _remove(self, key):
+        data = self._entries.pop(key)[0]
+        self._size -= len(data)
+
+
+
+class TTLCache:
+    """
+    Bounded in-process cache whose entries expire after a per-entry TTL.
+    Least recently used entries are evicted once the cache is full. None values can be cached.
+    """
+    def __init__(self, maxsize:int=1024):
+        self.maxsize = maxsize
+
+        self._entries = OrderedDict()   # key -> (value, expiration)
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        Get a cached value.
+
+        Parameters:
+            key (Hashable): The value key.
+
+        Returns:
+            tuple: Whether the key is cached, and its value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return False, None
+
+            if entry[1] < time.monotonic():
+                del self._entries[key]
+                return False, None
+
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def set(self, key, value, ttl:float):
+        """
+        Cache a value.
+
+        Parameters:
+            key (Hashable): The value key.
+            value (Any): The value, can be None.
+            ttl (float): The number of seconds before the value expires.
+        """
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.maxsize:
+                self._entries.popitem(last=False)
+
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def clear(self):
+        """
+        Remove all cached values.
+        """
+        with self._lock:
+            self._entries.clear()
\ No newline at end of file
@@ -0,0 +1,237 @@
+from datetime import datetime, timezone
+from flask import url_for
+from threading import Lock
+import json
+import time
+
+from models.cosmetics import Cape, Accessory, Catalog, Tombstone
+from utils.commons import content_hash
+from utils.storage import asset_storage
+
+
+CAPE_FIELDS = ('uuid', 'name', 'author', 'storage', 'hashes', 'version')
+ACCESSORY_FIELDS = ('uuid', 'name', 'author', 'category', 'texture', 'storage', 'hashes', 'version')
+
+COMMIT_TIMEOUT = 5   # seconds a catalog version waits for the previous ones to be published before skipping them
+COMMIT_POLL_INTERVAL = 0.005
+
+
+def get_catalog_version():
+    """
+    Get the current (published) cosmetics catalog version : the changes of all versions up to it are written.
+
+    Returns:
+        int: The catalog version, 0 if the catalog was never modified.
+    """
+    catalog = Catalog.objects(name='cosmetics').only('version', 'committed').as_pymongo().first()
+    if not catalog:
+        return 0
+    return catalog.get('committed', catalog['version'])   # catalogs versioned before the publication
+
+def bump_catalog_version():
+    """
+    Allocates the next cosmetics catalog version, published with publish_catalog_version once its changes are written.
+
+    Returns:
+        int: The new catalog version.
+    """
+    catalog = Catalog.objects(name='cosmetics').modify(upsert=True, new=True, inc__version=1)
+    if catalog.committed is None:   # catalogs versioned before the publication : previous versions are written
+        Catalog.objects(name='cosmetics', committed__exists=False).update(set__committed=catalog.version - 1)
+    return catalog.version
+
+def publish_catalog_version(version:int):
+    """
+    Publishes a catalog version once its changes are written, after the previous versions : the published
+    version is never higher than a change still being written. A writer stalled for COMMIT_TIMEOUT
+    (or stopped) before publishing its version is skipped, and must record its change again.
+
+    Parameters:
+        version (int): The allocated catalog version.
+
+    Returns:
+        bool: True if the version is published, False if it was skipped.
+    """
+    deadline = time.monotonic() + COMMIT_TIMEOUT
+    while True:
+        if Catalog.objects(name='cosmetics', committed=version - 1).update(set__committed=version):
+            return True
+
+        committed = get_catalog_version()
+        if committed >= version:
+            return False
+
+        if time.monotonic() < deadline:
+            time.sleep(COMMIT_POLL_INTERVAL)   # previous versions still being written
+        else:
+            Catalog.objects(name='cosmetics', committed=committed).update(set__committed=committed + 1)   # stalled writer skipped
+            deadline = time.monotonic() + COMMIT_TIMEOUT
+
+def commit_catalog_version(version:int, write):
+    """
+    Publishes the catalog version of written changes. If it was skipped, the changes are written
+    again with a new version, until it is published.
+
+    Parameters:
+        version (int): The allocated catalog version, stored with the changes.
+        write (callable): Function storing a new catalog version with the changes.
+
+    Returns:
+        int: The published catalog version.
+    """
+    while not publish_catalog_version(version):
+        version = bump_catalog_version()
+        write(version)
+    return version
+
+def record_change(cosmetic):
+    """
+    Stores a new catalog version on a created or updated cosmetic, and publishes it.
+
+    Parameters:
+        cosmetic (Cape | Accessory): The saved cosmetic document.
+
+    Returns:
+        int: The new catalog version.
+    """
+    def write(version:int):
+        cosmetic.update(set__version=version, set__updated_at=datetime.now(timezone.utc))
+
+    version = bump_catalog_version()
+    write(version)
+    return commit_catalog_version(version, write)
+
+def record_deletion(cosmetic):
+    """
+    Writes the tombstone of a deleted cosmetic with a new catalog version, and publishes it.
+
+    Parameters:
+        cosmetic (Cape | Accessory): The deleted cosmetic document.
+
+    Returns:
+        int: The new catalog version.
+    """
+    tombstone = Tombstone(type='cape' if isinstance(cosmetic, Cape) else 'accessory', uuid=cosmetic.uuid)
+
+    def write(version:int):
+        tombstone.version = version
+        tombstone.save()
+
+    version = bump_catalog_version()
+    write(version)
+    return commit_catalog_version(version, write)
+
+def cape_entry(cape:dict):
+    """
+    Creates the catalog entry of a cape. Must be called within a request context (assets urls).
+
+    Parameters:
+        cape (dict): The raw cape document, with CAPE_FIELDS.
+
+    Returns:
+        dict: The cape metadata.
+    """
+    return {
+        'uuid': cape['uuid'],
+        'name': cape['name'],
+        'author': cape['author'],
+        'texture': asset_storage.url(cape.get('storage'), cape.get('hashes'), 'texture', 'fetch_cape_texture', cape_uuid=cape['uuid']),
+        'preview': asset_storage.url(cape.get('storage'), cape.get('hashes'), 'preview', 'fetch_cape_preview', cape_uuid=cape['uuid']),
+        'hashes': cape.get('hashes', {}),
+        'version': cape.get('version', 0)
+    }
+
+def accessory_entry(accessory:dict):
+    """
+    Creates the catalog entry of an accessory. Must be called within a request context (assets urls).
+
+    Parameters:
+        accessory (dict): The raw accessory document, with ACCESSORY_FIELDS.
+
+    Returns:
+        dict: The accessory metadata.
+    """
+    return {
+        'uuid': accessory['uuid'],
+        'name': accessory['name'],
+        'author': accessory['author'],
+        'category': accessory['category'],
+        'texture': asset_storage.url(accessory.get('storage'), accessory.get('hashes'), 'texture', 'fetch_accessory_texture', accessory_uuid=accessory['uuid']) if accessory.get('texture') or 'texture' in accessory.get('storage', {}) else None,
+        'preview': asset_storage.url(accessory.get('storage'), accessory.get('hashes'), 'preview', 'fetch_accessory_preview', accessory_uuid=accessory['uuid']),
+        'model': url_for('fetch_accessory_model', accessory_uuid=accessory['uuid']),
+        'hashes': accessory.get('hashes', {}),
+        'version': accessory.get('version', 0)
+    }
+
+def get_catalog_changes(since:int):
+    """
+    Get the cosmetics created, updated or deleted since a catalog version.
+    Must be called within a request context (assets urls).
+
+    Parameters:
+        since (int): The catalog version the client is up to date with.
+
+    Returns:
+        dict: The current catalog version, the changed capes and accessories, and the deleted cosmetics.
+    """
+    version = get_catalog_version()
+
+    capes = Cape.objects(version__gt=since).only(*CAPE_FIELDS).as_pymongo()
+    accessories = Accessory.objects(version__gt=since).only(*ACCESSORY_FIELDS).as_pymongo()
+    tombstones = Tombstone.objects(version__gt=since).only('type', 'uuid', 'version').as_pymongo()
+
+    return {
+        'version': version,
+        'capes': [cape_entry(cape) for cape in capes],
+        'accessories': [accessory_entry(accessory) for accessory in accessories],
+        'deleted': [{'type': tombstone['type'], 'uuid': tombstone['uuid'], 'version': tombstone['version']} for tombstone in tombstones]
+    }
+
+
+class CatalogSnapshot:
+    """
+    Per worker serialized snapshot of the cosmetics catalog, built once per catalog version.
+    """
+    def __init__(self):
+        self.version = None
+        self.data = None
+        self.etag = None
+
+        self._lock = Lock()
+
+    def get(self):
+        """
+        Get the serialized catalog, rebuilding it if the catalog version changed.
+        Must be called within a request context (assets urls).
+
+        Returns:
+            tuple: The serialized catalog (bytes) and its etag.
+        """
+        version = get_catalog_version()
+        
+        with self._lock:
+            if self.version != version:
+                self.data = json.dumps(self.build(version), separators=(',', ':')).encode()
+                self.etag = content_hash(self.data)
+                self.version = version
+
+            return self.data, self.etag
+
+    def build(self, version:int):
+        """
+        Builds the catalog metadata of all capes and accessories.
+
+        Parameters:
+            version (int): The catalog version read before the cosmetics.
+
+        Returns:
+            dict: The catalog version, capes and accessories.
+        """
+        return {
+            'version': version,
+            'capes': [cape_entry(cape) for cape in Cape.objects().only(*CAPE_FIELDS).as_pymongo()],
+            'accessories': [accessory_entry(accessory) for accessory in Accessory.objects().only(*ACCESSORY_FIELDS).as_pymongo()]
+        }
+
+
+catalog_snapshot = CatalogSnapshot()
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, timezone
+from mongoengine import Q
+import time
+
+from models.cosmetics import Cape, Accessory, CleanupJob
+from models.users import User
+from utils.background import PeriodicTask
+
+
+class ReferencesCleaner:
+    """
+    Removes in background the user references to retired cosmetics, then deletes the cosmetics.
+
+    Jobs are processed in chunks of users found through the cape / accessories indexes, with a
+    delay between chunks so the cleanup doesn't starve production traffic. A job is claimed by one
+    worker at a time; if the worker dies, the claim expires and another worker resumes the job.
+    """
+    def __init__(self):
+        self.chunk_size = 500
+        self.chunk_delay = 0.1
+        self.claim_timeout = 60
+        self.task = None
+
+    def init_app(self, app):
+        """
+        Configures the cleaner from the app config and starts it if cosmetics are retired on deletion.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        self.chunk_size = app.config['CLEANUP_CHUNK_SIZE']
+        self.chunk_delay = app.config['CLEANUP_CHUNK_DELAY']
+        self.claim_timeout = app.config['CLEANUP_CLAIM_TIMEOUT']
+
+        if app.config['COSMETIC_DELETION_MODE'] == 'retire':
+            self.task = PeriodicTask('references-cleaner', self.run, app.config['CLEANUP_INTERVAL'])
+            self.task.start(app)
+
+    def schedule(self, cosmetic):
+        """
+        Retires a cosmetic (hidden from the API right away) and schedules the cleanup of its references.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The cosmetic to delete.
+
+        Returns:
+            CleanupJob: The scheduled job.
+        """
+        cosmetic.update(set__retired=True)
+        return CleanupJob(type='cape' if isinstance(cosmetic, Cape) else 'accessory', cosmetic=cosmetic.id, uuid=cosmetic.uuid).save()
+
+    def claim(self):
+        """
+        Claims the oldest unfinished job not claimed by another worker.
+
+        Returns:
+            CleanupJob: The claimed job.
+            None: If there is no job to run.
+        """
+        now = datetime.now(timezone.utc)
+        unclaimed = Q(state__ne='done') & (Q(claimed_until=None) | Q(claimed_until__lt=now))
+
+        return CleanupJob.objects(unclaimed).order_by('created_at').modify(
+            new=True,
+            set__state='running',
+            set__claimed_until=now + timedelta(seconds=self.claim_timeout)
+        )
+
+    def run(self):
+        """
+        Runs the unfinished jobs, one chunk of users at a time.
+
+        Returns:
+            int: The number of jobs done.
+        """
+        done = 0
+        while job := self.claim():
+            while self.clean_chunk(job):
+                time.sleep(self.chunk_delay)   # rate limit
+
+            # no more references : delete the cosmetic
+            self.delete_cosmetic(job)
+
+            job.update(set__state='done', set__updated_at=datetime.now(timezone.utc), unset__claimed_until=True)
+            done += 1
+
+        return done
+
+    def delete_cosmetic(self, job):
+        """
+        Deletes the job cosmetic without applying its reverse delete rules.
+
+        A user update that read the cosmetic before it was retired can still reference it after the last
+        chunk : the remaining references are removed in a final pass, and the cosmetic is deleted from its
+        collection directly so the users CASCADE rule can never delete a user still referencing it.
+
+        Parameters:
+            job (CleanupJob): The running job.
+        """
+        if job.type == 'cape':
+            User.objects(cape=job.cosmetic).update(unset__cape=True)
+            Cape._get_collection().delete_one({'_id': job.cosmetic})
+        else:
+            User.objects(accessories=job.cosmetic).update(pull__accessories=job.cosmetic)
+            Accessory._get_collection().delete_one({'_id': job.cosmetic})
+
+    def clean_chunk(self, job):
+        """
+        Removes the references of a chunk of users to the job cosmetic, and reports the job progress.
+
+        Parameters:
+            job (CleanupJob): The running job.
+
+        Returns:
+            int: The number of cleaned up users, 0 once the job is finished.
+        """
+        if job.type == 'cape':
+            ids = list(User.objects(cape=job.cosmetic).limit(self.chunk_size).scalar('id'))
+            if ids:
+                User.objects(id__in=ids).update(unset__cape=True)
+        else:
+            ids = list(User.objects(accessories=job.cosmetic).limit(self.chunk_size).scalar('id'))
+            if ids:
+                User.objects(id__in=ids).update(pull__accessories=job.cosmetic)
+
+        now = datetime.now(timezone.utc)
+        job.update(inc__processed=len(ids), set__updated_at=now, set__claimed_until=now + timedelta(seconds=self.claim_timeout))
+        return len(ids)
+
+    def jobs(self, limit:int=50):
+        """
+        Get the latest cleanup jobs and their progress.
+
+        Parameters:
+            limit (int, optional): The max number of jobs. Defaults to 50.
+
+        Returns:
+            list: The jobs type, cosmetic uuid, state, processed users and dates.
+        """
+        jobs = CleanupJob.objects().order_by('-created_at').limit(limit).only('type', 'uuid', 'state', 'processed', 'created_at', 'updated_at').as_pymongo()
+
+        return [{
+            'type': job['type'],
+            'uuid': job['uuid'],
+            'state': job['state'],
+            'processed': job.get('processed', 0),
+            'created_at': job['created_at'],
+            'updated_at': job.get('updated_at')
+        } for job in jobs]
+
+
+cleaner = ReferencesCleaner()
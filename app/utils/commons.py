@@ -1,6 +1,10 @@
-from flask import jsonify, make_response
+from flask import current_app, jsonify, make_response, request, send_file
+from base64 import urlsafe_b64encode
+from hashlib import sha256
 from io import BytesIO
-from PIL import Image
+from utils.images import image_mimetype
+import gzip
+import json
 
 
 def create_cape_preview(cape_texture):
@@ -8,21 +12,12 @@ def create_cape_preview(cape_texture):
     Creates a preview of a cape texture.
 
     Args:
-        cape_texture: The cape texture file.
+        cape_texture (Image): The decoded cape texture.
 
     Returns:
-        BytesIO: A BytesIO object containing the preview image.
+        Image: The preview image.
     """
-    # open image
-    img = Image.open(cape_texture)
-
-    cropped = img.crop((1, 1, 11, 16))   # crop
-
-    # save image
-    output = BytesIO()
-    cropped.save(output, format=img.format)
-
-    return output
+    return cape_texture.crop((1, 1, 11, 16))
 
 def create_response(code:int, message:str=None, data=None):
     """
@@ -39,4 +34,164 @@ def create_response(code:int, message:str=None, data=None):
     if data is not None:
         return make_response(jsonify(data), code)
     else:
-        return make_response(jsonify({'code': code, 'message': message if message else ''}), code)
\ No newline at end of file
+        return make_response(jsonify({'code': code, 'message': message if message else ''}), code)
+
+def create_cursor(object_id):
+    """
+    Creates an opaque pagination cursor from a document id.
+
+    Parameters:
+        object_id (ObjectId): The id of the last document of the page.
+
+    Returns:
+        str: The pagination cursor.
+    """
+    return urlsafe_b64encode(object_id.binary).decode().rstrip('=')
+
+def content_hash(data:bytes):
+    """
+    Computes the content hash of an asset.
+
+    Parameters:
+        data (bytes): The asset content.
+
+    Returns:
+        str: The sha256 hex digest of the content.
+    """
+    return sha256(data).hexdigest()
+
+def canonical_model(model:dict):
+    """
+    Serializes an accessory model to its canonical form : minified JSON with sorted keys, as jsonify does.
+
+    Parameters:
+        model (dict): The accessory model.
+
+    Returns:
+        bytes: The serialized model.
+    """
+    return json.dumps(model, sort_keys=True, separators=(',', ':')).encode()
+
+def encode_model(model:dict):
+    """
+    Creates the stored serializations of an accessory model, served without serializing it again.
+
+    Parameters:
+        model (dict): The accessory model.
+
+    Returns:
+        dict: The canonical JSON, its gzip compressed form and the compact binary form (empty if it
+        doesn't round-trip to the same JSON, the JSON is served instead), by accessory field.
+    """
+    from utils.model_codec import pack_model, unpack_model
+
+    data = canonical_model(model)
+    binary = pack_model(model)
+    if canonical_model(unpack_model(binary)) != data:
+        binary = b''   # stored, so the models command doesn't encode it again
+
+    return {
+        'model_json': data,
+        'model_gzip': gzip.compress(data, compresslevel=9, mtime=0),   # no timestamp : same model, same bytes
+        'model_binary': binary
+    }
+
+def model_hash(model:dict):
+    """
+    Computes the content hash of an accessory model from its canonical JSON form.
+
+    Parameters:
+        model (dict): The accessory model.
+
+    Returns:
+        str: The sha256 hex digest of the model.
+    """
+    return content_hash(canonical_model(model))
+
+def compute_hashes(document):
+    """
+    Computes the content hashes of a cosmetic document assets.
+
+    Hashes are computed from the stored bytes, so they match what the fetch endpoints serve.
+
+    Parameters:
+        document (Cape | Accessory): The cosmetic document.
+
+    Returns:
+        dict: The content hash of each asset kind, and of the model.
+    """
+    from utils.storage import ASSET_KINDS, asset_storage   # storage depends on this module
+
+    hashes = {}
+    for kind in dict.fromkeys((*ASSET_KINDS, *document.storage)):   # preview variants are only stored as blobs
+        if kind in document.storage:   # blobs are keyed by their hash
+            hashes[kind] = document.hashes[kind]
+            continue
+
+        data = asset_storage.read(document, kind)
+        if data is not None:
+            hashes[kind] = content_hash(data)
+    
+    model = getattr(document, 'model', None)
+    if model:
+        hashes['model'] = model_hash(model)
+
+    return hashes
+
+def set_cache_headers(response, etag:str, immutable:bool=False):
+    """
+    Adds the caching headers (strong etag and cache control) to an asset response.
+
+    Parameters:
+        response (Response): The response to update.
+        etag (str): The asset content hash.
+        immutable (bool, optional): Whether the url content never changes (cached for a year). Defaults to False.
+
+    Returns:
+        Response: The updated response.
+    """
+    response.set_etag(etag)
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000 if immutable else current_app.config['ASSETS_MAX_AGE']
+    response.cache_control.immutable = immutable or None
+    return response
+
+def is_not_modified(etag:str):
+    """
+    Checks if the client already has the asset with the given etag (If-None-Match).
+
+    Parameters:
+        etag (str): The asset content hash, None if unknown.
+
+    Returns:
+        bool: True if the client copy is up to date.
+    """
+    return bool(etag) and request.if_none_match.contains(etag)
+
+def create_file_response(read, etag:str, download_name:str, mimetype:str='image/png', immutable:bool=False):
+    """
+    Creates a cacheable file response, answering conditional requests without reading the file.
+
+    Parameters:
+        read (callable): Function returning the file content, only called if the content must be sent.
+        etag (str): The stored content hash of the file, None if unknown.
+        download_name (str): The file name, None for the etag with the extension of the mimetype.
+        mimetype (str, optional): The file mimetype, None for the image type of the content. Defaults to 'image/png'.
+        immutable (bool, optional): Whether the url content never changes. Defaults to False.
+
+    Returns:
+        Response: A 304 response if the client copy is up to date, a 404 response if the file
+            is missing from its storage, else the file response.
+    """
+    if is_not_modified(etag):
+        return set_cache_headers(make_response('', 304), etag, immutable)
+
+    data = read()
+    if data is None:
+        return create_response(404, "File not found")
+    etag = etag or content_hash(data)   # documents created before hashes were stored
+    mimetype = mimetype or image_mimetype(data)
+
+    response = make_response(send_file(BytesIO(data), mimetype=mimetype, download_name=download_name or f"{etag}.{mimetype.split('/')[1]}", etag=etag))
+    return set_cache_headers(response, etag, immutable)
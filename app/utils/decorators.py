@@ -1,7 +1,8 @@
-from flask import current_app
+from flask import current_app, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from functools import wraps
 
+from extensions import query_counter
 from utils import validator
 from utils.commons import create_response
 
@@ -84,4 +85,32 @@ def ensure_admin(f):
         if not admins or jwt_identity not in admins:
             return create_response(400, "Unauthorized")
         return f(*args, **kwargs)
-    return decorated
\ No newline at end of file
+    return decorated
+
+def query_budget(max_queries:int):
+    """
+    Decorator declaring the max number of database queries an endpoint may send.
+    Exceeding it logs a warning, or raises an AssertionError if QUERY_BUDGET_STRICT is enabled (tests).
+
+    Parameters:
+        max_queries (int): The max number of queries.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            start = query_counter.count()
+            response = f(*args, **kwargs)
+
+            queries = query_counter.count() - start
+            if queries > max_queries:
+                message = f"{request.method} {request.path} sent {queries} queries (budget : {max_queries})"
+                if current_app.config['QUERY_BUDGET_STRICT']:
+                    raise AssertionError(message)
+                current_app.logger.warning(message)
+
+            return response
+        return decorated
+    return decorator
\ No newline at end of file
@@ -0,0 +1,322 @@
+from io import BytesIO
+from PIL import Image, ImageOps, features
+from struct import Struct
+import os
+import zlib
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# first chunk of a png : data length (13), type (IHDR), width, height (big endian uint)
+IHDR_HEADER = Struct('>I4sII')
+# png chunk : data length, type, then data and crc
+CHUNK_HEADER = Struct('>I4s')
+# chunks needed to decode the pixels, the others (text, time, color profiles...) are stripped
+PIXEL_CHUNKS = (b'IHDR', b'PLTE', b'tRNS', b'IDAT', b'IEND')
+# zlib strategies tried when optimizing (Pillow filters each row adaptively)
+ZLIB_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE, zlib.Z_FIXED)
+
+# preview variants formats, WebP only if Pillow was built with it
+PREVIEW_FORMATS = {'png': 'image/png', 'webp': 'image/webp'} if features.check('webp') else {'png': 'image/png'}
+
+
+def png_size(stream):
+    """
+    Reads the dimensions of a PNG from its header, without decoding it. The stream position is restored.
+
+    Parameters:
+        stream (file-like): The seekable image stream.
+
+    Returns:
+        tuple: The image width and height.
+
+    Raises:
+        ValueError: If the stream doesn't start with a PNG header.
+    """
+    position = stream.tell()
+    header = stream.read(len(PNG_SIGNATURE) + IHDR_HEADER.size)
+    stream.seek(position)
+
+    if len(header) < len(PNG_SIGNATURE) + IHDR_HEADER.size or not header.startswith(PNG_SIGNATURE):
+        raise ValueError("File must be an image (png)")
+
+    length, chunk_type, width, height = IHDR_HEADER.unpack_from(header, len(PNG_SIGNATURE))
+    if length != 13 or chunk_type != b'IHDR' or not width or not height:
+        raise ValueError("File must be an image (png)")
+
+    return width, height
+
+def stream_size(stream):
+    """
+    Get the size of a seekable stream. The stream position is restored.
+
+    Parameters:
+        stream (file-like): The seekable stream.
+
+    Returns:
+        int: The size in bytes.
+    """
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(position)
+    return size
+
+def decode_png(data:bytes):
+    """
+    Decodes a PNG.
+
+    Parameters:
+        data (bytes): The PNG content.
+
+    Returns:
+        Image: The decoded image.
+
+    Raises:
+        ValueError: If the image can't be decoded.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Invalid image : {e}")
+
+    return image
+
+def image_mimetype(data:bytes):
+    """
+    Get the mimetype of an encoded image from its signature.
+
+    Parameters:
+        data (bytes): The encoded image, or at least its first 12 bytes.
+
+    Returns:
+        str: 'image/webp' for a WebP image, else 'image/png'.
+    """
+    return 'image/webp' if data[:4] == b'RIFF' and data[8:12] == b'WEBP' else 'image/png'
+
+def encode_png(image):
+    """
+    Encodes an image as PNG.
+
+    Parameters:
+        image (Image): The image.
+
+    Returns:
+        bytes: The PNG content.
+    """
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+def encode_image(image, image_format:str):
+    """
+    Encodes an image losslessly in a preview format.
+
+    Parameters:
+        image (Image): The image.
+        image_format (str): The format (png, webp).
+
+    Returns:
+        bytes: The encoded image.
+    """
+    if image_format == 'png':
+        return optimize_image(image)
+
+    output = BytesIO()
+    image.save(output, format='WEBP', lossless=True, quality=100, method=6)
+    return output.getvalue()
+
+def variant_kind(width:int, image_format:str, base_width:int):
+    """
+    Get the asset kind of a preview variant, the uploaded size PNG being the preview itself.
+
+    Parameters:
+        width (int): The variant width.
+        image_format (str): The variant format (png, webp).
+        base_width (int): The width of the preview.
+
+    Returns:
+        str: The asset kind.
+    """
+    if width == base_width and image_format == 'png':
+        return 'preview'
+    return f"preview_{width}_{image_format}"
+
+def preview_variants(image, widths):
+    """
+    Creates the variants of a preview : each width (nearest neighbour scaling keeps the pixel art
+    sharp) in each preview format. The PNG at the preview size is the preview itself and is not created.
+
+    Parameters:
+        image (Image): The decoded preview.
+        widths (tuple): The variants widths.
+
+    Returns:
+        dict: The content of each variant, by asset kind.
+    """
+    base_width, base_height = image.size
+
+    variants = {}
+    for width in dict.fromkeys((base_width, *widths)):
+        scaled = image if width == base_width else image.resize((width, max(1, round(base_height * width / base_width))), Image.NEAREST)
+        for image_format in PREVIEW_FORMATS:
+            kind = variant_kind(width, image_format, base_width)
+            if kind != 'preview':
+                variants[kind] = encode_image(scaled, image_format)
+
+    return variants
+
+def strip_chunks(data:bytes):
+    """
+    Removes the chunks of a PNG that are not needed to decode its pixels, without decoding it.
+
+    Parameters:
+        data (bytes): The PNG content (validated header).
+
+    Returns:
+        bytes: The stripped PNG content.
+    """
+    chunks = [PNG_SIGNATURE]
+    offset = len(PNG_SIGNATURE)
+    while offset + CHUNK_HEADER.size <= len(data):
+        length, chunk_type = CHUNK_HEADER.unpack_from(data, offset)
+        end = offset + CHUNK_HEADER.size + length + 4   # crc
+        if chunk_type in PIXEL_CHUNKS:
+            chunks.append(data[offset:end])
+        if chunk_type == b'IEND':
+            break
+        offset = end
+
+    return b''.join(chunks)
+
+def reduced_images(image):
+    """
+    Get the lossless reductions of an image : RGB if fully opaque, grayscale if all pixels are gray,
+    palette (with alpha) if it has at most 256 colors.
+
+    Parameters:
+        image (Image): The RGBA image.
+
+    Returns:
+        list: The image and its reductions.
+    """
+    images = [image]
+    opaque = image.getextrema()[3] == (255, 255)
+    if opaque:
+        images.append(image.convert('RGB'))
+
+    red, green, blue, _ = image.split()
+    if red.tobytes() == green.tobytes() == blue.tobytes():
+        images.append(red if opaque else Image.merge('LA', (red, image.getchannel('A'))))
+
+    colors = image.getcolors(256)
+    if colors:
+        palette = sorted(color for _, color in colors)
+        palette.sort(key=lambda color: color[3] == 255)   # transparent colors first : shorter tRNS chunk
+        indexes = {color: index for index, color in enumerate(palette)}
+
+        paletted = Image.new('P', image.size)
+        paletted.putdata([indexes[color] for color in image.getdata()])
+        paletted.putpalette(b''.join(bytes(color) for color in palette), rawmode='RGBA')
+        images.append(paletted)
+
+    return images
+
+def optimize_image(image, original:bytes=None):
+    """
+    Encodes an image as the smallest PNG with exactly the same pixels : each lossless reduction
+    of the image is encoded with each zlib strategy at max compression, and checked once decoded.
+
+    Parameters:
+        image (Image): The decoded image.
+        original (bytes, optional): The content the image was decoded from, kept (without its
+            ancillary chunks) if it is already the smallest.
+
+    Returns:
+        bytes: The PNG content.
+    """
+    if image.mode not in ('1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA'):   # 16 bits images : can't be reduced without loss
+        return strip_chunks(original) if original else encode_png(image)
+
+    rgba = image.convert('RGBA')
+    pixels = rgba.tobytes()
+
+    stripped = strip_chunks(original) if original else None
+    candidates = [stripped] if stripped else []
+    for reduced in reduced_images(rgba):
+        for strategy in ZLIB_STRATEGIES:
+            output = BytesIO()
+            reduced.save(output, format='PNG', optimize=True, compress_type=strategy)
+            candidates.append(output.getvalue())
+
+    for candidate in sorted(candidates, key=len):
+        if candidate is stripped or decode_png(candidate).convert('RGBA').tobytes() == pixels:
+            return candidate
+
+    return encode_png(image)
+
+def optimize_png(data:bytes, image=None):
+    """
+    Optimizes a PNG losslessly : ancillary chunks are stripped, and it is re-encoded if a smaller
+    encoding with the same pixels is found.
+
+    Parameters:
+        data (bytes): The PNG content (validated header).
+        image (Image, optional): The decoded content, if already decoded.
+
+    Returns:
+        bytes: The optimized PNG content.
+    """
+    return optimize_image(image or decode_png(data), data)
+
+def fits(size, field):
+    """
+    Checks if image dimensions are within the size of a cosmetic image field.
+
+    Parameters:
+        size (tuple): The image width and height.
+        field (ImageField): The image field.
+
+    Returns:
+        bool: True if the image doesn't have to be resized.
+    """
+    return not field.size or (size[0] <= field.size['width'] and size[1] <= field.size['height'])
+
+def fit_image(image, field):
+    """
+    Resizes an image to the size of a cosmetic image field, like the image fields do on save.
+
+    Parameters:
+        image (Image): The decoded image.
+        field (ImageField): The image field.
+
+    Returns:
+        Image: The image, resized if it's bigger than the field size.
+    """
+    if fits(image.size, field):
+        return image
+
+    size = (field.size['width'], field.size['height'])
+    if field.size['force']:
+        return ImageOps.fit(image, size, Image.LANCZOS)
+
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    return image
+
+def prepare_image(data:bytes, field):
+    """
+    Prepares an uploaded PNG (validated header) to be stored : resized to the image field size
+    if needed, and losslessly optimized.
+
+    Parameters:
+        data (bytes): The uploaded PNG content.
+        field (ImageField): The cosmetic image field.
+
+    Returns:
+        bytes: The PNG content to store.
+    """
+    image = decode_png(data)
+    if fits(image.size, field):
+        return optimize_png(data, image)
+
+    return optimize_image(fit_image(image, field))
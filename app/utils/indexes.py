@@ -0,0 +1,119 @@
+INDEX_OPTIONS = ('unique', 'sparse', 'partialFilterExpression', 'expireAfterSeconds')
+
+
+def get_collection(document):
+    """
+    Get the raw collection of a document, without the indexes auto creation of mongoengine.
+
+    Parameters:
+        document (Document): The document class.
+
+    Returns:
+        Collection: The pymongo collection.
+    """
+    return document._get_db()[document._get_collection_name()]
+
+def index_key(fields):
+    """
+    Normalizes index fields to compare declared and existing indexes.
+
+    Parameters:
+        fields (list): The (field, direction) pairs.
+
+    Returns:
+        tuple: The hashable index key.
+    """
+    return tuple((field, direction) for field, direction in fields)
+
+def index_options(spec):
+    """
+    Get the options of an index which change its behavior (disabled options are ignored).
+
+    Parameters:
+        spec (dict): The declared index spec or the existing index informations.
+
+    Returns:
+        dict: The index options.
+    """
+    return {option: spec[option] for option in INDEX_OPTIONS if spec.get(option) is not None and spec[option] is not False}
+
+def reconcile_indexes(document, drop:bool=False, dry_run:bool=False):
+    """
+    Creates the missing indexes of a document, and recreates the ones declared with other options.
+    Indexes not declared by the document are only dropped if asked.
+
+    Parameters:
+        document (Document): The document class.
+        drop (bool, optional): Whether to drop the undeclared / outdated indexes. Defaults to False.
+        dry_run (bool, optional): Only report the changes. Defaults to False.
+
+    Returns:
+        list: The (action, index description) changes, action being create, drop, extra or outdated.
+    """
+    collection = get_collection(document)
+    existing = {index_key(info['key']): (name, info) for name, info in collection.index_information().items() if name != '_id_'}
+
+    changes = []
+    for spec in document._meta['index_specs']:
+        options = index_options(spec)
+        key = index_key(spec['fields'])
+        description = f"{collection.name} {list(key)} {options or ''}".rstrip()
+
+        if key in existing:
+            name, info = existing.pop(key)
+            if index_options(info) == options:
+                continue
+
+            # same fields but other options : must be dropped to be recreated
+            if not drop:
+                changes.append(('outdated', description))
+                continue
+            changes.append(('drop', f"{collection.name} {name}"))
+            if not dry_run:
+                collection.drop_index(name)
+
+        changes.append(('create', description))
+        if not dry_run:
+            collection.create_index(spec['fields'], **options)
+
+    for name, _ in existing.values():
+        changes.append(('drop' if drop else 'extra', f"{collection.name} {name}"))
+        if drop and not dry_run:
+            collection.drop_index(name)
+
+    return changes
+
+def plan_stages(plan):
+    """
+    Lists the stages of a query plan, with the index of the index scans.
+
+    Parameters:
+        plan (dict | list): The explain output, or one of its parts.
+
+    Returns:
+        list: The stages names (IXSCAN stages as "IXSCAN <index name>").
+    """
+    stages = []
+    if isinstance(plan, list):
+        for part in plan:
+            stages += plan_stages(part)
+    elif isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(f"{plan['stage']} {plan['indexName']}" if 'indexName' in plan else plan['stage'])
+        for key, value in plan.items():
+            if key not in ('rejectedPlans', 'executionStats'):   # only the winning plan
+                stages += plan_stages(value)
+
+    return stages
+
+def explain_query(queryset):
+    """
+    Get the winning plan stages of a query.
+
+    Parameters:
+        queryset (QuerySet): The query.
+
+    Returns:
+        list: The stages names, see plan_stages.
+    """
+    return plan_stages(queryset.explain()['queryPlanner']['winningPlan'])
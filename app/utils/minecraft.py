@@ -1,12 +1,194 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
 from mojang import API, errors
-from functools import lru_cache
+from threading import Lock
+import requests
+import time
+
+from utils.cache import TTLCache
+
+
+class BulkUUIDResolver:
+    """
+    Resolves usernames to uuids with the Mojang bulk endpoint (up to 10 usernames per request).
+
+    Concurrent lookups arriving within a short window are merged : the first caller of a batch
+    waits for the window, then sends the bulk request and hands the results to the other callers.
+    A batch is closed once full, the next lookups start a new one.
+    """
+    BATCH_SIZE = 10
+
+    def __init__(self, api_url:str='https://api.mojang.com', window:float=0.005, timeout:float=5):
+        self.api_url = api_url
+        self.window = window
+        self.timeout = timeout
+
+        self._pending = {}   # username -> Future
+        self._batch = []
+        self._lock = Lock()
+
+    def resolve(self, usernames):
+        """
+        Resolves usernames with as few bulk requests as possible.
+
+        Parameters:
+            usernames (list): The usernames to resolve.
+
+        Returns:
+            dict: The undashed uuid of each username (lowercase), None if not found.
+
+        Raises:
+            requests.RequestException: If the Mojang API is unreachable or returns an error.
+        """
+        usernames = list(dict.fromkeys(username.lower() for username in usernames))
+        result = dict.fromkeys(usernames)
+
+        for i in range(0, len(usernames), self.BATCH_SIZE):
+            response = requests.post(f"{self.api_url}/profiles/minecraft", json=usernames[i:i + self.BATCH_SIZE], timeout=self.timeout)
+            response.raise_for_status()
+
+            for profile in response.json():
+                result[profile['name'].lower()] = profile['id']
+
+        return result
+
+    def get_uuid(self, username:str):
+        """
+        Resolves a username, merged with the concurrent lookups into bulk requests.
+
+        Parameters:
+            username (str): The username to resolve.
+
+        Returns:
+            str: The undashed uuid of the username.
+            None: If the username is not found.
+
+        Raises:
+            requests.RequestException: If the Mojang API is unreachable, returns an error or times out.
+        """
+        username = username.lower()
+
+        with self._lock:
+            future = self._pending.get(username)
+            leader = future is None and not self._batch   # first lookup of a new batch
+            if future is None:
+                future = self._pending[username] = Future()
+                batch = self._batch
+                batch.append(username)
+                if len(batch) == self.BATCH_SIZE:   # full : a single bulk request per batch
+                    self._batch = []
+
+        if leader:
+            time.sleep(self.window)   # let concurrent lookups join the batch
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = []
+
+            try:
+                result = self.resolve(batch)
+            except Exception as e:
+                result = None
+                error = e
+
+            with self._lock:
+                for name in batch:
+                    pending = self._pending.pop(name)
+                    if result is None:
+                        pending.set_exception(error)
+                    else:
+                        pending.set_result(result[name])
+
+        try:
+            return future.result(timeout=self.window + self.timeout * 2)
+        except FutureTimeoutError:
+            raise requests.Timeout("Mojang bulk lookup timed out")
 
 
 class Mojang:
     def __init__(self):
         self.api = API()
+        self.bulk = BulkUUIDResolver()
+
+        # lookups cache
+        self.cache = TTLCache(maxsize=1024)
+        self.ttl = 3600   # found lookups
+        self.negative_ttl = 300   # not found lookups
+        self.lookups = None   # shared lookups collection
+
+    def init_app(self, app):
+        """
+        Configures the lookups cache from the app config.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        self.cache = TTLCache(maxsize=app.config['MOJANG_CACHE_SIZE'])
+        self.ttl = app.config['MOJANG_CACHE_TTL']
+        self.negative_ttl = app.config['MOJANG_NEGATIVE_CACHE_TTL']
+        self.bulk = BulkUUIDResolver(app.config['MOJANG_API_URL'], app.config['MOJANG_BULK_WINDOW'] / 1000, app.config['MOJANG_TIMEOUT'])
+
+        if app.config['MOJANG_SHARED_CACHE']:
+            from models.mojang import MojangLookup
+            self.lookups = MojangLookup
+
+    def get_cached(self, key:str):
+        """
+        Get a lookup result from the worker cache, then from the shared lookups collection if enabled.
+
+        Parameters:
+            key (str): The lookup key.
+
+        Returns:
+            tuple: Whether the lookup is cached, and its result.
+        """
+        found, value = self.cache.get(key)
+        if found or not self.lookups:
+            return found, value
+
+        now = datetime.now(timezone.utc)
+        shared = self.lookups.objects(key=key).as_pymongo().first()
+        if not shared or shared['expires_at'].replace(tzinfo=timezone.utc) <= now:
+            return False, None
+
+        self.cache.set(key, shared['value'], (shared['expires_at'].replace(tzinfo=timezone.utc) - now).total_seconds())
+        return True, shared['value']
+
+    def set_cached(self, key:str, value):
+        """
+        Cache a lookup result in the worker cache and the shared lookups collection if enabled.
+        Not found results (None) are cached for a shorter time.
+
+        Parameters:
+            key (str): The lookup key.
+            value (Any): The lookup result.
+        """
+        ttl = self.ttl if value is not None else self.negative_ttl
+
+        self.cache.set(key, value, ttl)
+        if self.lookups:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+            self.lookups.objects(key=key).update_one(set__value=value, set__expires_at=expires_at, upsert=True)
+
+    def cached(self, key:str, lookup):
+        """
+        Get a lookup result from the caches, else run the lookup and cache its result.
+
+        Parameters:
+            key (str): The lookup key.
+            lookup (function): The function calling the Mojang API, returning None if not found.
+
+        Returns:
+            Any: The lookup result.
+        """
+        found, value = self.get_cached(key)
+        if found:
+            return value
+
+        value = lookup()
+        self.set_cached(key, value)
+
+        return value
 
-    @lru_cache(maxsize=200)
     def get_uuid(self, username:str):
         """
         Get the UUID associated with a given username from the Mojang API.
@@ -18,49 +200,88 @@ class Mojang:
             str: The UUID associated with the username.
             None: If the username is not found.
         """
-        try:
-            uuid = self.api.get_uuid(username)
-        except errors.NotFound:
-            return None
-        
-        return uuid
+        return self.cached(f"uuid:{username.lower()}", lambda: self.bulk.get_uuid(username))
+
+    def get_uuids(self, usernames):
+        """
+        Get the UUIDs associated with many usernames, resolving the uncached ones with bulk requests.
+
+        Parameters:
+            usernames (list): The usernames to lookup the UUIDs for.
+
+        Returns:
+            dict: The UUID associated with each username (lowercase), None if not found.
+        """
+        result = {}
+        missing = []
+        for username in dict.fromkeys(username.lower() for username in usernames):
+            found, uuid = self.get_cached(f"uuid:{username}")
+            if found:
+                result[username] = uuid
+            else:
+                missing.append(username)
+
+        if missing:
+            for username, uuid in self.bulk.resolve(missing).items():
+                self.set_cached(f"uuid:{username}", uuid)
+                result[username] = uuid
+
+        return result
 
-    @lru_cache(maxsize=200)
     def get_username(self, uuid:str):
         """
         Get mojang username by uuid
-        
+
         Parameters:
             uuid (str): The UUID to lookup the username for.
-        
+
         Returns:
             str: The username associated with the UUID.
             None: If the UUID is not found.
         """
-        try:
-            username = self.api.get_username(uuid)
-        except errors.NotFound:
-            return None
-        
-        return username
+        def lookup():
+            try:
+                return self.api.get_username(uuid)
+            except errors.NotFound:
+                return None
+
+        return self.cached(f"username:{normalize_uuid(uuid)}", lookup)
 
-    @lru_cache(maxsize=200)
     def get_profile(self, uuid:str):
         """
         Get mojang profile by uuid
-        
+
         Parameters:
             uuid (str): The UUID to get the profile for.
-        
+
         Returns:
             dict: The profile information including UUID, username, cape URL, and skin URL.
             None: If the profile is not found.
         """
-        profile = self.api.get_profile(uuid)
+        def lookup():
+            try:
+                profile = self.api.get_profile(uuid)
+            except errors.NotFound:
+                return None
+
+            return None if not profile else {
+                'uuid': profile.id,
+                'username': profile.name,
+                'cape_url': profile.cape_url,
+                'skin_url': profile.skin_url
+            }
+
+        return self.cached(f"profile:{normalize_uuid(uuid)}", lookup)
+
+
+def normalize_uuid(uuid):
+    """
+    Normalizes an uuid (object, dashed or undashed string) to use it as a cache key.
+
+    Parameters:
+        uuid (UUID | str): The uuid.
 
-        return None if not profile else {
-            'uuid': profile.id,
-            'username': profile.name,
-            'cape_url': profile.cape_url,
-            'skin_url': profile.skin_url
-        }
\ No newline at end of file
+    Returns:
+        str: The undashed lowercase uuid.
+    """
+    return str(uuid).replace('-', '').lower()
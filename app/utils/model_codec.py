@@ -0,0 +1,286 @@
+from struct import Struct, error as StructError
+import struct
+
+
+# compact binary form of the accessory models (JSON values), little endian
+MODEL_MIMETYPE = 'application/vnd.cosmostic.model'
+MODEL_MAGIC = b'CSM\x01'   # format version 1
+
+# value tags
+NULL, FALSE, TRUE, INTEGER, FLOAT, STRING, ARRAY, OBJECT, NUMBERS = range(9)
+
+FLOAT64 = Struct('<d')
+# typed numbers array item types, smallest first : int8, int16, int32, int64, float32, float64
+INTEGER_TYPES = ('b', 'h', 'i', 'q')
+FLOAT_TYPES = ('f', 'd')
+NUMBER_TYPES = INTEGER_TYPES + FLOAT_TYPES
+HAS_INTEGERS = 0x80   # float array flag : a bitmask of the items that are integers follows
+
+
+def write_varint(output:bytearray, value:int):
+    """
+    Writes an unsigned integer as a LEB128 varint.
+
+    Parameters:
+        output (bytearray): The output buffer.
+        value (int): The unsigned integer.
+    """
+    while value > 0x7f:
+        output.append(value & 0x7f | 0x80)
+        value >>= 7
+    output.append(value)
+
+def read_varint(data:bytes, offset:int):
+    """
+    Reads a LEB128 varint.
+
+    Parameters:
+        data (bytes): The encoded model.
+        offset (int): The varint position.
+
+    Returns:
+        tuple: The unsigned integer and the position after it.
+    """
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def number_type(values:list):
+    """
+    Finds the smallest item type packing a numbers array exactly.
+
+    Parameters:
+        values (list): The array, only made of numbers.
+
+    Returns:
+        str: The struct item type.
+        None: If the numbers can't be packed exactly (integers out of range or not representable as floats).
+    """
+    if all(type(value) is int for value in values):
+        low, high = min(values), max(values)
+        for item_type in INTEGER_TYPES:
+            bits = struct.calcsize(item_type) * 8 - 1
+            if -(1 << bits) <= low and high < (1 << bits):
+                return item_type
+        return None
+
+    for item_type in FLOAT_TYPES:
+        try:
+            packed = struct.pack(f'<{len(values)}{item_type}', *values)
+        except (StructError, OverflowError):
+            continue
+        if all(a == b or a != a for a, b in zip(struct.unpack(f'<{len(values)}{item_type}', packed), values)):   # nan != nan
+            return item_type
+    return None
+
+def write_value(output:bytearray, value):
+    """
+    Writes a JSON value with its tag.
+
+    Parameters:
+        output (bytearray): The output buffer.
+        value: The decoded JSON value.
+
+    Raises:
+        TypeError: If the value is not a JSON value.
+    """
+    if value is None:
+        output.append(NULL)
+    elif value is False or value is True:
+        output.append(TRUE if value else FALSE)
+    elif type(value) is int:
+        output.append(INTEGER)
+        write_varint(output, value << 1 if value >= 0 else (-value << 1) - 1)   # zigzag
+    elif type(value) is float:
+        output.append(FLOAT)
+        output += FLOAT64.pack(value)
+    elif isinstance(value, str):
+        output.append(STRING)
+        write_string(output, value)
+    elif isinstance(value, list):
+        item_type = number_type(value) if value and all(type(item) in (int, float) for item in value) else None
+        if item_type:
+            write_numbers(output, value, item_type)
+        else:
+            output.append(ARRAY)
+            write_varint(output, len(value))
+            for item in value:
+                write_value(output, item)
+    elif isinstance(value, dict):
+        output.append(OBJECT)
+        write_varint(output, len(value))
+        for key, item in value.items():
+            write_string(output, key)
+            write_value(output, item)
+    else:
+        raise TypeError(f"Unsupported model value : {type(value).__name__}")
+
+def write_string(output:bytearray, value:str):
+    """
+    Writes a string : length varint followed by its utf-8 content.
+
+    Parameters:
+        output (bytearray): The output buffer.
+        value (str): The string.
+    """
+    data = value.encode()
+    write_varint(output, len(data))
+    output += data
+
+def write_numbers(output:bytearray, values:list, item_type:str):
+    """
+    Writes a numbers array as a typed buffer : count varint, item type, integers bitmask (floats
+    mixed with integers only), then the packed items.
+
+    Parameters:
+        output (bytearray): The output buffer.
+        values (list): The numbers.
+        item_type (str): The struct item type.
+    """
+    integers = item_type in FLOAT_TYPES and any(type(value) is int for value in values)
+
+    output.append(NUMBERS)
+    write_varint(output, len(values))
+    output.append(NUMBER_TYPES.index(item_type) | (HAS_INTEGERS if integers else 0))
+    if integers:
+        mask = bytearray((len(values) + 7) // 8)
+        for i, value in enumerate(values):
+            if type(value) is int:
+                mask[i >> 3] |= 1 << (i & 7)
+        output += mask
+    output += struct.pack(f'<{len(values)}{item_type}', *values)
+
+def read_value(data:bytes, offset:int):
+    """
+    Reads a tagged JSON value.
+
+    Parameters:
+        data (bytes): The encoded model.
+        offset (int): The value position.
+
+    Returns:
+        tuple: The decoded value and the position after it.
+
+    Raises:
+        ValueError: If the tag is unknown.
+    """
+    tag = data[offset]
+    offset += 1
+
+    if tag == NULL:
+        return None, offset
+    if tag == FALSE or tag == TRUE:
+        return tag == TRUE, offset
+    if tag == INTEGER:
+        value, offset = read_varint(data, offset)
+        return (value >> 1) ^ -(value & 1), offset   # zigzag
+    if tag == FLOAT:
+        return FLOAT64.unpack_from(data, offset)[0], offset + FLOAT64.size
+    if tag == STRING:
+        return read_string(data, offset)
+    if tag == ARRAY:
+        count, offset = read_varint(data, offset)
+        values = []
+        for _ in range(count):
+            value, offset = read_value(data, offset)
+            values.append(value)
+        return values, offset
+    if tag == OBJECT:
+        count, offset = read_varint(data, offset)
+        values = {}
+        for _ in range(count):
+            key, offset = read_string(data, offset)
+            values[key], offset = read_value(data, offset)
+        return values, offset
+    if tag == NUMBERS:
+        return read_numbers(data, offset)
+
+    raise ValueError(f"Unknown model value tag : {tag}")
+
+def read_string(data:bytes, offset:int):
+    """
+    Reads a string.
+
+    Parameters:
+        data (bytes): The encoded model.
+        offset (int): The string position.
+
+    Returns:
+        tuple: The string and the position after it.
+    """
+    length, offset = read_varint(data, offset)
+    return data[offset:offset + length].decode(), offset + length
+
+def read_numbers(data:bytes, offset:int):
+    """
+    Reads a typed numbers array.
+
+    Parameters:
+        data (bytes): The encoded model.
+        offset (int): The array position, after its tag.
+
+    Returns:
+        tuple: The numbers list and the position after it.
+    """
+    count, offset = read_varint(data, offset)
+    flags = data[offset]
+    offset += 1
+
+    mask = None
+    if flags & HAS_INTEGERS:
+        mask = data[offset:offset + (count + 7) // 8]
+        offset += len(mask)
+
+    items = Struct(f'<{count}{NUMBER_TYPES[flags & ~HAS_INTEGERS]}')
+    values = list(items.unpack_from(data, offset))
+    if mask:
+        for i in range(count):
+            if mask[i >> 3] & (1 << (i & 7)):
+                values[i] = int(values[i])
+
+    return values, offset + items.size
+
+def pack_model(model:dict):
+    """
+    Encodes an accessory model in its compact binary form. Arrays only made of numbers are packed
+    as typed little endian buffers (smallest exact item type), other values are tagged.
+
+    Parameters:
+        model (dict): The accessory model.
+
+    Returns:
+        bytes: The encoded model.
+    """
+    output = bytearray(MODEL_MAGIC)
+    write_value(output, model)
+    return bytes(output)
+
+def unpack_model(data:bytes):
+    """
+    Decodes an accessory model from its compact binary form.
+
+    Parameters:
+        data (bytes): The encoded model.
+
+    Returns:
+        dict: The accessory model.
+
+    Raises:
+        ValueError: If the data is not an encoded model.
+    """
+    if not data.startswith(MODEL_MAGIC):
+        raise ValueError("Not an encoded model")
+
+    try:
+        model, offset = read_value(data, len(MODEL_MAGIC))
+    except (IndexError, StructError, UnicodeDecodeError) as e:
+        raise ValueError(f"Truncated or corrupted model : {e}")
+
+    if offset != len(data):
+        raise ValueError("Trailing data after the model")
+    return model
@@ -0,0 +1,31 @@
+from flask import g, has_app_context
+from pymongo import monitoring
+
+
+# commands reading or writing documents (index creation, handshakes... aren't counted)
+QUERY_COMMANDS = {'find', 'getMore', 'aggregate', 'count', 'distinct', 'insert', 'update', 'delete', 'findAndModify'}
+
+
+class QueryCounter(monitoring.CommandListener):
+    """
+    Counts the database queries sent within the current app context (request).
+    Registered as an event listener of the database clients.
+    """
+    def started(self, event):
+        if event.command_name in QUERY_COMMANDS and has_app_context():
+            g.query_count = g.get('query_count', 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def count(self):
+        """
+        Get the number of queries sent within the current app context.
+
+        Returns:
+            int: The number of queries.
+        """
+        return g.get('query_count', 0)
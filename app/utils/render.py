@@ -0,0 +1,220 @@
+from math import cos, radians, sin, sqrt
+from PIL import Image
+import numpy as np
+
+
+# isometric camera : looking at the front (-z), right (-x) and top (+y) faces from 30 degrees above the horizon
+VIEW = np.array([-1, sqrt(2) * np.tan(np.pi / 6), -1]) / np.linalg.norm([-1, sqrt(2) * np.tan(np.pi / 6), -1])
+SCREEN_RIGHT = np.cross(-VIEW, (0, 1, 0)) / np.linalg.norm(np.cross(-VIEW, (0, 1, 0)))
+SCREEN_UP = np.cross(SCREEN_RIGHT, -VIEW)
+LIGHT = np.array([-0.4, 1, -0.7]) / np.linalg.norm([-0.4, 1, -0.7])
+
+UNTEXTURED_COLOR = (160, 160, 160, 255)   # boxes of accessories without texture
+MARGIN = 0.05   # preview border, in fraction of its size
+
+# box faces, in the Minecraft box uv layout :
+# - uv key : per face uv rect (u1, v1, u2, v2) overriding the layout,
+# - normal : outward direction,
+# - corner, s, t : face origin and edges in box sizes, s and t following the texture right and down,
+# - u, v, width, height : texture region offset from the box texture offset and size, as (w, h, d) coefficients.
+FACES = (
+    ('uvNorth', (0, 0, -1), (1, 1, 0), (-1, 0, 0), (0, -1, 0), (0, 0, 1), (0, 0, 1), (1, 0, 0), (0, 1, 0)),
+    ('uvSouth', (0, 0, 1), (0, 1, 1), (1, 0, 0), (0, -1, 0), (1, 0, 2), (0, 0, 1), (1, 0, 0), (0, 1, 0)),
+    ('uvWest', (-1, 0, 0), (0, 1, 0), (0, 0, 1), (0, -1, 0), (0, 0, 0), (0, 0, 1), (0, 0, 1), (0, 1, 0)),
+    ('uvEast', (1, 0, 0), (1, 1, 1), (0, 0, -1), (0, -1, 0), (1, 0, 1), (0, 0, 1), (0, 0, 1), (0, 1, 0)),
+    ('uvUp', (0, 1, 0), (1, 1, 1), (-1, 0, 0), (0, 0, -1), (0, 0, 1), (0, 0, 0), (1, 0, 0), (0, 0, 1)),
+    ('uvDown', (0, -1, 0), (1, 0, 0), (-1, 0, 0), (0, 0, 1), (1, 0, 1), (0, 0, 0), (1, 0, 0), (0, 0, 1))
+)
+
+
+def numbers(value, count:int):
+    """
+    Reads a fixed size list of numbers from a model value.
+
+    Parameters:
+        value: The model value.
+        count (int): The expected number of items.
+
+    Returns:
+        ndarray: The numbers.
+        None: If the value is not a list of count finite numbers.
+    """
+    if isinstance(value, list) and len(value) == count and all(type(item) in (int, float) for item in value):
+        array = np.array(value, dtype=float)
+        if np.isfinite(array).all():   # NaN and Infinity are accepted by the JSON parser
+            return array
+    return None
+
+def rotation_matrix(angles):
+    """
+    Creates the rotation matrix of euler angles, applied in z, y, x order.
+
+    Parameters:
+        angles (ndarray): The x, y and z angles in degrees.
+
+    Returns:
+        ndarray: The 3x3 rotation matrix.
+    """
+    x, y, z = (radians(angle) for angle in angles)
+    rx = np.array([[1, 0, 0], [0, cos(x), -sin(x)], [0, sin(x), cos(x)]])
+    ry = np.array([[cos(y), 0, sin(y)], [0, 1, 0], [-sin(y), 0, cos(y)]])
+    rz = np.array([[cos(z), -sin(z), 0], [sin(z), cos(z), 0], [0, 0, 1]])
+    return rx @ ry @ rz
+
+def collect_faces(part, matrix, offset, faces:list):
+    """
+    Collects the faces of the boxes of a model part and of its children, in model space.
+
+    Parts can be OptiFine JEM parts (boxes with coordinates, textureOffset, sizeAdd and per face
+    uvs, submodels, translate, rotate, invertAxis) or Bedrock bones (cubes with origin, size, uv
+    and inflate, pivot, rotation). Unknown or malformed values are ignored.
+
+    Parameters:
+        part (dict): The model part.
+        matrix (ndarray): The parent parts linear transform.
+        offset (ndarray): The parent parts translation.
+        faces (list): The collected faces (origin, s edge, t edge, normal, uv rect).
+    """
+    if not isinstance(part, dict):
+        return
+
+    zero = np.zeros(3)
+    flip = np.diag([-1.0 if axis in str(part.get('invertAxis', '')) else 1.0 for axis in 'xyz'])
+    rotation = rotation_matrix(next((angles for angles in (numbers(part.get('rotate'), 3), numbers(part.get('rotation'), 3)) if angles is not None), zero))
+    pivot = numbers(part.get('pivot'), 3)
+    pivot = zero if pivot is None else pivot
+    translate = numbers(part.get('translate'), 3)
+    translate = zero if translate is None else translate
+
+    # local point p : rotation (flip p - pivot) + pivot + translate, then the parent transform
+    offset = matrix @ (pivot - rotation @ pivot + translate) + offset
+    matrix = matrix @ rotation @ flip
+
+    boxes = part.get('boxes', part.get('cubes'))
+    for box in boxes if isinstance(boxes, list) else []:
+        if not isinstance(box, dict):
+            continue
+
+        coordinates = numbers(box.get('coordinates'), 6)
+        if coordinates is not None:
+            origin, size = coordinates[:3], coordinates[3:]
+        else:
+            origin, size = numbers(box.get('origin'), 3), numbers(box.get('size'), 3)
+            if origin is None or size is None:
+                continue
+
+        texture_offset = next((uv for uv in (numbers(box.get('textureOffset'), 2), numbers(box.get('uv'), 2)) if uv is not None), np.zeros(2))
+        inflate = next((value for value in (box.get('sizeAdd'), box.get('inflate')) if type(value) in (int, float) and np.isfinite(value)), 0)
+        box_origin, box_size = origin - inflate, size + 2 * inflate
+
+        for uv_key, normal, corner, s, t, u, v, width, height in FACES:
+            uv_rect = numbers(box.get(uv_key), 4)
+            if uv_rect is None:   # box uv layout, from the size before inflating
+                start = texture_offset + (np.dot(u, size), np.dot(v, size))
+                uv_rect = np.concatenate((start, start + (np.dot(width, size), np.dot(height, size))))
+
+            faces.append((
+                matrix @ (box_origin + np.multiply(corner, box_size)) + offset,
+                matrix @ np.multiply(s, box_size),
+                matrix @ np.multiply(t, box_size),
+                matrix @ np.array(normal, dtype=float),
+                uv_rect
+            ))
+
+    children = part.get('submodels', [])
+    children = [part['submodel'], *children] if isinstance(part.get('submodel'), dict) and isinstance(children, list) else children
+    for child in children if isinstance(children, list) else []:
+        collect_faces(child, matrix, offset, faces)
+
+def render_preview(model:dict, texture=None, size:tuple=(150, 150)):
+    """
+    Renders an isometric preview of an accessory model with its texture.
+
+    The box faces are transformed, culled and projected all at once, then each visible face is
+    rasterized on its screen bounding box with NumPy : inverse affine mapping of the pixel centers
+    to the face, nearest texel sampling, alpha test and depth test.
+
+    Parameters:
+        model (dict): The accessory model (validated).
+        texture (Image, optional): The accessory texture. Defaults to untextured boxes.
+        size (tuple, optional): The preview width and height. Defaults to (150, 150).
+
+    Returns:
+        Image: The RGBA preview.
+        None: If the model has no visible box (or only boxes without area).
+    """
+    faces = []
+    with np.errstate(over='ignore', invalid='ignore'):   # faces overflowing the floats range are dropped below
+        for part in model.get('models', []):
+            collect_faces(part, np.eye(3), np.zeros(3), faces)
+    if not faces:
+        return None
+
+    origins, s_edges, t_edges, normals, uv_rects = (np.array(values) for values in zip(*faces))
+    finite = np.isfinite(np.concatenate((origins, s_edges, t_edges, normals, uv_rects), axis=1)).all(axis=1)
+    origins, s_edges, t_edges, normals, uv_rects = origins[finite], s_edges[finite], t_edges[finite], normals[finite], uv_rects[finite]
+
+    # back faces culling and flat shading
+    visible = normals @ VIEW > 1e-6
+    if not visible.any():
+        return None
+    origins, s_edges, t_edges, uv_rects = origins[visible], s_edges[visible], t_edges[visible], uv_rects[visible]
+    shades = 0.4 + 0.6 * np.clip(normals[visible] @ LIGHT, 0, 1)
+
+    # screen projection (x right, y down, depth towards the camera)
+    axes = np.stack((SCREEN_RIGHT, -SCREEN_UP, VIEW), axis=1)
+    origins, s_edges, t_edges = origins @ axes, s_edges @ axes, t_edges @ axes
+
+    # fit the model in the preview
+    corners = np.concatenate((origins, origins + s_edges, origins + t_edges, origins + s_edges + t_edges))[:, :2]
+    low, high = corners.min(axis=0), corners.max(axis=0)
+    width, height = size
+    scale = min(width, height) * (1 - 2 * MARGIN) / max((high - low).max(), 1e-6)
+    center = (np.array(size) - (high - low) * scale) / 2
+    origins[:, :2] = (origins[:, :2] - low) * scale + center
+    s_edges[:, :2] *= scale
+    t_edges[:, :2] *= scale
+
+    if texture is not None:
+        texels = np.asarray(texture.convert('RGBA'))
+        texture_size = numbers(model.get('textureSize'), 2)
+        texel_scale = np.array(texels.shape[1::-1]) / (texture_size if texture_size is not None and texture_size.all() else texels.shape[1::-1])
+    else:
+        texels = np.array(UNTEXTURED_COLOR, dtype=np.uint8).reshape(1, 1, 4)
+        texel_scale = np.zeros(2)
+
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    depths = np.full((height, width), -np.inf)
+
+    for origin, s_edge, t_edge, uv_rect, shade in zip(origins, s_edges, t_edges, uv_rects, shades):
+        determinant = s_edge[0] * t_edge[1] - s_edge[1] * t_edge[0]
+        if abs(determinant) < 1e-9:   # seen edge-on
+            continue
+
+        quad = np.array((origin[:2], origin[:2] + s_edge[:2], origin[:2] + t_edge[:2], origin[:2] + s_edge[:2] + t_edge[:2]))
+        x0, y0 = np.clip(np.floor(quad.min(axis=0)).astype(int), 0, None)
+        x1, y1 = np.minimum(np.ceil(quad.max(axis=0)).astype(int), (width, height))
+        if x0 >= x1 or y0 >= y1:
+            continue
+
+        # face coordinates (s, t) of the pixel centers
+        ys, xs = np.mgrid[y0:y1, x0:x1] + 0.5
+        dx, dy = xs - origin[0], ys - origin[1]
+        s = (dx * t_edge[1] - dy * t_edge[0]) / determinant
+        t = (dy * s_edge[0] - dx * s_edge[1]) / determinant
+        inside = (s >= 0) & (s < 1) & (t >= 0) & (t < 1)
+        depth = origin[2] + s * s_edge[2] + t * t_edge[2]
+
+        # nearest texel
+        u = np.clip(((uv_rect[0] + s * (uv_rect[2] - uv_rect[0])) * texel_scale[0]).astype(int), 0, texels.shape[1] - 1)
+        v = np.clip(((uv_rect[1] + t * (uv_rect[3] - uv_rect[1])) * texel_scale[1]).astype(int), 0, texels.shape[0] - 1)
+        colors = texels[v, u]
+
+        mask = inside & (colors[..., 3] > 0) & (depth > depths[y0:y1, x0:x1])
+        depths[y0:y1, x0:x1][mask] = depth[mask]
+        pixels[y0:y1, x0:x1][mask] = np.concatenate((colors[..., :3] * shade, colors[..., 3:]), axis=-1)[mask].astype(np.uint8)
+
+    if not (depths > -np.inf).any():   # nothing drawn
+        return None
+
+    return Image.fromarray(pixels, 'RGBA')
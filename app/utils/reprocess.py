@@ -0,0 +1,114 @@
+from models.cosmetics import Cape, Accessory
+from utils.commons import content_hash, create_cape_preview, encode_model, model_hash
+from utils.images import decode_png, fit_image, fits, optimize_image, optimize_png, preview_variants
+from utils.render import render_preview
+
+
+def cape_assets(texture:bytes, widths):
+    """
+    Creates the assets of a cape from its texture (validated header). The texture is decoded
+    once to create the preview and its variants, resized if needed, and losslessly optimized.
+
+    Parameters:
+        texture (bytes): The cape texture.
+        widths (tuple): The preview variants widths.
+
+    Returns:
+        dict: The texture, preview and preview variants content.
+
+    Raises:
+        ValueError: If the texture can't be decoded.
+    """
+    image = decode_png(texture)
+    if fits(image.size, Cape.texture):
+        texture = optimize_png(texture, image)
+    else:
+        texture = optimize_image(fit_image(image, Cape.texture))
+
+    preview = fit_image(create_cape_preview(image), Cape.preview)
+
+    return {'texture': texture, 'preview': optimize_image(preview), **preview_variants(preview, widths)}
+
+def render_accessory_preview(model:dict, texture:bytes=None):
+    """
+    Renders the preview of an accessory from its model and texture.
+
+    Parameters:
+        model (dict): The accessory model.
+        texture (bytes, optional): The accessory texture. Defaults to untextured boxes.
+
+    Returns:
+        Image: The preview.
+        None: If the model has no box to render.
+
+    Raises:
+        ValueError: If the texture can't be decoded.
+    """
+    return render_preview(model, decode_png(texture) if texture else None, (Accessory.preview.size['width'], Accessory.preview.size['height']))
+
+def accessory_assets(model:dict, texture:bytes=None, preview:bytes=None, widths=()):
+    """
+    Creates the assets of an accessory from its stored ones : texture and uploaded preview resized if
+    needed and losslessly optimized, or preview rendered from the model, then the preview variants.
+
+    Parameters:
+        model (dict): The accessory model.
+        texture (bytes, optional): The accessory texture.
+        preview (bytes, optional): The uploaded preview. Defaults to a preview rendered from the model.
+        widths (tuple, optional): The preview variants widths.
+
+    Returns:
+        dict: The texture, preview and preview variants content.
+
+    Raises:
+        ValueError: If an asset can't be decoded, or the preview can't be rendered.
+    """
+    assets = {}
+    if texture:
+        image = decode_png(texture)
+        assets['texture'] = optimize_png(texture, image) if fits(image.size, Accessory.texture) else optimize_image(fit_image(image, Accessory.texture))
+
+    if preview:
+        image = decode_png(preview)
+        if fits(image.size, Accessory.preview):
+            preview = optimize_png(preview, image)
+        else:
+            image = fit_image(image, Accessory.preview)
+            preview = optimize_image(image)
+    else:
+        image = render_accessory_preview(model, assets.get('texture'))
+        if not image:
+            raise ValueError("Accessory preview is required : the model has no box to render")
+        preview = optimize_image(image)
+
+    return {**assets, 'preview': preview, **preview_variants(image, widths)}
+
+def reprocess_cosmetic(job:dict):
+    """
+    Creates again the derived assets of a cosmetic, in a worker process (no database access).
+
+    Parameters:
+        job (dict): The cosmetic type ('cape', 'accessory'), id, current hashes, source assets
+            (texture, uploaded preview), model (accessories) and preview variants widths.
+
+    Returns:
+        dict: The cosmetic type and id, the changed assets content, the model fields if they changed,
+        and the error if the assets can't be created.
+    """
+    result = {'type': job['type'], 'id': job['id'], 'assets': {}, 'model': None, 'error': None}
+    try:
+        if not job['texture'] and job['type'] == 'cape':
+            raise ValueError("The cape has no texture")
+        if job['type'] == 'cape':
+            assets = cape_assets(job['texture'], job['widths'])
+        else:
+            assets = accessory_assets(job['model'], job['texture'], job['preview'], job['widths'])
+    except Exception as e:   # reported, without stopping the other cosmetics
+        result['error'] = str(e) or type(e).__name__
+        return result
+
+    result['assets'] = {kind: data for kind, data in assets.items() if job['hashes'].get(kind) != content_hash(data)}
+    if job['type'] == 'accessory' and (job['hashes'].get('model') != model_hash(job['model']) or not job['model_stored']):
+        result['model'] = encode_model(job['model'])
+
+    return result
@@ -0,0 +1,489 @@
+from datetime import datetime, timedelta, timezone
+from flask import make_response, send_file, url_for
+from gridfs import GridFS, NoFile
+from mongoengine.connection import get_db
+import os
+
+from extensions import image_cache
+from models.cosmetics import Cape, Accessory
+from utils.commons import content_hash, create_file_response, create_response, is_not_modified, set_cache_headers
+from utils.images import image_mimetype
+
+
+ASSET_KINDS = ('texture', 'preview')
+
+
+class GridFSStorage:
+    """
+    Blobs stored in a GridFS bucket of the cosmetics db, the file id being the content hash.
+    Read blobs are kept in the image cache.
+    """
+    name = 'gridfs'
+
+    def __init__(self, collection:str='blobs'):
+        self.collection = collection
+        self._fs = None
+
+    @property
+    def fs(self):
+        if self._fs is None:
+            self._fs = GridFS(get_db('default'), collection=self.collection)
+        return self._fs
+
+    def exists(self, blob_hash:str):
+        return self.fs.exists(blob_hash)
+
+    def read(self, blob_hash:str):
+        cached = image_cache.get(blob_hash, 'blob')
+        if cached:
+            return cached[0]
+
+        try:
+            data = self.fs.get(blob_hash).read()
+        except NoFile:
+            return None
+
+        image_cache.set(blob_hash, 'blob', data, blob_hash)
+        return data
+
+    @property
+    def files(self):
+        return get_db('default')[f'{self.collection}.files']
+
+    def write(self, blob_hash:str, data:bytes):
+        content_type = image_mimetype(data)
+
+        # identical content already stored : refreshed, so the gc grace period protects it again
+        if not self.files.update_one({'_id': blob_hash}, {'$set': {'uploadDate': datetime.now(timezone.utc), 'contentType': content_type}}).matched_count:
+            self.fs.put(data, _id=blob_hash, content_type=content_type)
+
+    def delete(self, blob_hash:str, before:datetime=None):
+        if before and not self.files.count_documents({'_id': blob_hash, 'uploadDate': {'$lt': before}}):
+            return False   # written again since it was listed
+        self.fs.delete(blob_hash)
+        image_cache.invalidate(blob_hash)
+        return True
+
+    def list(self, before:datetime):
+        return [file._id for file in self.fs.find({'uploadDate': {'$lt': before}})]
+
+    def response(self, blob_hash:str, download_name:str=None, immutable:bool=False, mimetype:str=None):
+        return create_file_response(lambda: self.read(blob_hash), blob_hash, download_name, mimetype, immutable)
+
+
+class LocalStorage:
+    """
+    Blobs stored as files of a local directory ({hash[:2]}/{hash}), served with sendfile or by the
+    fronting web server, without being read by the worker.
+    """
+    name = 'local'
+
+    def __init__(self, root:str='assets', accel_redirect:str=None):
+        self.root = root
+        self.accel_redirect = accel_redirect   # internal location of the root directory
+
+    def path(self, blob_hash:str):
+        return os.path.abspath(os.path.join(self.root, blob_hash[:2], blob_hash))
+
+    def exists(self, blob_hash:str):
+        return os.path.isfile(self.path(blob_hash))
+
+    def read(self, blob_hash:str):
+        try:
+            with open(self.path(blob_hash), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, blob_hash:str, data:bytes):
+        path = self.path(blob_hash)
+        try:
+            os.utime(path)   # identical content already stored : refreshed, so the gc grace period protects it again
+            return
+        except FileNotFoundError:
+            pass
+
+        # write then rename, so the file is never served partially written
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.{os.getpid()}.tmp", 'wb') as file:
+            file.write(data)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def delete(self, blob_hash:str, before:datetime=None):
+        try:
+            if before and os.path.getmtime(self.path(blob_hash)) >= before.timestamp():
+                return False   # written again since it was listed
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def list(self, before:datetime):
+        blobs = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith('.tmp') and os.path.getmtime(os.path.join(directory, name)) < before.timestamp():
+                    blobs.append(name)
+        return blobs
+
+    def mimetype(self, blob_hash:str):
+        """
+        Get the mimetype of a blob from its signature (the files have no metadata).
+
+        Parameters:
+            blob_hash (str): The blob content hash.
+
+        Returns:
+            str: The blob mimetype.
+            None: If the blob is not stored.
+        """
+        try:
+            with open(self.path(blob_hash), 'rb') as file:
+                return image_mimetype(file.read(12))
+        except FileNotFoundError:
+            return None
+
+    def response(self, blob_hash:str, download_name:str=None, immutable:bool=False, mimetype:str=None):
+        """
+        Creates the response of a blob without reading it : the file is sent with sendfile
+        (or X-Sendfile if USE_X_SENDFILE is enabled), or by the web server with X-Accel-Redirect.
+
+        Parameters:
+            blob_hash (str): The blob content hash.
+            download_name (str, optional): The file name. Defaults to the hash with the extension of the mimetype.
+            immutable (bool, optional): Whether the response is cached forever. Defaults to False.
+            mimetype (str, optional): The blob mimetype. Defaults to the image type of the blob.
+
+        Returns:
+            Response: A 304 response if the client copy is up to date, a 404 response if the file
+                is missing, else the file response.
+        """
+        if is_not_modified(blob_hash):
+            return set_cache_headers(make_response('', 304), blob_hash, immutable)
+
+        mimetype = mimetype or self.mimetype(blob_hash)
+        if not mimetype or not self.exists(blob_hash):
+            return create_response(404, "File not found")
+        download_name = download_name or f"{blob_hash}.{mimetype.split('/')[1]}"
+
+        if self.accel_redirect:
+            response = make_response('')
+            response.mimetype = mimetype
+            response.headers['X-Accel-Redirect'] = f"{self.accel_redirect.rstrip('/')}/{blob_hash[:2]}/{blob_hash}"
+        else:
+            response = make_response(send_file(self.path(blob_hash), mimetype=mimetype, download_name=download_name, etag=blob_hash, conditional=False))
+
+        return set_cache_headers(response, blob_hash, immutable)
+
+
+class InlineStorage:
+    """
+    Small blobs stored in the inline field of the cosmetic documents, read with the cosmetic
+    in a single query (no GridFS files and chunks queries).
+    """
+    name = 'inline'
+
+    def document(self, blob_hash:str):
+        """
+        Get the content of an inline blob from the cosmetic storing it.
+
+        Parameters:
+            blob_hash (str): The blob content hash.
+
+        Returns:
+            bytes: The blob content.
+            None: If no cosmetic stores this blob inline.
+        """
+        query = {'$or': [{f'hashes.{kind}': blob_hash, f'storage.{kind}': self.name} for kind in ASSET_KINDS]}
+        for document in (Cape, Accessory):
+            cosmetic = document.all_objects(__raw__=query).only('hashes', 'inline').as_pymongo().first()
+            if cosmetic:
+                return next(bytes(cosmetic['inline'][kind]) for kind in ASSET_KINDS if cosmetic['hashes'].get(kind) == blob_hash)
+        return None
+
+    def exists(self, blob_hash:str):
+        return self.document(blob_hash) is not None
+
+    def read(self, blob_hash:str):
+        return self.document(blob_hash)
+
+    def delete(self, blob_hash:str, before:datetime=None):
+        return False   # deleted with the cosmetic
+
+    def list(self, before:datetime):
+        return []
+
+    def response(self, blob_hash:str, download_name:str=None, immutable:bool=False, mimetype:str=None):
+        return create_file_response(lambda: self.read(blob_hash), blob_hash, download_name, mimetype, immutable)
+
+
+class AssetStorage:
+    """
+    Content-addressed storage of the cosmetic assets : each asset is a blob keyed by its sha256
+    (the cosmetic hashes field), so identical assets are stored once and a blob never changes.
+    When enabled, assets under a size limit are stored inline in the cosmetic documents instead.
+
+    The backend of each asset blob is recorded in the cosmetic storage field. Assets without
+    backend are still in the cosmetic image fields (not migrated yet).
+    """
+    def __init__(self):
+        self.backends = {backend.name: backend for backend in (GridFSStorage(), LocalStorage(), InlineStorage())}
+        self.default = self.backends['gridfs']
+        self.inline_max_bytes = 0
+
+    def init_app(self, app):
+        """
+        Configures the backends from the app config.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        self.backends['local'] = LocalStorage(app.config['ASSETS_LOCAL_PATH'], app.config['ASSETS_ACCEL_REDIRECT'])
+        self.default = self.backends[app.config['ASSETS_STORAGE']]
+        self.inline_max_bytes = app.config['ASSETS_INLINE_MAX_BYTES']
+
+    def backend(self, cosmetic, kind:str):
+        """
+        Get the backend storing an asset blob.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The cosmetic document (with its storage and hashes fields).
+            kind (str): The asset kind.
+
+        Returns:
+            GridFSStorage | LocalStorage: The backend.
+            None: If the asset is still in the image field.
+        """
+        name = cosmetic.storage.get(kind)
+        return self.backends[name] if name and kind in cosmetic.hashes else None
+
+    def exists(self, cosmetic, kind:str):
+        return kind in cosmetic.storage or bool(getattr(cosmetic, kind, None))
+
+    def read(self, cosmetic, kind:str):
+        """
+        Reads an asset from its backend, or from its image field.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The cosmetic document (with its storage and hashes fields).
+            kind (str): The asset kind.
+
+        Returns:
+            bytes: The asset content.
+            None: If the cosmetic doesn't have this asset.
+        """
+        backend = self.backend(cosmetic, kind)
+        if backend and backend.name == 'inline':
+            return bytes(cosmetic.inline[kind])
+        if backend:
+            return backend.read(cosmetic.hashes[kind])
+
+        image = getattr(cosmetic, kind, None)
+        return image.read() if image else None
+
+    def find(self, blob_hash:str):
+        """
+        Get the backend storing a blob, trying the configured backend first.
+
+        Parameters:
+            blob_hash (str): The blob content hash.
+
+        Returns:
+            GridFSStorage | LocalStorage: The backend.
+            None: If the blob is not stored.
+        """
+        for backend in dict.fromkeys((self.default, *self.backends.values())):
+            if backend.exists(blob_hash):
+                return backend
+        return None
+
+    def target(self, data:bytes, target:str=None):
+        """
+        Get the backend where an asset must be stored.
+
+        Parameters:
+            data (bytes): The asset content.
+            target (str, optional): The requested backend name. Defaults to the configured storage :
+                inline if the asset is small enough, else the configured backend.
+
+        Returns:
+            GridFSStorage | LocalStorage | InlineStorage: The backend.
+            None: If the asset is too big to be stored inline.
+        """
+        if target == 'inline' or (not target and self.inline_max_bytes):
+            if len(data) <= self.inline_max_bytes:
+                return self.backends['inline']
+            return None if target else self.default
+
+        return self.backends[target] if target else self.default
+
+    def stage(self, cosmetic, kind:str, data:bytes, backend, update:dict=None):
+        """
+        Writes an asset blob in a backend and adds the pointing of the cosmetic to it to a raw
+        update, applied by the caller (alone, or with other documents updates in a bulk write).
+
+        Parameters:
+            cosmetic (Cape | Accessory): The saved cosmetic document (with its storage and hashes fields).
+            kind (str): The asset kind.
+            data (bytes): The asset content.
+            backend (GridFSStorage | LocalStorage | InlineStorage): The backend.
+            update (dict, optional): The raw update to complete. Defaults to a new update.
+
+        Returns:
+            dict: The raw update ($set, $unset) of the cosmetic.
+        """
+        update = update if update is not None else {}
+        current = self.backend(cosmetic, kind)
+        blob_hash = content_hash(data)
+
+        update.setdefault('$set', {}).update({f'storage.{kind}': backend.name, f'hashes.{kind}': blob_hash})
+        if backend.name == 'inline':
+            update['$set'][f'inline.{kind}'] = data
+        else:
+            backend.write(blob_hash, data)
+            if current and current.name == 'inline':
+                update.setdefault('$unset', {})[f'inline.{kind}'] = True
+
+        return update
+
+    def write(self, cosmetic, kind:str, data:bytes, backend):
+        """
+        Writes an asset blob in a backend, then points the cosmetic to it : the previous blob
+        can be served until the cosmetic is updated.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The saved cosmetic document (with its storage, hashes and inline fields).
+            kind (str): The asset kind.
+            data (bytes): The asset content.
+            backend (GridFSStorage | LocalStorage | InlineStorage): The backend.
+        """
+        update = self.stage(cosmetic, kind, data, backend)
+        cosmetic.update(__raw__=update)
+        self.point(cosmetic, kind, data, backend, update['$set'][f'hashes.{kind}'])
+
+    def point(self, cosmetic, kind:str, data:bytes, backend, blob_hash:str):
+        """
+        Points the cosmetic document fields to a written asset blob (not saved).
+
+        Parameters:
+            cosmetic (Cape | Accessory): The cosmetic document (with its storage, hashes and inline fields).
+            kind (str): The asset kind.
+            data (bytes): The asset content.
+            backend (GridFSStorage | LocalStorage | InlineStorage): The backend.
+            blob_hash (str): The blob content hash.
+        """
+        if backend.name == 'inline':
+            cosmetic.inline[kind] = data
+        else:
+            cosmetic.inline.pop(kind, None)
+        cosmetic.storage[kind] = backend.name
+        cosmetic.hashes[kind] = blob_hash
+
+    def put(self, cosmetic, assets:dict):
+        """
+        Stores uploaded assets in the configured storage.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The saved cosmetic document.
+            assets (dict): The content of each uploaded asset kind.
+        """
+        for kind, data in assets.items():
+            self.write(cosmetic, kind, data, self.target(data))
+
+    def prepare(self, cosmetic, assets:dict):
+        """
+        Writes uploaded asset blobs in the configured storage and points the cosmetic to them without
+        saving it : the document is only visible with its assets once saved, in a single write.
+
+        Parameters:
+            cosmetic (Cape | Accessory): The new or updated cosmetic document, not saved yet.
+            assets (dict): The content of each uploaded asset kind.
+        """
+        for kind, data in assets.items():
+            backend = self.target(data)
+            blob_hash = content_hash(data)
+            if backend.name != 'inline':
+                backend.write(blob_hash, data)
+            self.point(cosmetic, kind, data, backend, blob_hash)
+
+    def store(self, cosmetic, kinds, target:str=None):
+        """
+        Moves assets to a backend (assets in the image fields, or blobs of another backend).
+
+        Parameters:
+            cosmetic (Cape | Accessory): The cosmetic document (with its storage, hashes, inline and image fields).
+            kinds (list): The asset kinds.
+            target (str, optional): The backend name. Defaults to the configured storage.
+
+        Returns:
+            list: The moved asset kinds.
+        """
+        stored = []
+        for kind in kinds:
+            if target and cosmetic.storage.get(kind) == target:
+                continue
+
+            data = self.read(cosmetic, kind)
+            if data is None:
+                continue
+
+            backend = self.target(data, target)
+            if not backend or backend is self.backend(cosmetic, kind):
+                continue
+
+            self.write(cosmetic, kind, data, backend)
+
+            image = getattr(cosmetic, kind, None)
+            if image:   # the asset was in the image field
+                image.delete()
+                cosmetic.update(**{f'unset__{kind}': True})
+
+            stored.append(kind)
+
+        return stored
+
+    def url(self, storage:dict, hashes:dict, kind:str, endpoint:str, **values):
+        """
+        Get the url of an asset : the immutable blob url if the asset is a blob, else the cosmetic asset url.
+
+        Parameters:
+            storage (dict): The cosmetic storage field.
+            hashes (dict): The cosmetic hashes field.
+            kind (str): The asset kind.
+            endpoint (str): The cosmetic asset endpoint.
+            **values: The cosmetic asset endpoint values.
+
+        Returns:
+            str: The asset url.
+        """
+        if kind in (storage or {}) and kind in (hashes or {}):
+            return url_for('fetch_blob', blob_hash=hashes[kind])
+        return url_for(endpoint, **values)
+
+    def collect(self, referenced, grace:int=3600, dry_run:bool=False):
+        """
+        Deletes the blobs no longer used by any cosmetic. A blob written again since it was listed
+        (upload deduplicated on it) is refreshed by the write, and kept.
+
+        Parameters:
+            referenced (set): The (backend name, hash) of the used blobs.
+            grace (int, optional): Seconds during which new blobs are kept (uploads in progress). Defaults to 3600.
+            dry_run (bool, optional): Only list the unused blobs. Defaults to False.
+
+        Returns:
+            list: The (backend name, hash) of the deleted blobs.
+        """
+        before = datetime.now(timezone.utc) - timedelta(seconds=grace)
+
+        deleted = []
+        for backend in self.backends.values():
+            for blob_hash in backend.list(before):
+                if (backend.name, blob_hash) not in referenced:
+                    if not dry_run and not backend.delete(blob_hash, before):   # uploads deduplicated on it since the listing are kept
+                        continue
+                    deleted.append((backend.name, blob_hash))
+
+        return deleted
+
+
+asset_storage = AssetStorage()
@@ -0,0 +1,220 @@
+from datetime import datetime, timezone
+from flask import current_app
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from models.users import User
+from models.cosmetics import Cape, Accessory
+from utils import mojang
+
+
+MAX_ACCESSORIES = 5
+
+
+def resolve_cosmetics(users):
+    """
+    Resolves the cosmetics uuids referenced by raw user documents.
+
+    References are read straight from the user documents and resolved with one batched
+    query per cosmetic collection, instead of dereferencing each of them separately.
+
+    Parameters:
+        users (list): The raw user documents (as_pymongo), with the cape and/or accessories fields.
+
+    Returns:
+        list: The active cape and accessories uuids of each user, in the users order.
+    """
+    cape_ids = {user['cape'] for user in users if user.get('cape')}
+    accessory_ids = {accessory_id for user in users for accessory_id in user.get('accessories', [])}
+
+    # resolve cosmetics uuids
+    capes = {cape['_id']: cape['uuid'] for cape in Cape.objects(id__in=cape_ids).only('uuid').as_pymongo()} if cape_ids else {}
+    accessories = {accessory['_id']: accessory['uuid'] for accessory in Accessory.objects(id__in=accessory_ids).only('uuid').as_pymongo()} if accessory_ids else {}
+
+    return [{
+        'cape': capes.get(user.get('cape')),
+        'accessories': [accessories[accessory_id] for accessory_id in user.get('accessories', []) if accessory_id in accessories]
+    } for user in users]
+
+def get_user_cosmetics(user_uuid, *fields):
+    """
+    Get the active cosmetics of a user without dereferencing them.
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+        *fields (str): The cosmetics to get (cape, accessories).
+
+    Returns:
+        dict: The active cape and accessories uuids of the user.
+        None: If the user is not registered.
+    """
+    user = User.objects(minecraft_uuid=user_uuid).only(*fields).as_pymongo().first()
+    if not user:
+        return None
+
+    return resolve_cosmetics([user])[0]
+
+def get_active_cosmetics(user_uuids):
+    """
+    Get the active cape and accessories of many users at once.
+
+    Parameters:
+        user_uuids (list): The minecraft uuids of the users.
+
+    Returns:
+        dict: The active cosmetics of each user, indexed by user uuid.
+              Unregistered users get an empty entry.
+    """
+    response = {str(user_uuid): {'cape': None, 'accessories': []} for user_uuid in user_uuids}
+    if not response:
+        return response
+
+    # get users references (no dereference)
+    users = list(User.objects(minecraft_uuid__in=list(response)).only('minecraft_uuid', 'cape', 'accessories').as_pymongo())
+
+    for user, cosmetics in zip(users, resolve_cosmetics(users)):
+        response[str(user['minecraft_uuid'])] = cosmetics
+
+    return response
+
+def new_user_fields(user_uuid):
+    """
+    Get the fields of a new user document, to insert with its first active cosmetics.
+
+    The mojang account is checked right away, or later by the account verifier if deferred
+    verification is enabled (the user is then inserted with a pending verification).
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+
+    Returns:
+        dict: The raw fields of the new user document.
+        None: If the mojang account doesn't exist.
+    """
+    deferred = current_app.config['MOJANG_DEFERRED_VERIFICATION']
+
+    # check if user uuid exist (mojang account)
+    if not deferred and not mojang.get_profile(user_uuid):
+        return None
+
+    return {'created_at': datetime.now(timezone.utc), 'pending_verification': deferred}
+
+def set_user_cape(user_uuid, cape_id, new_user:dict=None):
+    """
+    Sets the active cape of a user with a single update.
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+        cape_id (ObjectId): The id of the cape.
+        new_user (dict, optional): The fields of the user to insert if not registered (upsert). Defaults to None.
+
+    Returns:
+        bool: True if the user was registered, False if not (inserted if new_user is given).
+    """
+    update = {'$set': {'cape': cape_id}}
+    if new_user:
+        update['$setOnInsert'] = new_user
+
+    try:
+        result = User._get_collection().update_one({'minecraft_uuid': str(user_uuid)}, update, upsert=bool(new_user))
+    except DuplicateKeyError:   # inserted by a concurrent request
+        return set_user_cape(user_uuid, cape_id)
+    return result.matched_count == 1
+
+def unset_user_cape(user_uuid):
+    """
+    Removes the active cape of a user with a single update.
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+
+    Returns:
+        dict: The user document (cape only) before the update.
+        None: If the user is not registered.
+    """
+    return User._get_collection().find_one_and_update(
+        {'minecraft_uuid': str(user_uuid)},
+        {'$unset': {'cape': ''}},
+        projection={'cape': True},
+        return_document=ReturnDocument.BEFORE
+    )
+
+def accessory_append_pipeline(accessory_id):
+    """
+    Creates the update pipeline appending an accessory to the active ones of a user, only if it
+    isn't already active and the user has less than MAX_ACCESSORIES accessories.
+
+    Parameters:
+        accessory_id (ObjectId): The id of the accessory.
+
+    Returns:
+        list: The update pipeline.
+    """
+    accessories = {'$ifNull': ['$accessories', []]}
+    addable = {'$and': [
+        {'$not': [{'$in': [accessory_id, accessories]}]},
+        {'$lt': [{'$size': accessories}, MAX_ACCESSORIES]}
+    ]}
+
+    return [{'$set': {'accessories': {'$cond': [addable, {'$concatArrays': [accessories, [accessory_id]]}, accessories]}}}]
+
+def add_user_accessory(user_uuid, accessory_id, new_user:dict=None):
+    """
+    Adds an accessory to the active ones of a user with a single conditional update.
+
+    The accessory is appended only if it isn't already active and the user has less than
+    MAX_ACCESSORIES accessories, both checked by the update pipeline itself. The document
+    before the update tells which case happened.
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+        accessory_id (ObjectId): The id of the accessory.
+        new_user (dict, optional): The fields of the user to insert if not registered (upsert). Defaults to None.
+
+    Returns:
+        dict: The user document (accessories only) before the update.
+        None: If the user was not registered (inserted if new_user is given).
+    """
+    collection = User._get_collection()
+    query = {'minecraft_uuid': str(user_uuid)}
+
+    if new_user:
+        try:
+            inserted = collection.find_one_and_update(
+                query,
+                {'$setOnInsert': {**new_user, 'accessories': [accessory_id]}},
+                projection={'_id': True},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            ) is None
+        except DuplicateKeyError:   # inserted by a concurrent request
+            inserted = False
+        if inserted:
+            return None
+
+    # registered user (concurrently registered if new_user was given)
+    return collection.find_one_and_update(
+        query,
+        accessory_append_pipeline(accessory_id),
+        projection={'accessories': True},
+        return_document=ReturnDocument.BEFORE
+    )
+
+def remove_user_accessory(user_uuid, accessory_id):
+    """
+    Removes an accessory from the active ones of a user with a single update.
+
+    Parameters:
+        user_uuid (UUID): The minecraft uuid of the user.
+        accessory_id (ObjectId): The id of the accessory.
+
+    Returns:
+        dict: The user document (accessories only) before the update.
+        None: If the user is not registered.
+    """
+    return User._get_collection().find_one_and_update(
+        {'minecraft_uuid': str(user_uuid)},
+        {'$pull': {'accessories': accessory_id}},
+        projection={'accessories': True},
+        return_document=ReturnDocument.BEFORE
+    )
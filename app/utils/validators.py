@@ -1,9 +1,57 @@
+from flask import current_app
 from uuid import UUID
-from PIL import Image
-from io import BytesIO
+from base64 import urlsafe_b64decode
+from binascii import Error as Base64Error
+from bson import ObjectId
 import string
 import json
-from jsonschema import validate, ValidationError
+from jsonschema import Draft202012Validator
+
+from utils.images import png_size, stream_size
+
+
+ACCESSORY_MODEL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string"},
+        "textureSize": {"type": "array", "items": {"type": "integer"}},
+        "models": {"type": "array"},
+    },
+    "required": ["type", "textureSize", "models"],
+}
+Draft202012Validator.check_schema(ACCESSORY_MODEL_SCHEMA)
+# compiled once, instead of checking and compiling the schema on every validation
+accessory_model_schema = Draft202012Validator(ACCESSORY_MODEL_SCHEMA)
+
+
+def check_json_limits(value, max_depth:int, max_elements:int):
+    """
+    Checks the nesting depth and number of values of a decoded JSON document, without recursion.
+
+    Args:
+        value: The decoded JSON document.
+        max_depth (int): The max nesting of objects and arrays.
+        max_elements (int): The max number of values.
+
+    Raises:
+        ValueError: If a limit is exceeded.
+    """
+    elements = 0
+    stack = [(value, 0)]
+    while stack:
+        value, depth = stack.pop()
+        elements += 1
+        if elements > max_elements:
+            raise ValueError(f"Parameter must contain at most {max_elements} values")
+
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, list):
+            continue
+
+        if depth >= max_depth:
+            raise ValueError(f"Parameter must be nested at most {max_depth} levels deep")
+        stack.extend((child, depth + 1) for child in value)
 
 
 class InputValidator():
@@ -96,27 +144,148 @@ class InputValidator():
             raise ValueError("Parameter must be an uuid")
         return uuid
 
-    def cape_texture(self, image):
+    def uuid_list(self, value):
         """
-        Validate the cape texture image.
+        Check if input value is a list of uuids.
+
+        Parameters:
+        - value: The list of string values to be validated.
+
+        Returns:
+        list: The validated uuids.
+
+        Raises:
+        ValueError: If the parameter is not a list or contains an invalid uuid.
+        """
+        if not isinstance(value, list):
+            raise ValueError("Parameter must be a list of uuids")
+
+        return [self.uuid(item) for item in value]
+
+    def username_list(self, value):
+        """
+        Check if input value is a list of minecraft usernames.
+
+        Parameters:
+        - value: The list of usernames to be validated.
+
+        Returns:
+        list: The validated usernames.
+
+        Raises:
+        ValueError: If the parameter is not a list or contains an invalid username.
+        """
+        if not isinstance(value, list):
+            raise ValueError("Parameter must be a list of usernames")
+
+        allowed = string.ascii_letters + string.digits + "_"   # allowed characters
+        for username in value:
+            if not isinstance(username, str) or not 1 <= len(username) <= 16 or any(char not in allowed for char in username):
+                raise ValueError("Invalid username")
+
+        return value
+
+    def asset_list(self, value):
+        """
+        Check if input value is a list of cosmetic assets.
+
+        Parameters:
+        - value: The list of {"uuid", "kind"} objects to be validated.
+
+        Returns:
+        list: The validated (uuid, kind) pairs.
+
+        Raises:
+        ValueError: If the parameter is not a list of assets or contains an invalid one.
+        """
+        if not isinstance(value, list):
+            raise ValueError("Parameter must be a list of assets")
+
+        assets = []
+        for item in value:
+            if not isinstance(item, dict) or item.get('kind') not in ('texture', 'preview'):
+                raise ValueError("Assets must have an uuid and a kind (texture/preview)")
+            assets.append((self.uuid(item.get('uuid')), item['kind']))
+
+        return assets
+
+    def cursor(self, value):
+        """
+        Check if input value is a pagination cursor.
+
+        Parameters:
+        - value: The opaque cursor string.
+
+        Returns:
+        ObjectId: The id of the last document of the previous page.
+
+        Raises:
+        ValueError: If the parameter is not a valid cursor.
+        """
+        try:
+            object_id = urlsafe_b64decode(value + '=' * (-len(value) % 4))
+            return ObjectId(object_id)
+        except (Base64Error, TypeError, ValueError):
+            raise ValueError("Parameter must be a valid cursor")
+
+    def sha256(self, value):
+        """
+        Check if input value is a sha256 hex digest.
+
+        Parameters:
+        - value: The value to be validated.
+
+        Returns:
+        str: The lowercase hex digest.
+
+        Raises:
+        ValueError: If the parameter is not a sha256 hex digest.
+        """
+        if not isinstance(value, str) or len(value) != 64 or not all(c in string.hexdigits for c in value):
+            raise ValueError("Parameter must be a sha256 hex digest")
+
+        return value.lower()
+
+    def png_upload(self, image):
+        """
+        Validate an uploaded PNG from its content type, size and header, without decoding it.
+        The stream is left at its start.
 
         Args:
             image (FileStorage): The image file to be validated.
 
         Raises:
-            ValueError: If the image is not a PNG file or if its dimensions are not 46x22 pixels.
+            ValueError: If the file is not a PNG or is bigger than ASSETS_MAX_UPLOAD_BYTES.
 
         Returns:
-            FileStorage: The validated image file.
+            tuple: The image width and height.
         """
         # check image type
         if not image.content_type or not image.content_type.startswith('image/png'):
             raise ValueError("File must be an image (png)")
 
-        # check image dimensions
-        image_data = BytesIO(image.read())
-        img = Image.open(image_data)
-        width, height = img.size
+        # check file size
+        max_bytes = current_app.config['ASSETS_MAX_UPLOAD_BYTES']
+        if stream_size(image.stream) > max_bytes:
+            raise ValueError(f"File must be at most {max_bytes} bytes")
+
+        image.stream.seek(0)
+        return png_size(image.stream)
+
+    def cape_texture(self, image):
+        """
+        Validate the cape texture image.
+
+        Args:
+            image (FileStorage): The image file to be validated.
+
+        Raises:
+            ValueError: If the image is not a PNG file or if its dimensions are not 46x22 pixels.
+
+        Returns:
+            FileStorage: The validated image file.
+        """
+        width, height = self.png_upload(image)
 
         if width != 46 or height != 22:
             raise ValueError("Dimensions must be 46x22 pixels")
@@ -136,14 +305,7 @@ class InputValidator():
         Returns:
             FileStorage: The validated image file.
         """
-        # check image type
-        if not image.content_type or not image.content_type.startswith('image/png'):
-            raise ValueError("File must be an image (png)")
-        
-        # check image dimensions
-        image_data = BytesIO(image.read())
-        img = Image.open(image_data)
-        width, height = img.size
+        width, height = self.png_upload(image)
 
         if width < 16 or width > 100 or height < 16 or height > 100:
             raise ValueError("Dimensions must be between 16x16 and 100x100 pixels")
@@ -163,14 +325,7 @@ class InputValidator():
         Returns:
             FileStorage: The validated image file.
         """
-        # check image type
-        if not image.content_type or not image.content_type.startswith('image/png'):
-            raise ValueError("File must be an image (png)")
-        
-        # check image dimensions
-        image_data = BytesIO(image.read())
-        img = Image.open(image_data)
-        width, height = img.size
+        width, height = self.png_upload(image)
 
         if width != 150 or height != 150:
             raise ValueError("Dimensions must be 150x150 pixels")
@@ -188,28 +343,23 @@ class InputValidator():
             dict: The validated accessory model.
 
         Raises:
-            ValueError: If the parameter is not a valid JSON or does not respect the accessory model schema.
+            ValueError: If the parameter is not a valid JSON, exceeds the model limits or does not respect the accessory model schema.
         """
+        # check size before parsing
+        max_bytes = current_app.config['ACCESSORY_MODEL_MAX_BYTES']
+        if len(value.encode() if isinstance(value, str) else value) > max_bytes:
+            raise ValueError(f"Parameter must be at most {max_bytes} bytes")
+
         # check if json
         try:
             value = json.loads(value)
-        except json.decoder.JSONDecodeError as e:
+        except (json.decoder.JSONDecodeError, RecursionError) as e:
             raise ValueError("Parameter must be a valid JSON") 
 
-        # check if right schema
-        schema = {
-            "type": "object",
-            "properties": {
-                "type": {"type": "string"},
-                "textureSize": {"type": "array", "items": {"type": "integer"}},
-                "models": {"type": "array"},
-            },
-            "required": ["type", "textureSize", "models"],
-        }
+        check_json_limits(value, current_app.config['ACCESSORY_MODEL_MAX_DEPTH'], current_app.config['ACCESSORY_MODEL_MAX_ELEMENTS'])
 
-        try:
-            validate(instance=value, schema=schema)
-        except ValidationError as e:
+        # check if right schema
+        if not accessory_model_schema.is_valid(value):
             raise ValueError("Parameter must respect the accessory model schema")
         
         return value
@@ -220,6 +370,10 @@ class InputValidator():
     string.__schema__ = {'type': 'string'}
     boolean.__schema__ = {'type': 'boolean'}
     uuid.__schema__ = {'type': 'uuid'}
+    username_list.__schema__ = {'type': 'array', 'items': {'type': 'string'}}
+    asset_list.__schema__ = {'type': 'array', 'items': {'type': 'object', 'properties': {'uuid': {'type': 'uuid'}, 'kind': {'type': 'string'}}}}
+    cursor.__schema__ = {'type': 'string'}
+    uuid_list.__schema__ = {'type': 'array', 'items': {'type': 'uuid'}}
     cape_texture.__schema__ = {'type': 'capetexture'}
     accessory_texture.__schema__ = {'type': 'accessorytexture'}
     accessory_model.__schema__ = {'type': 'accessorymodel'}
\ No newline at end of file
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+from mongoengine import Q
+from threading import Lock
+from uuid import uuid4
+
+from models.users import User
+from utils import mojang
+from utils.background import PeriodicTask
+
+
+class AccountVerifier:
+    """
+    Verifies in background the mojang accounts of users created with a pending verification,
+    removing the users whose account doesn't exist.
+
+    Each batch of pending users is claimed for a limited time, so the verifiers of several
+    workers don't check the same accounts.
+    """
+    def __init__(self):
+        self.batch_size = 50
+        self.claim_timeout = 60
+        self.task = None
+
+        self._lock = Lock()
+        self.verified = 0
+        self.rejected = 0
+        self.errors = 0
+        self.last_latency = None   # seconds between user creation and verification
+        self.max_latency = None
+        self._total_latency = 0
+
+    def init_app(self, app):
+        """
+        Configures the verifier from the app config and starts it if deferred verification is enabled.
+
+        Parameters:
+            app (Flask): The Flask application.
+        """
+        self.batch_size = app.config['VERIFICATION_BATCH_SIZE']
+        self.claim_timeout = app.config['VERIFICATION_CLAIM_TIMEOUT']
+
+        if app.config['MOJANG_DEFERRED_VERIFICATION']:
+            self.task = PeriodicTask('account-verifier', self.verify_batch, app.config['VERIFICATION_INTERVAL'])
+            self.task.start(app)
+
+    def claim_batch(self):
+        """
+        Claims the oldest pending users not claimed by another verifier.
+
+        Returns:
+            QuerySet: The claimed users.
+        """
+        now = datetime.now(timezone.utc)
+        unclaimed = Q(pending_verification=True) & (Q(verification_claimed_until=None) | Q(verification_claimed_until__lt=now))
+
+        ids = User.objects(unclaimed).order_by('created_at').limit(self.batch_size).scalar('id')
+        claim = uuid4().hex
+        User.objects(Q(id__in=list(ids)) & unclaimed).update(set__verification_claim=claim, set__verification_claimed_until=now + timedelta(seconds=self.claim_timeout))
+
+        return User.objects(verification_claim=claim, pending_verification=True).only('minecraft_uuid', 'created_at')
+
+    def verify_batch(self):
+        """
+        Verifies a batch of pending users. Users whose lookup fails stay pending and are retried later.
+
+        Returns:
+            int: The number of verified and rejected users.
+        """
+        processed = 0
+        for user in self.claim_batch():
+            try:
+                profile = mojang.get_profile(user.minecraft_uuid)
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                continue
+
+            pending = User.objects(id=user.id, pending_verification=True)
+            if profile:
+                pending.update_one(set__pending_verification=False, unset__verification_claim=True, unset__verification_claimed_until=True)
+            else:
+                pending.delete()
+
+            latency = (datetime.now(timezone.utc) - user.created_at.replace(tzinfo=timezone.utc)).total_seconds()
+            with self._lock:
+                if profile:
+                    self.verified += 1
+                else:
+                    self.rejected += 1
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency or 0, latency)
+                self._total_latency += latency
+            processed += 1
+
+        return processed
+
+    def stats(self):
+        """
+        Get the verification statistics (counters and latencies of the current worker, shared queue depth).
+
+        Returns:
+            dict: The verification statistics.
+        """
+        queue_depth = User.objects(pending_verification=True).count()
+
+        with self._lock:
+            done = self.verified + self.rejected
+            return {
+                'enabled': self.task is not None,
+                'queue_depth': queue_depth,
+                'verified': self.verified,
+                'rejected': self.rejected,
+                'errors': self.errors,
+                'last_latency': self.last_latency,
+                'average_latency': self._total_latency / done if done else None,
+                'max_latency': self.max_latency
+            }
+
+
+verifier = AccountVerifier()